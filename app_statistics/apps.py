@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class StaticsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app_statistics'
+
+    def ready(self):
+        # Registra las señales que mantienen AppointmentDailyRollup
+        from . import signals  # noqa: F401
+        # Registra el chequeo de caché compartida para STATISTICS_CACHE_ENABLED
+        from . import checks  # noqa: F401
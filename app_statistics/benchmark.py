@@ -0,0 +1,186 @@
+"""
+Benchmark de StatisticsService con carga sintética.
+
+generar_citas siembra citas de forma determinista (misma semilla, mismos datos) con
+distribuciones parecidas a las reales: pocos terapeutas concentran la mayoría de
+las citas, Efectivo es el tipo de pago dominante y una parte de las citas no tiene
+pago o está eliminada. ejecutar mide cada método get_* y get_statistics completo:
+latencias p50/p95 en milisegundos y número de consultas.
+"""
+import math
+import platform
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import islice
+
+import django
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from base_models.models import Appointment, Patient, PaymentType, Therapist
+from .services import StatisticsService
+
+# Tipos de pago y su peso relativo
+TIPOS_PAGO = {"Efectivo": 55, "Yape": 20, "Tarjeta": 12, "Transferencia": 8, "Cupón": 5}
+
+# Proporciones de la carga sintética
+CITAS_POR_TERAPEUTA = 2000
+CITAS_POR_PACIENTE = 20
+PROPORCION_SIN_PAGO = 0.10
+PROPORCION_ELIMINADAS = 0.03
+PROPORCION_CC = 0.30
+
+BATCH_SIZE = 5000
+
+
+def generar_citas(total, semilla=42, inicio=date(2024, 1, 1), dias=365):
+    """
+    Crea total citas sintéticas entre inicio e inicio + dias.
+    Retorna un dict con la cantidad de terapeutas, pacientes y citas creadas.
+    """
+    rnd = random.Random(semilla)
+
+    n_terapeutas = max(5, total // CITAS_POR_TERAPEUTA)
+    n_pacientes = max(10, total // CITAS_POR_PACIENTE)
+
+    terapeutas = Therapist.objects.bulk_create(
+        Therapist(name=f"Terapeuta {i}", paternal_lastname="Bench", maternal_lastname=str(i))
+        for i in range(n_terapeutas)
+    )
+    pacientes = Patient.objects.bulk_create(
+        (Patient(name=f"Paciente {i}") for i in range(n_pacientes)), batch_size=BATCH_SIZE
+    )
+    tipos_pago = PaymentType.objects.bulk_create(PaymentType(name=nombre) for nombre in TIPOS_PAGO)
+
+    # Carga por terapeuta tipo Zipf: el terapeuta i recibe un peso 1 / (i + 1)
+    pesos_terapeutas = [1 / (i + 1) for i in range(n_terapeutas)]
+    pesos_pago = list(TIPOS_PAGO.values())
+    eliminada = timezone.now()
+
+    def citas():
+        for _ in range(total):
+            sin_pago = rnd.random() < PROPORCION_SIN_PAGO
+            yield Appointment(
+                appointment_date=inicio + timedelta(days=rnd.randrange(dias)),
+                appointment_hour=f"{rnd.randrange(8, 20):02d}:{rnd.choice((0, 30)):02d}",
+                therapist=rnd.choices(terapeutas, pesos_terapeutas)[0],
+                patient=rnd.choice(pacientes),
+                payment_type=rnd.choices(tipos_pago, pesos_pago)[0],
+                payment=None if sin_pago else Decimal(rnd.randrange(20, 151)),
+                appointment_type="CC" if rnd.random() < PROPORCION_CC else "C",
+                room=rnd.randrange(1, 6),
+                deleted_at=eliminada if rnd.random() < PROPORCION_ELIMINADAS else None,
+            )
+
+    # bulk_create convierte su argumento en lista: se le pasa un lote a la vez para
+    # no construir todas las citas en memoria antes del primer INSERT
+    pendientes = citas()
+    while lote := list(islice(pendientes, BATCH_SIZE)):
+        Appointment.objects.bulk_create(lote)
+    return {"terapeutas": n_terapeutas, "pacientes": n_pacientes, "citas": total}
+
+
+def percentil(valores, p):
+    """Percentil p (0-100) por rango más cercano."""
+    ordenados = sorted(valores)
+    rango = max(1, math.ceil(p / 100 * len(ordenados)))
+    return ordenados[rango - 1]
+
+
+def medir(funcion, repeticiones):
+    """Ejecuta funcion repeticiones veces; retorna latencias en ms y consultas por llamada."""
+    latencias = []
+    with CaptureQueriesContext(connection) as consultas:
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            resultado = funcion()
+            if hasattr(resultado, "__next__"):
+                # Los generadores se consumen para medir el trabajo real
+                for _ in resultado:
+                    pass
+            latencias.append((time.perf_counter() - inicio) * 1000)
+
+    return {
+        "p50_ms": round(percentil(latencias, 50), 3),
+        "p95_ms": round(percentil(latencias, 95), 3),
+        "min_ms": round(min(latencias), 3),
+        "max_ms": round(max(latencias), 3),
+        "consultas": len(consultas) // repeticiones,
+    }
+
+
+def planes_consultas(funcion):
+    """
+    Ejecuta funcion y retorna [(sql, pasos)] con el plan de cada consulta según
+    EXPLAIN QUERY PLAN (solo SQLite). Cada paso es una línea del plan, ej.
+    "SEARCH base_models_appointment USING INDEX appt_fecha_terapeuta_idx (...)".
+    """
+    with CaptureQueriesContext(connection) as consultas:
+        resultado = funcion()
+        if hasattr(resultado, "__next__"):
+            for _ in resultado:
+                pass
+
+    planes = []
+    with connection.cursor() as cursor:
+        for consulta in consultas.captured_queries:
+            cursor.execute(f"EXPLAIN QUERY PLAN {consulta['sql']}")
+            planes.append((consulta["sql"], [fila[-1] for fila in cursor.fetchall()]))
+    return planes
+
+
+def recorridos_completos(pasos, tabla=Appointment._meta.db_table):
+    """Pasos de un plan que recorren toda la tabla (SCAN, con o sin índice) en lugar de buscar por índice."""
+    return [paso for paso in pasos if paso.startswith(f"SCAN {tabla}")]
+
+
+def casos(start, end):
+    """Métodos medidos: nombre -> función sin argumentos."""
+    service = StatisticsService()
+    return {
+        "get_metricas_principales": lambda: service.get_metricas_principales(start, end),
+        "get_tipos_de_pago": lambda: service.get_tipos_de_pago(start, end),
+        "get_rendimiento_terapeutas": lambda: service.get_rendimiento_terapeutas(start, end),
+        "get_ingresos_por_dia_semana": lambda: service.get_ingresos_por_dia_semana(start, end),
+        "get_sesiones_por_dia_semana": lambda: service.get_sesiones_por_dia_semana(start, end),
+        "get_tipos_pacientes": lambda: service.get_tipos_pacientes(start, end),
+        "get_statistics": lambda: service.get_statistics(start, end),
+    }
+
+
+def ejecutar(start, end, repeticiones=5, carga=None):
+    """Mide todos los casos en el rango start-end y retorna el resultado serializable a JSON."""
+    return {
+        "entorno": {
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "motor": connection.vendor,
+        },
+        "carga": carga or {},
+        "rango": {"start": start.isoformat(), "end": end.isoformat()},
+        "repeticiones": repeticiones,
+        "metodos": {nombre: medir(funcion, repeticiones) for nombre, funcion in casos(start, end).items()},
+    }
+
+
+def comparar_con_base(resultado, base, tolerancia=0.2):
+    """
+    Regresiones respecto a un resultado anterior: p50 mayor a base * (1 + tolerancia)
+    o más consultas por llamada. Retorna una lista de mensajes (vacía si no hay).
+    """
+    regresiones = []
+    for nombre, actual in resultado["metodos"].items():
+        anterior = base.get("metodos", {}).get(nombre)
+        if not anterior:
+            continue
+        if actual["p50_ms"] > anterior["p50_ms"] * (1 + tolerancia):
+            regresiones.append(
+                f"{nombre}: p50 {actual['p50_ms']} ms (base {anterior['p50_ms']} ms)"
+            )
+        if actual["consultas"] > anterior["consultas"]:
+            regresiones.append(
+                f"{nombre}: {actual['consultas']} consultas (base {anterior['consultas']})"
+            )
+    return regresiones
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core import checks
+
+# Backends de caché que no se comparten entre procesos
+CACHES_LOCALES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+@checks.register(checks.Tags.caches)
+def cache_compartida(app_configs, **kwargs):
+    """STATISTICS_CACHE_ENABLED necesita una caché compartida entre los procesos web."""
+    if not getattr(settings, "STATISTICS_CACHE_ENABLED", False):
+        return []
+    backend = settings.CACHES.get("default", {}).get("BACKEND")
+    if backend in CACHES_LOCALES:
+        return [checks.Warning(
+            "STATISTICS_CACHE_ENABLED está activo con una caché local (%s)." % backend,
+            hint="Configure CACHES con Redis, Memcached o base de datos: con una caché por "
+                 "proceso, invalidar un día en un proceso no afecta a los demás.",
+            id="app_statistics.W001",
+        )]
+    return []
@@ -0,0 +1,72 @@
+"""
+HyperLogLog para estimar pacientes distintos sin guardar sus ids.
+
+Un sketch son 2**p registros de un byte. Los sketches de varios días se combinan
+tomando el máximo de cada registro, por lo que el estimado de un rango se obtiene
+uniendo los sketches diarios.
+"""
+import hashlib
+import math
+
+PRECISION = 12  # 4096 registros, error estándar ~1.6 %
+
+
+def _hash64(valor):
+    return int.from_bytes(hashlib.blake2b(str(valor).encode(), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    def __init__(self, precision=PRECISION, registros=None):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registros = bytearray(registros) if registros is not None else bytearray(self.m)
+        if len(self.registros) != self.m:
+            raise ValueError("El tamaño de los registros no coincide con la precisión.")
+
+    @classmethod
+    def desde_bytes(cls, datos, precision=PRECISION):
+        return cls(precision, registros=datos)
+
+    def a_bytes(self):
+        return bytes(self.registros)
+
+    def agregar(self, valor):
+        x = _hash64(valor)
+        indice = x >> (64 - self.precision)
+        resto = (x << self.precision) & ((1 << 64) - 1)
+        # Posición del primer bit en 1 del resto (1 = primer bit)
+        rho = min(64 - resto.bit_length() + 1, 64 - self.precision + 1)
+        if rho > self.registros[indice]:
+            self.registros[indice] = rho
+
+    def unir(self, otro):
+        """Combina otro sketch en este (máximo registro a registro)."""
+        if otro.precision != self.precision:
+            raise ValueError("Solo se pueden unir sketches con la misma precisión.")
+        self.registros = bytearray(map(max, self.registros, otro.registros))
+        return self
+
+    @property
+    def error_estandar(self):
+        return 1.04 / math.sqrt(self.m)
+
+    def estimar(self):
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimado = alpha * m * m / sum(2.0 ** -r for r in self.registros)
+        vacios = self.registros.count(0)
+        if estimado <= 2.5 * m and vacios:
+            # Corrección para cardinalidades pequeñas (linear counting)
+            estimado = m * math.log(m / vacios)
+        return estimado
+
+    def resumen(self):
+        """Estimado con su error estándar relativo y un intervalo de ~95 % (2 sigmas)."""
+        estimado = self.estimar()
+        margen = 2 * self.error_estandar * estimado
+        return {
+            "estimado": int(round(estimado)),
+            "error_estandar": round(self.error_estandar, 4),
+            "limite_inferior": max(0, int(math.floor(estimado - margen))),
+            "limite_superior": int(math.ceil(estimado + margen)),
+        }
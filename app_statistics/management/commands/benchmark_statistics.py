@@ -0,0 +1,76 @@
+import json
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from app_statistics import benchmark, range_index
+from app_statistics.services import RollupService
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide StatisticsService con citas sintéticas y compara contra una línea base. "
+        "Los datos generados se descartan al terminar salvo que se indique --keep."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100_000, help="Citas sintéticas a generar (por defecto 100000)")
+        parser.add_argument("--seed", type=int, default=42, help="Semilla del generador")
+        parser.add_argument("--start", default="2024-01-01", help="Primer día de la carga YYYY-MM-DD")
+        parser.add_argument("--days", type=int, default=365, help="Días que abarca la carga")
+        parser.add_argument("--repeat", type=int, default=5, help="Repeticiones por método")
+        parser.add_argument("--output", help="Archivo JSON donde guardar el resultado")
+        parser.add_argument("--baseline", help="Archivo JSON de un resultado anterior para comparar")
+        parser.add_argument("--tolerance", type=float, default=0.2, help="Margen permitido sobre el p50 de la base (0.2 = 20 %%)")
+        parser.add_argument("--keep", action="store_true", help="Conservar las citas generadas")
+
+    def handle(self, *args, **options):
+        try:
+            start = datetime.strptime(options["start"], "%Y-%m-%d").date()
+        except ValueError:
+            raise CommandError("Formato de fecha inválido. Use YYYY-MM-DD.")
+        if options["rows"] < 1 or options["days"] < 1 or options["repeat"] < 1:
+            raise CommandError("--rows, --days y --repeat deben ser mayores a 0.")
+
+        base = None
+        if options["baseline"]:
+            try:
+                with open(options["baseline"], encoding="utf-8") as archivo:
+                    base = json.load(archivo)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"No se pudo leer la línea base: {e}")
+
+        end = start + timedelta(days=options["days"] - 1)
+
+        with transaction.atomic():
+            self.stdout.write(f"Generando {options['rows']} citas...")
+            carga = benchmark.generar_citas(options["rows"], options["seed"], start, options["days"])
+            carga["semilla"] = options["seed"]
+
+            # bulk_create no dispara señales: se reconstruyen las estructuras derivadas
+            if getattr(settings, "APPOINTMENT_ROLLUP_ENABLED", False):
+                RollupService.rebuild_range(start, end)
+            range_index.descartar_indice()
+
+            resultado = benchmark.ejecutar(start, end, options["repeat"], carga)
+
+            if not options["keep"]:
+                transaction.set_rollback(True)
+        range_index.descartar_indice()
+
+        for nombre, medicion in resultado["metodos"].items():
+            self.stdout.write(
+                f"{nombre:<30} p50 {medicion['p50_ms']:>10.3f} ms  "
+                f"p95 {medicion['p95_ms']:>10.3f} ms  consultas {medicion['consultas']}"
+            )
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as archivo:
+                json.dump(resultado, archivo, indent=2)
+            self.stdout.write(f"Resultado guardado en {options['output']}")
+
+        if base is not None:
+            regresiones = benchmark.comparar_con_base(resultado, base, options["tolerance"])
+            if regresiones:
+                raise CommandError("Regresiones respecto a la línea base:\n" + "\n".join(regresiones))
+            self.stdout.write(self.style.SUCCESS("Sin regresiones respecto a la línea base."))
@@ -0,0 +1,24 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from app_statistics.services import RollupService
+
+
+class Command(BaseCommand):
+    help = "Reconstruye la tabla de resumen diario de citas (AppointmentDailyRollup)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", help="Fecha inicial YYYY-MM-DD (por defecto todo el histórico)")
+        parser.add_argument("--end", help="Fecha final YYYY-MM-DD (por defecto todo el histórico)")
+
+    def handle(self, *args, **options):
+        try:
+            start = datetime.strptime(options["start"], "%Y-%m-%d").date() if options["start"] else None
+            end = datetime.strptime(options["end"], "%Y-%m-%d").date() if options["end"] else None
+        except ValueError:
+            raise CommandError("Formato de fecha inválido. Use YYYY-MM-DD.")
+
+        if start and end and start > end:
+            raise CommandError("La fecha de inicio no puede ser mayor que la fecha de fin.")
+
+        total = RollupService.rebuild_range(start, end)
+        self.stdout.write(self.style.SUCCESS(f"Resumen diario reconstruido: {total} filas."))
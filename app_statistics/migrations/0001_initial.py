@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-17 19:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('base_models', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('appointment_type', models.CharField(blank=True, max_length=255, null=True)),
+                ('sesiones', models.IntegerField(default=0)),
+                ('ingresos', models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True)),
+                ('pacientes', models.JSONField(default=list)),
+                ('payment_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='rollups', to='base_models.paymenttype')),
+                ('therapist', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='rollups', to='base_models.therapist')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='rollup_day_idx')],
+            },
+        ),
+    ]
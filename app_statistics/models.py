@@ -1,3 +1,33 @@
 from django.db import models
+from base_models.models import Therapist, PaymentType
 
-# Create your models here.
+
+# Resumen diario de citas: una fila por (día, terapeuta, tipo de pago, tipo de cita).
+# Se mantiene actualizado con las señales de Appointment (ver signals.py)
+class AppointmentDailyRollup(models.Model):
+    day = models.DateField()
+    therapist = models.ForeignKey(Therapist, on_delete=models.SET_NULL, null=True, blank=True, related_name='rollups')
+    payment_type = models.ForeignKey(PaymentType, on_delete=models.SET_NULL, null=True, blank=True, related_name='rollups')
+    appointment_type = models.CharField(max_length=255, null=True, blank=True)
+
+    sesiones = models.IntegerField(default=0)  # Citas activas del grupo
+    ingresos = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)  # Nulo si ninguna cita tiene pago
+    pacientes = models.JSONField(default=list)  # Ids de pacientes distintos del grupo
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['day'], name='rollup_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"Rollup {self.day} - terapeuta {self.therapist_id} - {self.sesiones} sesiones"
+
+
+# Sketch HyperLogLog diario de los pacientes atendidos (ver hll.py).
+# Se reconstruye junto con AppointmentDailyRollup
+class DailyPatientSketch(models.Model):
+    day = models.DateField(unique=True)
+    registros = models.BinaryField()
+
+    def __str__(self):
+        return f"Sketch de pacientes {self.day}"
@@ -0,0 +1,261 @@
+"""
+Índice en memoria de sumas por rango de días (Fenwick / binary indexed tree).
+
+Por cada métrica (sesiones, citas con pago e ingresos en céntimos) se mantiene un
+árbol global y uno por terapeuta, indexados por el ordinal de appointment_date.
+Cualquier suma entre dos fechas cuesta O(log n) sin recorrer citas.
+
+El índice se construye por proceso la primera vez que se usa y se actualiza en
+las señales de Appointment cuando la transacción se confirma. La construcción lee
+las citas en orden de id; de los cambios que llegan mientras tanto, los de citas
+que aún no se leyeron se aplican con su último estado (y la cita se salta al
+leerla) y los de citas ya leídas se aplican como diferencias al terminar. Así un
+cambio no se cuenta dos veces aunque la lectura ya lo incluya.
+
+Las señales solo llegan al proceso que hizo la escritura. Por eso, cada
+STATISTICS_RANGE_INDEX_MAX_AGE segundos el índice compara un validador barato
+de la tabla de citas (cantidad, máximo id y máximos de updated_at/deleted_at)
+con el de su construcción y se reconstruye si cambió.
+"""
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Count, Max
+from base_models.models import Appointment
+
+# Potencia de 2 que cubre todos los ordinales posibles (date.max.toordinal() < 2**22)
+TAMANIO = 1 << 22
+
+
+class FenwickTree:
+    """Binary indexed tree disperso: solo guarda los nodos con valor."""
+
+    def __init__(self, tamanio=TAMANIO):
+        self.tamanio = tamanio
+        self.nodos = {}
+
+    def agregar(self, posicion, delta):
+        i = posicion
+        while i < self.tamanio:
+            self.nodos[i] = self.nodos.get(i, 0) + delta
+            i += i & -i
+
+    def prefijo(self, posicion):
+        """Suma de las posiciones 1..posicion."""
+        total = 0
+        i = min(posicion, self.tamanio - 1)
+        while i > 0:
+            total += self.nodos.get(i, 0)
+            i -= i & -i
+        return total
+
+    def rango(self, inicio, fin):
+        """Suma de las posiciones inicio..fin (inclusive)."""
+        if fin < inicio:
+            return 0
+        return self.prefijo(fin) - self.prefijo(inicio - 1)
+
+
+def validador_citas():
+    """Resumen de toda la tabla de citas; cambia con cualquier alta, edición o eliminación."""
+    datos = Appointment.objects.with_deleted().aggregate(
+        citas=Count("id"),
+        max_id=Max("id"),
+        max_updated_at=Max("updated_at"),
+        max_deleted_at=Max("deleted_at"),
+    )
+    return tuple(datos[k] for k in ("citas", "max_id", "max_updated_at", "max_deleted_at"))
+
+
+class AppointmentRangeIndex:
+    METRICAS = ("sesiones", "pagos", "centavos")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._construccion_lock = threading.Lock()
+        self.construido = False
+        # Estado de una construcción en curso (ver construir)
+        self._construyendo = False
+        self._leido_hasta = 0
+        self._por_saltar = {}
+        self._pendientes = []
+        self.validador = None
+        self.verificado_en = 0
+        self._limpiar()
+
+    def _limpiar(self):
+        self.totales = {m: FenwickTree() for m in self.METRICAS}
+        self.por_terapeuta = {}
+
+    def _arboles_terapeuta(self, therapist_id):
+        if therapist_id not in self.por_terapeuta:
+            self.por_terapeuta[therapist_id] = {m: FenwickTree() for m in self.METRICAS}
+        return self.por_terapeuta[therapist_id]
+
+    def _aplicar(self, dia, therapist_id, payment, signo):
+        posicion = dia.toordinal()
+        deltas = {
+            "sesiones": signo,
+            "pagos": signo if payment is not None else 0,
+            "centavos": signo * int(payment * 100) if payment is not None else 0,
+        }
+        arboles_terapeuta = self._arboles_terapeuta(therapist_id)
+        for metrica, delta in deltas.items():
+            if delta:
+                self.totales[metrica].agregar(posicion, delta)
+                arboles_terapeuta[metrica].agregar(posicion, delta)
+
+    def _cambio(self, anterior, nueva):
+        if anterior and anterior[0]:
+            self._aplicar(*anterior, -1)
+        if nueva and nueva[0]:
+            self._aplicar(*nueva, 1)
+
+    def _iniciar_construccion(self, construyendo):
+        self._construyendo = construyendo
+        self._leido_hasta = 0
+        # id -> último estado de las citas cambiadas antes de que la carga las leyera
+        self._por_saltar = {}
+        # (anterior, nueva) de las citas cambiadas después de que la carga las leyó
+        self._pendientes = []
+
+    def construir(self):
+        """
+        Carga el índice completo desde las citas activas. Se arma en árboles nuevos
+        (las consultas siguen usando los anteriores) y al final se reemplazan y se
+        aplican los cambios que llegaron durante la carga.
+        """
+        with self._construccion_lock:
+            with self._lock:
+                self._iniciar_construccion(True)
+            try:
+                validador = validador_citas()
+                nuevo = AppointmentRangeIndex()
+                citas = (
+                    Appointment.objects
+                    .filter(appointment_date__isnull=False)
+                    .order_by("id")
+                    .values_list("id", "appointment_date", "therapist_id", "payment")
+                )
+                for pk, dia, therapist_id, payment in citas.iterator(chunk_size=5000):
+                    with self._lock:
+                        self._leido_hasta = pk
+                        saltar = pk in self._por_saltar
+                    if not saltar:
+                        nuevo._aplicar(dia, therapist_id, payment, 1)
+            except Exception:
+                with self._lock:
+                    self._iniciar_construccion(False)
+                raise
+
+            with self._lock:
+                self.totales, self.por_terapeuta = nuevo.totales, nuevo.por_terapeuta
+                for nueva in self._por_saltar.values():
+                    self._cambio(None, nueva)
+                for anterior, nueva in self._pendientes:
+                    self._cambio(anterior, nueva)
+                self._iniciar_construccion(False)
+                self.validador = validador
+                self.verificado_en = time.monotonic()
+                self.construido = True
+
+    def actualizar(self, pk, anterior, nueva):
+        """
+        Aplica un cambio de la cita pk. anterior y nueva son tuplas
+        (appointment_date, therapist_id, payment) de la cita activa, o None.
+        """
+        with self._lock:
+            if self._construyendo:
+                if pk in self._por_saltar or pk > self._leido_hasta:
+                    self._por_saltar[pk] = nueva
+                else:
+                    self._pendientes.append((anterior, nueva))
+            if self.construido:
+                self._cambio(anterior, nueva)
+
+    def vencido(self):
+        max_age = getattr(settings, "STATISTICS_RANGE_INDEX_MAX_AGE", 60)
+        return time.monotonic() - self.verificado_en >= max_age
+
+    def verificar(self):
+        """
+        Reconstruye el índice si la tabla de citas cambió desde la última construcción
+        (ej. escrituras de otro proceso). Si otro hilo ya está construyendo, no espera.
+        """
+        if self._construccion_lock.locked():
+            return False
+        if validador_citas() == self.validador:
+            self.verificado_en = time.monotonic()
+            return False
+        self.construir()
+        return True
+
+    # Consultas
+
+    @staticmethod
+    def _a_decimal(centavos):
+        return Decimal(centavos) / 100
+
+    def sumas(self, start, end, therapist_id=None, por_terapeuta=False):
+        arboles = self.por_terapeuta.get(therapist_id, {}) if por_terapeuta else self.totales
+        if not arboles:
+            return {"sesiones": 0, "pagos": 0, "ingresos": None}
+        inicio, fin = start.toordinal(), end.toordinal()
+        pagos = arboles["pagos"].rango(inicio, fin)
+        return {
+            "sesiones": arboles["sesiones"].rango(inicio, fin),
+            "pagos": pagos,
+            "ingresos": self._a_decimal(arboles["centavos"].rango(inicio, fin)) if pagos else None,
+        }
+
+    def terapeutas(self, start, end):
+        """Sesiones e ingresos por terapeuta (solo los que tienen citas en el rango)."""
+        # Copia bajo el lock: actualizar() puede agregar terapeutas mientras se recorre
+        with self._lock:
+            terapeutas = list(self.por_terapeuta)
+        resultado = []
+        for therapist_id in sorted(terapeutas, key=lambda t: (t is not None, t or 0)):
+            sumas = self.sumas(start, end, therapist_id, por_terapeuta=True)
+            if sumas["sesiones"]:
+                resultado.append(dict(sumas, therapist_id=therapist_id))
+        return resultado
+
+
+_indice = None
+_indice_lock = threading.Lock()
+
+
+def indice_habilitado():
+    return getattr(settings, "STATISTICS_RANGE_INDEX_ENABLED", False)
+
+
+def get_range_index():
+    """Índice compartido por el proceso; se construye en el primer uso."""
+    global _indice
+    with _indice_lock:
+        if _indice is None:
+            _indice = AppointmentRangeIndex()
+    indice = _indice
+    if not indice.construido:
+        with indice._construccion_lock:
+            construido = indice.construido
+        if not construido:
+            indice.construir()
+    elif indice.vencido():
+        indice.verificar()
+    return indice
+
+
+def notificar_cambio(pk, anterior, nueva):
+    """Llamado desde las señales de Appointment tras confirmar la transacción."""
+    if _indice is not None:
+        _indice.actualizar(pk, anterior, nueva)
+
+
+def descartar_indice():
+    """Libera el índice del proceso; se reconstruye en el siguiente uso."""
+    global _indice
+    with _indice_lock:
+        _indice = None
@@ -7,10 +7,19 @@ class TerapeutaSerializer(serializers.Serializer):
     ingresos = serializers.FloatField()
     raiting = serializers.FloatField()  # 
 
+class PacientesAproximadosSerializer(serializers.Serializer):
+    estimado = serializers.IntegerField()
+    error_estandar = serializers.FloatField()  # Error relativo (1 sigma)
+    limite_inferior = serializers.IntegerField()  # Intervalo de ~95 %
+    limite_superior = serializers.IntegerField()
+    exacto = serializers.BooleanField()  # True si faltan sketches y se contó sin estimar
+    dias_sin_sketch = serializers.IntegerField(allow_null=True)  # None: sketches sin mantener
+
 class MetricasSerializer(serializers.Serializer):
     ttlpacientes = serializers.IntegerField()
     ttlsesiones = serializers.IntegerField()
     ttlganancias = serializers.FloatField(allow_null=True)
+    ttlpacientes_aprox = PacientesAproximadosSerializer(required=False)  # Solo con approx=true
 
 class TiposPacientesSerializer(serializers.Serializer):
     c = serializers.IntegerField()
@@ -1,24 +1,222 @@
+import asyncio
+import hashlib
+import logging
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from functools import partial
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
 from django.db.models import Count, Sum, Avg, Q, Case, When, F, Value
-from django.db.models.functions import ExtractWeekDay, Concat
-from base_models.models import Appointment
+from django.db.models.functions import ExtractWeekDay, Concat, TruncWeek, TruncMonth
+from django.utils.timezone import localdate
+from base_models.models import Appointment, Therapist
+from .models import AppointmentDailyRollup, DailyPatientSketch
+from .hll import HyperLogLog
+from . import range_index
+
+logger = logging.getLogger(__name__)
+
+# Granularidades de la serie temporal: nombre -> expresión del periodo
+GRANULARIDADES = {
+    "day": lambda: F("appointment_date"),
+    "week": lambda: TruncWeek("appointment_date"),
+    "month": lambda: TruncMonth("appointment_date"),
+}
+
+# Series opcionales de la serie temporal: nombre -> campo de agrupación
+SERIES = {
+    "therapist": "therapist_id",
+    "payment_type": "payment_type__name",
+}
+
+# Numeración de ExtractWeekDay: 1 = Domingo ... 7 = Sábado
+DIAS_SEMANA = {
+    1: "Domingo", 2: "Lunes", 3: "Martes", 4: "Miercoles",
+    5: "Jueves", 6: "Viernes", 7: "Sabado"
+}
+
+
+def dia_semana_de(fecha):
+    """Convierte una fecha al número de día que devuelve ExtractWeekDay."""
+    return fecha.isoweekday() % 7 + 1
+
+
+def calcular_raiting(stats):
+    """
+    Calcula el raiting (0 a 5) de cada terapeuta a partir de sus sesiones e ingresos.
+    Cada elemento de stats debe tener: therapist__id, terapeuta, sesiones, ingresos.
+    """
+    if not stats:
+        return []
+
+    # 1. Calculamos promedios globales
+    total_sesiones = sum(s['sesiones'] for s in stats)
+    total_ingresos = sum(float(s['ingresos'] or 0) for s in stats)
+    num_terapeutas = len(stats)
+
+    prom_sesiones = total_sesiones / num_terapeutas if num_terapeutas > 0 else 1
+    prom_ingresos = total_ingresos / num_terapeutas if num_terapeutas > 0 else 1
+
+    # 2. Calcular rating original para cada terapeuta
+    for stat in stats:
+        sesiones = stat['sesiones']
+        ingresos = float(stat['ingresos'] or 0)
+
+        # Fórmula 70% sesiones, 30% ingresos
+        rating_original = (sesiones / prom_sesiones) * 0.7 + (ingresos / prom_ingresos) * 0.3
+        stat['raiting_original'] = rating_original
+
+    # 3. Encontrar el máximo rating original
+    max_original = max(s['raiting_original'] for s in stats) if stats else 1
+
+    # 4. Escalar a 5 puntos y formatear resultado
+    resultado = []
+    for stat in stats:
+        scaled_rating = (stat['raiting_original'] / max_original) * 5
+
+        resultado.append({
+            "id": stat["therapist__id"],
+            "terapeuta": stat['terapeuta'] or "Sin nombre",
+            "sesiones": stat["sesiones"],
+            "ingresos": float(stat["ingresos"]) if stat["ingresos"] else 0.0,
+            "raiting": round(scaled_rating, 2)
+        })
+
+    return resultado
+
+
+def consolidar_estadisticas(filas):
+    """
+    Construye todas las secciones de StatisticsResource a partir de filas ya agrupadas.
+    Cada fila debe tener: dia, therapist__id, therapist__paternal_lastname,
+    therapist__maternal_lastname, therapist__name, payment_type__name,
+    appointment_type, pacientes (ids), sesiones e ingresos.
+    """
+    pacientes = set()
+    ttlsesiones = 0
+    ttlganancias = None
+    tipos_pago = {}
+    terapeutas = {}
+    ingresos_dia = {}
+    sesiones_dia = {}
+    tipos_pacientes = {"c": 0, "cc": 0}
+
+    for fila in filas:
+        sesiones = fila["sesiones"]
+        ingresos = fila["ingresos"]
+
+        # Métricas principales
+        pacientes.update(p for p in fila["pacientes"] if p is not None)
+        ttlsesiones += sesiones
+        if ingresos is not None:
+            ttlganancias = (ttlganancias or Decimal("0")) + ingresos
+
+        # Tipos de pago
+        tipo = fila["payment_type__name"] or "Sin tipo"
+        tipos_pago[tipo] = tipos_pago.get(tipo, 0) + sesiones
+
+        # Rendimiento por terapeuta (mismo formato que Concat: nulos como cadena vacía)
+        t_id = fila["therapist__id"]
+        if t_id not in terapeutas:
+            terapeutas[t_id] = {
+                "therapist__id": t_id,
+                "terapeuta": "%s %s, %s" % (
+                    fila["therapist__paternal_lastname"] or "",
+                    fila["therapist__maternal_lastname"] or "",
+                    fila["therapist__name"] or "",
+                ),
+                "sesiones": 0,
+                "ingresos": None,
+            }
+        terapeutas[t_id]["sesiones"] += sesiones
+        if ingresos is not None:
+            terapeutas[t_id]["ingresos"] = (terapeutas[t_id]["ingresos"] or Decimal("0")) + ingresos
+
+        # Ingresos y sesiones por día de la semana
+        dia = dia_semana_de(fila["dia"])
+        sesiones_dia[dia] = sesiones_dia.get(dia, 0) + sesiones
+        if ingresos is not None:
+            ingresos_dia[dia] = (ingresos_dia.get(dia) or Decimal("0")) + ingresos
+        else:
+            ingresos_dia.setdefault(dia, None)
+
+        # Tipos de pacientes (C / CC sin distinguir mayúsculas)
+        tipo_cita = (fila["appointment_type"] or "").upper()
+        if tipo_cita == "C":
+            tipos_pacientes["c"] += sesiones
+        elif tipo_cita == "CC":
+            tipos_pacientes["cc"] += sesiones
+
+    orden_terapeutas = sorted(terapeutas, key=lambda t: (t is not None, t or 0))
+
+    return {
+        "terapeutas": calcular_raiting([terapeutas[t] for t in orden_terapeutas]),
+        "tipos_pago": tipos_pago,
+        "metricas": {
+            "ttlpacientes": len(pacientes),
+            "ttlsesiones": ttlsesiones,
+            "ttlganancias": ttlganancias,
+        },
+        "ingresos": {
+            DIAS_SEMANA[d]: float(ingresos_dia[d]) if ingresos_dia[d] else 0.0
+            for d in sorted(ingresos_dia)
+        },
+        "sesiones": {DIAS_SEMANA[d]: sesiones_dia[d] for d in sorted(sesiones_dia)},
+        "tipos_pacientes": tipos_pacientes,
+    }
+
 
 class StatisticsService:
-    def get_metricas_principales(self, start, end):
-        return Appointment.objects.filter(
-            appointment_date__range=[start, end],
-            deleted_at__isnull=True
-        ).aggregate(
-            ttlpacientes=Count("patient", distinct=True),
-            ttlsesiones=Count("id"),
-            ttlganancias=Sum("payment")
-        )
+    def get_metricas_principales(self, start, end, aproximado=False):
+        sin_sketch = 0
+        if aproximado:
+            # Con días sin sketch (anteriores a rebuild_rollup) o con los sketches sin
+            # mantener, el estimado no cubre el rango: se responde el conteo exacto
+            sin_sketch = RollupService.dias_sin_sketch(start, end)
+            exacto = sin_sketch is None or sin_sketch > 0
+        else:
+            exacto = True
+
+        agregados = {}
+        if exacto:
+            agregados["ttlpacientes"] = Count("patient", distinct=True)
+
+        if range_index.indice_habilitado():
+            # Sesiones e ingresos desde el índice de rangos
+            sumas = range_index.get_range_index().sumas(start, end)
+            metricas = {"ttlsesiones": sumas["sesiones"], "ttlganancias": sumas["ingresos"]}
+        else:
+            agregados.update(ttlsesiones=Count("id"), ttlganancias=Sum("payment"))
+            metricas = {}
+
+        if agregados:
+            metricas.update(Appointment.objects.filter(
+                appointment_date__range=[start, end]
+            ).aggregate(**agregados))
+
+        if aproximado and exacto:
+            total = metricas["ttlpacientes"]
+            metricas["ttlpacientes_aprox"] = {
+                "estimado": total, "error_estandar": 0.0,
+                "limite_inferior": total, "limite_superior": total,
+                "exacto": True, "dias_sin_sketch": sin_sketch,
+            }
+        elif aproximado:
+            # Pacientes distintos estimados uniendo los sketches HyperLogLog diarios
+            aprox = RollupService.pacientes_aproximados(start, end)
+            aprox.update(exacto=False, dias_sin_sketch=0)
+            metricas["ttlpacientes"] = aprox["estimado"]
+            metricas["ttlpacientes_aprox"] = aprox
+        return metricas
 
     def get_tipos_de_pago(self, start, end):
         pagos = (
             Appointment.objects
             .filter(
-                appointment_date__range=[start, end],
-                deleted_at__isnull=True
+                appointment_date__range=[start, end]
             )
             .values("payment_type__name")
             .annotate(usos=Count("id"))
@@ -26,12 +224,14 @@ class StatisticsService:
         return {(p["payment_type__name"] or "Sin tipo"): p["usos"] for p in pagos}
 
     def get_rendimiento_terapeutas(self, start, end):
+        if range_index.indice_habilitado():
+            return calcular_raiting(self._rendimiento_desde_indice(start, end))
+
         # 1. Consulta base: sesiones e ingresos por terapeuta 
         stats = list(
             Appointment.objects
             .filter(
-                appointment_date__range=[start, end],
-                deleted_at__isnull=True
+                appointment_date__range=[start, end]
             )
             .values("therapist__id")
             .annotate(
@@ -48,61 +248,39 @@ class StatisticsService:
             )
         )
         
-        if not stats:
-            return []
-        
-        # 2. Calculamos promedios globales
-        total_sesiones = sum(s['sesiones'] for s in stats)
-        total_ingresos = sum(float(s['ingresos'] or 0) for s in stats)  
-        num_terapeutas = len(stats)
-        
-        prom_sesiones = total_sesiones / num_terapeutas if num_terapeutas > 0 else 1
-        prom_ingresos = total_ingresos / num_terapeutas if num_terapeutas > 0 else 1
-        
-        # 3. Calcular rating original para cada terapeuta
-        for stat in stats:
-            sesiones = stat['sesiones']
-            ingresos = float(stat['ingresos'] or 0)  
-            
-            # Fórmula 70% sesiones, 30% ingresos
-            rating_original = (sesiones / prom_sesiones) * 0.7 + (ingresos / prom_ingresos) * 0.3
-            stat['raiting_original'] = rating_original
-        
-        # 4. Encontrar el máximo rating original
-        max_original = max(s['raiting_original'] for s in stats) if stats else 1
-        
-        # 5. Escalar a 5 puntos y formatear resultado
-        resultado = []
-        for stat in stats:
-            scaled_rating = (stat['raiting_original'] / max_original) * 5
-            
-            resultado.append({
-                "id": stat["therapist__id"],
-                "terapeuta": stat['terapeuta'] or "Sin nombre",   
-                "sesiones": stat["sesiones"],
-                "ingresos": float(stat["ingresos"]) if stat["ingresos"] else 0.0,
-                "raiting": round(scaled_rating, 2) 
+        # 2. Promedios, rating y escala a 5 puntos
+        return calcular_raiting(stats)
+
+    def _rendimiento_desde_indice(self, start, end):
+        """Sesiones e ingresos por terapeuta desde el índice; solo consulta los nombres."""
+        sumas = range_index.get_range_index().terapeutas(start, end)
+        nombres = {
+            t["id"]: t for t in Therapist.objects.filter(
+                id__in=[s["therapist_id"] for s in sumas if s["therapist_id"] is not None]
+            ).values("id", "paternal_lastname", "maternal_lastname", "name")
+        }
+
+        stats = []
+        for suma in sumas:
+            therapist = nombres.get(suma["therapist_id"], {})
+            stats.append({
+                "therapist__id": suma["therapist_id"],
+                # Mismo formato que Concat: nulos como cadena vacía
+                "terapeuta": "%s %s, %s" % (
+                    therapist.get("paternal_lastname") or "",
+                    therapist.get("maternal_lastname") or "",
+                    therapist.get("name") or "",
+                ),
+                "sesiones": suma["sesiones"],
+                "ingresos": suma["ingresos"],
             })
-        
-        return resultado
+        return stats
 
     def get_ingresos_por_dia_semana(self, start, end):
-        
-        dias_semana = {
-            1: "Domingo",       
-            2: "Lunes",      
-            3: "Martes",     
-            4: "Miercoles",   
-            5: "Jueves",    
-            6: "Viernes",      
-            7: "Sabado"     
-        }
-        
         ingresos_raw = (
             Appointment.objects
             .filter(
-                appointment_date__range=[start, end],
-                deleted_at__isnull=True
+                appointment_date__range=[start, end]
             )
             .annotate(dia_semana=ExtractWeekDay("appointment_date"))
             .values("dia_semana")
@@ -113,22 +291,16 @@ class StatisticsService:
         
         resultado = {}
         for item in ingresos_raw:
-            dia_nombre = dias_semana.get(item["dia_semana"], f"Día {item['dia_semana']}")
+            dia_nombre = DIAS_SEMANA.get(item["dia_semana"], f"Día {item['dia_semana']}")
             resultado[dia_nombre] = float(item["total"]) if item["total"] else 0.0
         
         return resultado
 
     def get_sesiones_por_dia_semana(self, start, end):
-        dias_semana = {
-            1: "Domingo", 2: "Lunes", 3: "Martes", 4: "Miercoles",
-            5: "Jueves", 6: "Viernes", 7: "Sabado"
-        }
-        
         sesiones_raw = (
             Appointment.objects
             .filter(
-                appointment_date__range=[start, end],
-                deleted_at__isnull=True
+                appointment_date__range=[start, end]
             )
             .annotate(dia_semana=ExtractWeekDay("appointment_date"))
             .values("dia_semana")
@@ -138,29 +310,515 @@ class StatisticsService:
         
         resultado = {}
         for item in sesiones_raw:
-            dia_nombre = dias_semana.get(item["dia_semana"], f"Día {item['dia_semana']}")
+            dia_nombre = DIAS_SEMANA.get(item["dia_semana"], f"Día {item['dia_semana']}")
             resultado[dia_nombre] = item["sesiones"]
         
         return resultado
 
     def get_tipos_pacientes(self, start, end):
         return Appointment.objects.filter(
-            appointment_date__range=[start, end],
-            deleted_at__isnull=True
+            appointment_date__range=[start, end]
         ).aggregate(
             c=Count("id", filter=Q(appointment_type__iexact="C")),
             cc=Count("id", filter=Q(appointment_type__iexact="CC"))
         )
 
-    def get_statistics(self, start, end):
+    def get_serie_temporal(self, start, end, granularidad="day", serie=None):
+        """
+        Sesiones, ingresos y pacientes distintos por periodo (day, week o month)
+        en una sola consulta agrupada. Con serie ("therapist" o "payment_type")
+        devuelve un bucket por periodo y valor de la serie.
+        Es un generador: las filas se leen de la base de datos a medida que se consumen.
+        """
+        campos = ["periodo"] + ([SERIES[serie]] if serie else [])
+        filas = (
+            Appointment.objects
+            .filter(
+                appointment_date__range=[start, end]
+            )
+            .annotate(periodo=GRANULARIDADES[granularidad]())
+            .values(*campos)
+            .annotate(
+                sesiones=Count("id"),
+                ingresos=Sum("payment"),
+                pacientes=Count("patient", distinct=True)
+            )
+            .order_by(*campos)
+        )
+
+        for fila in filas.iterator():
+            bucket = {
+                "periodo": fila["periodo"].isoformat(),
+                "sesiones": fila["sesiones"],
+                "ingresos": float(fila["ingresos"]) if fila["ingresos"] else 0.0,
+                "pacientes": fila["pacientes"],
+            }
+            if serie:
+                bucket["serie"] = fila[SERIES[serie]]
+            yield bucket
+
+    def _filas_single_pass(self, filtro):
+        """
+        Citas activas que cumplen filtro, agrupadas por (fecha, terapeuta, tipo de pago,
+        tipo de cita, paciente) en el formato que espera consolidar_estadisticas.
+        """
+        filas = (
+            Appointment.objects
+            .filter(filtro)
+            .values(
+                "appointment_date",
+                "therapist__id",
+                "therapist__paternal_lastname",
+                "therapist__maternal_lastname",
+                "therapist__name",
+                "payment_type__name",
+                "appointment_type",
+                "patient_id",
+            )
+            .annotate(sesiones=Count("id"), ingresos=Sum("payment"))
+            .order_by()
+        )
+        for fila in filas.iterator():
+            yield dict(fila, dia=fila["appointment_date"], pacientes=[fila["patient_id"]])
+
+    def get_statistics_single_pass(self, start, end):
+        """
+        Construye todas las secciones de get_statistics recorriendo una sola vez
+        el rango. La consulta agrupa por (fecha, terapeuta, tipo de pago, tipo de cita,
+        paciente), de modo que cada sección se obtiene sumando filas ya agrupadas.
+        """
+        return consolidar_estadisticas(self._filas_single_pass(Q(appointment_date__range=[start, end])))
+
+    def get_statistics_por_periodos(self, periodos):
+        """
+        Calcula get_statistics para varios periodos [(start, end), ...] con una sola
+        consulta sobre la unión de los rangos. Cada fila agrupada se asigna a todos
+        los periodos que contienen su fecha, así que los periodos pueden solaparse.
+        """
+        filtro = Q()
+        for start, end in periodos:
+            filtro |= Q(appointment_date__range=[start, end])
+
+        filas_por_periodo = [[] for _ in periodos]
+        for fila in self._filas_single_pass(filtro):
+            for i, (start, end) in enumerate(periodos):
+                if start <= fila["dia"] <= end:
+                    filas_por_periodo[i].append(fila)
+
+        return [consolidar_estadisticas(filas) for filas in filas_por_periodo]
+
+    @staticmethod
+    def variacion(actual, anterior):
+        """Diferencia absoluta y porcentual (None si el valor anterior es 0)."""
+        actual = float(actual or 0)
+        anterior = float(anterior or 0)
+        delta = actual - anterior
+        return {
+            "delta": round(delta, 2),
+            "porcentaje": round(delta / anterior * 100, 2) if anterior else None,
+        }
+
+    @classmethod
+    def comparar_periodos(cls, actual, anterior):
+        """Variaciones por sección entre dos resultados de get_statistics."""
+        def por_clave(a, b):
+            return {k: cls.variacion(a.get(k), b.get(k)) for k in list(a) + [k for k in b if k not in a]}
+
+        terapeutas_a = {t["id"]: t for t in actual["terapeutas"]}
+        terapeutas_b = {t["id"]: t for t in anterior["terapeutas"]}
+        terapeutas = {}
+        for t_id in list(terapeutas_a) + [t for t in terapeutas_b if t not in terapeutas_a]:
+            a, b = terapeutas_a.get(t_id, {}), terapeutas_b.get(t_id, {})
+            terapeutas[str(t_id) if t_id is not None else "sin_terapeuta"] = {
+                "terapeuta": a.get("terapeuta") or b.get("terapeuta"),
+                "sesiones": cls.variacion(a.get("sesiones"), b.get("sesiones")),
+                "ingresos": cls.variacion(a.get("ingresos"), b.get("ingresos")),
+            }
+
+        metricas = ("ttlpacientes", "ttlsesiones", "ttlganancias")
         return {
-            "terapeutas": self.get_rendimiento_terapeutas(start, end),
-            "tipos_pago": self.get_tipos_de_pago(start, end),
-            "metricas": self.get_metricas_principales(start, end),
-            "ingresos": self.get_ingresos_por_dia_semana(start, end),
-            "sesiones": self.get_sesiones_por_dia_semana(start, end),
-            "tipos_pacientes": self.get_tipos_pacientes(start, end),
+            "metricas": {k: cls.variacion(actual["metricas"][k], anterior["metricas"][k]) for k in metricas},
+            "tipos_pago": por_clave(actual["tipos_pago"], anterior["tipos_pago"]),
+            "ingresos": por_clave(actual["ingresos"], anterior["ingresos"]),
+            "sesiones": por_clave(actual["sesiones"], anterior["sesiones"]),
+            "tipos_pacientes": por_clave(actual["tipos_pacientes"], anterior["tipos_pacientes"]),
+            "terapeutas": terapeutas,
         }
 
+    def secciones(self):
+        """Métodos independientes que componen StatisticsResource, por clave."""
+        return {
+            "terapeutas": self.get_rendimiento_terapeutas,
+            "tipos_pago": self.get_tipos_de_pago,
+            "metricas": self.get_metricas_principales,
+            "ingresos": self.get_ingresos_por_dia_semana,
+            "sesiones": self.get_sesiones_por_dia_semana,
+            "tipos_pacientes": self.get_tipos_pacientes,
+        }
+
+    def get_statistics_legacy(self, start, end, aproximado=False):
+        secciones = self.secciones()
+        if aproximado:
+            secciones["metricas"] = partial(self.get_metricas_principales, aproximado=True)
+        return {clave: metodo(start, end) for clave, metodo in secciones.items()}
+
+    async def aget_statistics(self, start, end):
+        """
+        Variante asíncrona de get_statistics_legacy: ejecuta las secciones en hilos
+        separados (cada uno con su conexión) y como máximo
+        STATISTICS_ASYNC_CONCURRENCY a la vez.
+        """
+        limite = max(1, getattr(settings, "STATISTICS_ASYNC_CONCURRENCY", 3))
+        semaforo = asyncio.Semaphore(limite)
+
+        def ejecutar_en_hilo(metodo):
+            try:
+                return metodo(start, end)
+            finally:
+                # Los hilos del pool no pasan por el ciclo de request de Django
+                close_old_connections()
+
+        async def ejecutar(metodo):
+            async with semaforo:
+                return await sync_to_async(ejecutar_en_hilo, thread_sensitive=False)(metodo)
+
+        secciones = self.secciones()
+        resultados = await asyncio.gather(*(ejecutar(metodo) for metodo in secciones.values()))
+        return dict(zip(secciones, resultados))
+
+    @staticmethod
+    def comparar_resultados(legacy, single_pass):
+        """Devuelve la lista de secciones en las que ambos resultados difieren."""
+        def ordenar(terapeutas):
+            return sorted(terapeutas, key=lambda t: (t["id"] is not None, t["id"] or 0))
+
+        diferencias = []
+        for seccion in legacy:
+            a, b = legacy[seccion], single_pass.get(seccion)
+            if seccion == "terapeutas":
+                a, b = ordenar(a), ordenar(b or [])
+            if a != b:
+                diferencias.append(seccion)
+        return diferencias
+
+    def get_statistics_rollup(self, start, end):
+        """
+        Construye todas las secciones leyendo AppointmentDailyRollup, por lo que
+        el costo depende del número de días del rango y no del número de citas.
+        """
+        filas = (
+            AppointmentDailyRollup.objects
+            .filter(day__range=[start, end])
+            .values(
+                "day",
+                "therapist__id",
+                "therapist__paternal_lastname",
+                "therapist__maternal_lastname",
+                "therapist__name",
+                "payment_type__name",
+                "appointment_type",
+                "pacientes",
+                "sesiones",
+                "ingresos",
+            )
+        )
+        return consolidar_estadisticas(dict(fila, dia=fila["day"]) for fila in filas.iterator())
+
+    def get_statistics(self, start, end, single_pass=None, verificar=None, usar_rollup=None, aproximado=False):
+        """
+        Calcula todas las secciones del dashboard.
+        - usar_rollup: lee la tabla de resumen diario (por defecto APPOINTMENT_ROLLUP_ENABLED).
+        - single_pass: usa get_statistics_single_pass (por defecto STATISTICS_SINGLE_PASS).
+        - verificar: calcula el camino rápido y el legacy, registra las diferencias y
+          devuelve el resultado legacy (por defecto STATISTICS_VERIFY_SINGLE_PASS).
+        - aproximado: estima los pacientes distintos con HyperLogLog e incluye
+          su margen de error en metricas.ttlpacientes_aprox; si faltan sketches en
+          el rango responde el conteo exacto con exacto=True.
+        """
+        if usar_rollup is None:
+            usar_rollup = getattr(settings, "APPOINTMENT_ROLLUP_ENABLED", False)
+        if single_pass is None:
+            single_pass = getattr(settings, "STATISTICS_SINGLE_PASS", False)
+        if verificar is None:
+            verificar = getattr(settings, "STATISTICS_VERIFY_SINGLE_PASS", False)
+
+        if usar_rollup:
+            camino_rapido = self.get_statistics_rollup
+        else:
+            camino_rapido = self.get_statistics_single_pass
+
+        if verificar:
+            data = self.get_statistics_legacy(start, end)
+            diferencias = self.comparar_resultados(data, camino_rapido(start, end))
+            if diferencias:
+                logger.warning(
+                    "Estadísticas %s difieren del camino legacy (%s a %s): %s",
+                    camino_rapido.__name__, start, end, ", ".join(diferencias)
+                )
+        elif usar_rollup or single_pass:
+            data = camino_rapido(start, end)
+        else:
+            return self.get_statistics_legacy(start, end, aproximado=aproximado)
+
+        if aproximado:
+            data["metricas"] = self.get_metricas_principales(start, end, aproximado=True)
+        return data
+
+
+class RollupService:
+    """
+    Mantiene la tabla AppointmentDailyRollup: una fila por
+    (día, terapeuta, tipo de pago, tipo de cita) con sesiones, ingresos
+    y los ids de pacientes distintos; y un DailyPatientSketch por día.
+    """
+
+    BATCH_SIZE = 1000
+
+    @staticmethod
+    def habilitado():
+        """
+        Las señales de Appointment mantienen el resumen y los sketches solo si alguna
+        función los lee (APPOINTMENT_ROLLUP_ENABLED o STATISTICS_APPROX_ENABLED).
+        """
+        return (
+            getattr(settings, "APPOINTMENT_ROLLUP_ENABLED", False)
+            or getattr(settings, "STATISTICS_APPROX_ENABLED", False)
+        )
+
+    @staticmethod
+    def _filas_agrupadas(queryset):
+        return (
+            queryset
+            .filter(appointment_date__isnull=False)
+            .values("appointment_date", "therapist_id", "payment_type_id", "appointment_type", "patient_id")
+            .annotate(sesiones=Count("id"), ingresos=Sum("payment"))
+            .order_by("appointment_date")
+        )
+
+    @staticmethod
+    def _construir(filas):
+        """Agrupa filas (ordenadas por fecha) y genera (día, rollups del día)."""
+        dia_actual = None
+        grupos = {}
+        for fila in filas:
+            if fila["appointment_date"] != dia_actual:
+                if grupos:
+                    yield dia_actual, list(grupos.values())
+                dia_actual = fila["appointment_date"]
+                grupos = {}
+
+            clave = (fila["therapist_id"], fila["payment_type_id"], fila["appointment_type"])
+            rollup = grupos.get(clave)
+            if rollup is None:
+                rollup = grupos[clave] = AppointmentDailyRollup(
+                    day=dia_actual,
+                    therapist_id=fila["therapist_id"],
+                    payment_type_id=fila["payment_type_id"],
+                    appointment_type=fila["appointment_type"],
+                    pacientes=[],
+                )
+            rollup.sesiones += fila["sesiones"]
+            if fila["ingresos"] is not None:
+                rollup.ingresos = (rollup.ingresos or Decimal("0")) + fila["ingresos"]
+            if fila["patient_id"] is not None:
+                rollup.pacientes.append(fila["patient_id"])
+        if grupos:
+            yield dia_actual, list(grupos.values())
+
+    @staticmethod
+    def _sketch(dia, rollups):
+        """Sketch HyperLogLog de los pacientes distintos del día."""
+        hll = HyperLogLog()
+        for paciente in {p for rollup in rollups for p in rollup.pacientes}:
+            hll.agregar(paciente)
+        return DailyPatientSketch(day=dia, registros=hll.a_bytes())
+
+    @classmethod
+    def _guardar(cls, dias):
+        lote = []
+        sketches = []
+        total = 0
+        for dia, rollups in dias:
+            lote.extend(rollups)
+            sketches.append(cls._sketch(dia, rollups))
+            if len(lote) >= cls.BATCH_SIZE:
+                AppointmentDailyRollup.objects.bulk_create(lote)
+                DailyPatientSketch.objects.bulk_create(sketches)
+                total += len(lote)
+                lote, sketches = [], []
+        if lote:
+            AppointmentDailyRollup.objects.bulk_create(lote)
+            DailyPatientSketch.objects.bulk_create(sketches)
+            total += len(lote)
+        return total
+
+    @classmethod
+    def rebuild_day(cls, dia):
+        """
+        Recalcula el resumen y el sketch de pacientes de un solo día. El sketch del
+        día (único por fecha) se bloquea con select_for_update, así dos
+        reconstrucciones concurrentes del mismo día se ejecutan una después de otra.
+        """
+        if dia is None:
+            return 0
+        with transaction.atomic():
+            DailyPatientSketch.objects.get_or_create(day=dia, defaults={"registros": HyperLogLog().a_bytes()})
+            sketch = DailyPatientSketch.objects.select_for_update().get(day=dia)
+
+            AppointmentDailyRollup.objects.filter(day=dia).delete()
+            filas = cls._filas_agrupadas(Appointment.objects.filter(appointment_date=dia))
+            rollups = next((r for _, r in cls._construir(filas)), [])
+            if not rollups:
+                sketch.delete()
+                return 0
+
+            AppointmentDailyRollup.objects.bulk_create(rollups)
+            sketch.registros = cls._sketch(dia, rollups).registros
+            sketch.save(update_fields=["registros"])
+            return len(rollups)
+
+    @classmethod
+    def rebuild_range(cls, start=None, end=None):
+        """Recalcula el resumen para un rango de días (todo el histórico si no se indica)."""
+        citas = Appointment.objects.all()
+        rollups = AppointmentDailyRollup.objects.all()
+        sketches = DailyPatientSketch.objects.all()
+        if start:
+            citas = citas.filter(appointment_date__gte=start)
+            rollups = rollups.filter(day__gte=start)
+            sketches = sketches.filter(day__gte=start)
+        if end:
+            citas = citas.filter(appointment_date__lte=end)
+            rollups = rollups.filter(day__lte=end)
+            sketches = sketches.filter(day__lte=end)
+
+        with transaction.atomic():
+            rollups.delete()
+            sketches.delete()
+            filas = cls._filas_agrupadas(citas).iterator(chunk_size=cls.BATCH_SIZE)
+            return cls._guardar(cls._construir(filas))
+
+    @classmethod
+    def dias_sin_sketch(cls, start, end):
+        """
+        Cuenta los días del rango con citas activas y sin DailyPatientSketch.
+        Devuelve None si las señales no mantienen los sketches (pueden estar
+        desactualizados aunque existan).
+        """
+        if not cls.habilitado():
+            return None
+        dias_con_sketch = DailyPatientSketch.objects.filter(day__range=[start, end]).values("day")
+        return (
+            Appointment.objects
+            .filter(appointment_date__range=[start, end])
+            .exclude(appointment_date__in=dias_con_sketch)
+            .values("appointment_date")
+            .distinct()
+            .count()
+        )
+
+    @staticmethod
+    def pacientes_aproximados(start, end):
+        """Une los sketches diarios del rango y devuelve el estimado con su error."""
+        hll = HyperLogLog()
+        sketches = DailyPatientSketch.objects.filter(day__range=[start, end]).values_list("registros", flat=True)
+        for registros in sketches.iterator():
+            hll.unir(HyperLogLog.desde_bytes(registros))
+        return hll.resumen()
+
+
+class StatisticsCache:
+    """
+    Caché de resultados de get_statistics por rango (start, end).
+    - Rangos totalmente en el pasado: STATISTICS_CACHE_TTL_PAST segundos.
+    - Rangos que incluyen hoy o el futuro: STATISTICS_CACHE_TTL_CURRENT segundos.
+    Cada día tiene una versión en la caché y la clave de un rango incluye las
+    versiones de sus días: invalidar un día le asigna una versión nueva, así solo
+    dejan de usarse los rangos que lo contienen. No hay un registro compartido que
+    leer y reescribir, y las entradas viejas simplemente expiran.
+
+    Con varios procesos la caché debe ser compartida (CACHES con Redis, Memcached o
+    base de datos): con LocMemCache cada proceso invalida solo su propia copia.
+    """
+
+    PREFIX = "statistics"
+
+    @staticmethod
+    def habilitado():
+        return getattr(settings, "STATISTICS_CACHE_ENABLED", False)
+
+    @classmethod
+    def clave(cls, start, end, variante="", version=""):
+        return f"{cls.PREFIX}:{start.isoformat()}:{end.isoformat()}:{variante}:{version}"
+
+    @classmethod
+    def clave_dia(cls, dia):
+        return f"{cls.PREFIX}:dia:{dia.isoformat()}"
+
+    @staticmethod
+    def ttl(end):
+        if end < localdate():
+            return getattr(settings, "STATISTICS_CACHE_TTL_PAST", 7 * 24 * 60 * 60)
+        return getattr(settings, "STATISTICS_CACHE_TTL_CURRENT", 60)
+
+    @classmethod
+    def version_rango(cls, start, end):
+        """
+        Resumen de las versiones de los días del rango. Un día sin versión (nunca
+        invalidado o desalojado de la caché) recibe una nueva, que no coincide con
+        ninguna clave guardada antes.
+        """
+        claves = [cls.clave_dia(start + timedelta(days=i)) for i in range((end - start).days + 1)]
+        versiones = cache.get_many(claves)
+        faltantes = [clave for clave in claves if clave not in versiones]
+        if faltantes:
+            for clave in faltantes:
+                cache.add(clave, uuid.uuid4().hex, None)
+            versiones.update(cache.get_many(faltantes))
+        texto = "|".join(str(versiones.get(clave)) for clave in claves)
+        return hashlib.sha1(texto.encode()).hexdigest()
+
+    @classmethod
+    def get_or_set(cls, start, end, calcular, variante=""):
+        """
+        Devuelve el resultado cacheado del rango o lo calcula con calcular().
+        variante distingue respuestas distintas para el mismo rango (ej. "aprox").
+        """
+        if not cls.habilitado():
+            return calcular()
+
+        clave = cls.clave(start, end, variante, cls.version_rango(start, end))
+        data = cache.get(clave)
+        if data is not None:
+            return data
+
+        data = calcular()
+        cache.set(clave, data, cls.ttl(end))
+        return data
+
+    @classmethod
+    async def aget_or_set(cls, start, end, calcular, variante=""):
+        """Versión asíncrona de get_or_set; calcular es una corrutina."""
+        if not cls.habilitado():
+            return await calcular()
+
+        version = await sync_to_async(cls.version_rango)(start, end)
+        clave = cls.clave(start, end, variante, version)
+        data = await cache.aget(clave)
+        if data is not None:
+            return data
 
+        data = await calcular()
+        await cache.aset(clave, data, cls.ttl(end))
+        return data
 
+    @classmethod
+    def invalidar_dia(cls, dia):
+        """
+        Asigna una versión nueva al día: los rangos que lo contienen dejan de leerse.
+        Las señales lo llaman en transaction.on_commit, para que una lectura
+        concurrente no vuelva a guardar datos anteriores al commit con la versión nueva.
+        """
+        if dia is None:
+            return
+        cache.set(cls.clave_dia(dia), uuid.uuid4().hex, None)
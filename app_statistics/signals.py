@@ -0,0 +1,79 @@
+from datetime import date
+from decimal import Decimal
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils.dateparse import parse_date
+from base_models.models import Appointment
+from .services import RollupService, StatisticsCache
+from .snapshot import notificar_eliminacion
+from . import range_index
+
+
+def _como_fecha(valor):
+    # appointment_date puede llegar como cadena "YYYY-MM-DD" antes de recargar la instancia
+    if isinstance(valor, str):
+        return parse_date(valor)
+    return valor if isinstance(valor, date) else None
+
+
+def _estado_indice(dia, therapist_id, payment, deleted_at):
+    # Tupla (día, terapeuta, pago) que usa el índice de rangos; None si la cita no cuenta
+    dia = _como_fecha(dia)
+    if deleted_at is not None or dia is None:
+        return None
+    return dia, therapist_id, Decimal(str(payment)) if payment is not None else None
+
+
+def _actualizar_dia(dia):
+    if RollupService.habilitado():
+        # Después del commit, para que la reconstrucción lea las citas confirmadas
+        transaction.on_commit(partial(RollupService.rebuild_day, dia))
+    transaction.on_commit(partial(StatisticsCache.invalidar_dia, dia))
+
+
+@receiver(pre_save, sender=Appointment)
+def guardar_estado_anterior(sender, instance, **kwargs):
+    # Si la cita cambia de fecha, también hay que recalcular el día anterior
+    instance._rollup_dia_anterior = None
+    instance._indice_anterior = None
+    if instance.pk:
+        anterior = (
+            Appointment.objects.with_deleted()
+            .filter(pk=instance.pk)
+            .values_list("appointment_date", "therapist_id", "payment", "deleted_at")
+            .first()
+        )
+        if anterior:
+            instance._rollup_dia_anterior = anterior[0]
+            instance._indice_anterior = _estado_indice(*anterior)
+
+
+@receiver(post_save, sender=Appointment)
+def actualizar_al_guardar(sender, instance, raw=False, **kwargs):
+    # Cubre altas, ediciones y eliminaciones lógicas (deleted_at)
+    if raw:
+        return
+    dias = {
+        _como_fecha(instance.appointment_date),
+        getattr(instance, "_rollup_dia_anterior", None),
+    }
+    for dia in dias - {None}:
+        _actualizar_dia(dia)
+
+    anterior = getattr(instance, "_indice_anterior", None)
+    nueva = _estado_indice(instance.appointment_date, instance.therapist_id, instance.payment, instance.deleted_at)
+    transaction.on_commit(partial(range_index.notificar_cambio, instance.pk, anterior, nueva))
+
+
+@receiver(post_delete, sender=Appointment)
+def actualizar_al_eliminar(sender, instance, **kwargs):
+    notificar_eliminacion(instance.pk)
+    dia = _como_fecha(instance.appointment_date)
+    if dia:
+        _actualizar_dia(dia)
+
+    anterior = _estado_indice(instance.appointment_date, instance.therapist_id, instance.payment, instance.deleted_at)
+    # partial fija el pk ahora: delete() lo deja en None antes del commit
+    transaction.on_commit(partial(range_index.notificar_cambio, instance.pk, anterior, None))
@@ -0,0 +1,301 @@
+"""
+Snapshot columnar en memoria de Appointment para estadísticas ad-hoc.
+
+Cada columna es un arreglo de NumPy ordenado por id de cita. El snapshot se carga
+la primera vez que se usa y luego se refresca de forma incremental con las citas
+nuevas (id mayor al último cargado) o modificadas (updated_at posterior a la última
+carga; Appointment.save() lo renueva en cada edición). Cada refresco vuelve a leer
+MARGEN_REFRESCO hacia atrás para no perder transacciones que confirman tarde, y cada
+RECARGA_COMPLETA segundos el snapshot se recarga completo. Las consultas se resuelven
+con máscaras vectorizadas y group-by con bincount, sin tocar la base de datos.
+
+NumPy es una dependencia opcional: solo se importa al construir el snapshot.
+"""
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Q
+from django.utils import timezone
+from base_models.models import Appointment
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depende del entorno
+    np = None
+
+
+# Columnas del snapshot: nombre -> campo de Appointment
+COLUMNAS = {
+    "ids": "id",
+    "dia": "appointment_date",
+    "therapist": "therapist_id",
+    "payment_type": "payment_type_id",
+    "appointment_status": "appointment_status_id",
+    "patient": "patient_id",
+    "room": "room",
+    "appointment_type": "appointment_type",
+    "payment": "payment",
+    "deleted_at": "deleted_at",
+}
+
+# Agrupaciones permitidas en las consultas ad-hoc
+AGRUPACIONES = ("therapist", "payment_type", "appointment_status", "room", "appointment_type", "dia", "dia_semana")
+
+# Valor usado en las columnas enteras para representar NULL
+SIN_VALOR = -1
+
+# Filas convertidas a la vez al cargar: acota las tuplas de Python en memoria
+FILAS_POR_BLOQUE = 5000
+
+# Solapamiento de cada refresco con el anterior: una cita guardada antes de la marca
+# cuya transacción confirma después de la consulta se lee en el siguiente refresco
+MARGEN_REFRESCO = timedelta(minutes=5)
+
+# Segundos entre recargas completas: recuperan cambios que confirmaron más tarde que
+# MARGEN_REFRESCO
+RECARGA_COMPLETA = 60 * 60
+
+
+class AppointmentSnapshot:
+    def __init__(self):
+        if np is None:
+            raise ImproperlyConfigured("El snapshot columnar requiere NumPy (pip install numpy).")
+        self._lock = threading.Lock()
+        self.cargado = False
+        self.ultima_actualizacion = 0.0
+        self.ultima_carga = 0.0
+        self._max_id = 0
+        # Momento de la última consulta: se vuelven a leer las citas con updated_at >= marca
+        self._marca = None
+        # Códigos de appointment_type en mayúsculas (C, CC, ...) para agrupar por categoría
+        self.tipos = []
+
+    # Carga y refresco
+
+    def _filas(self, queryset):
+        return queryset.order_by("id").values_list(*COLUMNAS.values())
+
+    def _columnas(self, filas):
+        """Convierte las filas en columnas de a FILAS_POR_BLOQUE filas a la vez."""
+        filas = iter(filas)
+        bloques = []
+        while bloque := list(islice(filas, FILAS_POR_BLOQUE)):
+            bloques.append(self._bloque(bloque))
+        if not bloques:
+            return self._bloque([])
+        if len(bloques) == 1:
+            return bloques[0]
+        return {nombre: np.concatenate([b[nombre] for b in bloques]) for nombre in bloques[0]}
+
+    def _bloque(self, filas):
+        n = len(filas)
+        cols = {
+            "ids": np.empty(n, dtype=np.int64),
+            "dia": np.empty(n, dtype=np.int32),
+            "therapist": np.empty(n, dtype=np.int64),
+            "payment_type": np.empty(n, dtype=np.int64),
+            "appointment_status": np.empty(n, dtype=np.int64),
+            "patient": np.empty(n, dtype=np.int64),
+            "room": np.empty(n, dtype=np.int64),
+            "appointment_type": np.empty(n, dtype=np.int32),
+            "centavos": np.empty(n, dtype=np.int64),
+            "con_pago": np.empty(n, dtype=bool),
+            "activa": np.empty(n, dtype=bool),
+        }
+        for i, (pk, dia, therapist, payment_type, estado, patient, room, tipo, payment, deleted_at) in enumerate(filas):
+            cols["ids"][i] = pk
+            cols["dia"][i] = dia.toordinal() if dia else 0
+            cols["therapist"][i] = therapist if therapist is not None else SIN_VALOR
+            cols["payment_type"][i] = payment_type if payment_type is not None else SIN_VALOR
+            cols["appointment_status"][i] = estado if estado is not None else SIN_VALOR
+            cols["patient"][i] = patient if patient is not None else SIN_VALOR
+            cols["room"][i] = room if room is not None else SIN_VALOR
+            cols["appointment_type"][i] = self._codigo_tipo(tipo)
+            cols["centavos"][i] = int(payment * 100) if payment is not None else 0
+            cols["con_pago"][i] = payment is not None
+            cols["activa"][i] = deleted_at is None
+        return cols
+
+    def _codigo_tipo(self, tipo):
+        if tipo is None:
+            return SIN_VALOR
+        tipo = tipo.upper()
+        if tipo not in self.tipos:
+            self.tipos.append(tipo)
+        return self.tipos.index(tipo)
+
+    def cargar(self):
+        """Carga completa del snapshot desde la base de datos."""
+        with self._lock:
+            self._marca = timezone.now()
+            self.tipos = []
+            # Incluye las citas eliminadas: quedan con activa=False
+            filas = self._filas(Appointment.objects.with_deleted()).iterator(chunk_size=FILAS_POR_BLOQUE)
+            self._cols = self._columnas(filas)
+            self._max_id = int(self._cols["ids"][-1]) if len(self._cols["ids"]) else 0
+            self.cargado = True
+            self.ultima_actualizacion = self.ultima_carga = time.monotonic()
+
+    def refrescar(self):
+        """Aplica las citas nuevas o modificadas desde la última carga."""
+        if not self.cargado:
+            return self.cargar()
+
+        with self._lock:
+            condicion = Q(id__gt=self._max_id) | Q(updated_at__gte=self._marca - MARGEN_REFRESCO)
+            self._marca = timezone.now()
+            nuevas = self._columnas(self._filas(Appointment.objects.with_deleted().filter(condicion)))
+            self.ultima_actualizacion = time.monotonic()
+            if not len(nuevas["ids"]):
+                return
+
+            ids = self._cols["ids"]
+            posiciones = np.searchsorted(ids, nuevas["ids"])
+            existe = posiciones < len(ids)
+            existe[existe] = ids[posiciones[existe]] == nuevas["ids"][existe]
+
+            # Citas ya cargadas: se actualizan en su lugar
+            for nombre, columna in self._cols.items():
+                columna[posiciones[existe]] = nuevas[nombre][existe]
+
+            # Citas nuevas: se agregan y se mantiene el orden por id
+            if (~existe).any():
+                cols = {
+                    nombre: np.concatenate([columna, nuevas[nombre][~existe]])
+                    for nombre, columna in self._cols.items()
+                }
+                orden = np.argsort(cols["ids"], kind="stable")
+                self._cols = {nombre: columna[orden] for nombre, columna in cols.items()}
+            self._max_id = int(self._cols["ids"][-1])
+
+    def marcar_eliminada(self, pk):
+        """Excluye del snapshot una cita eliminada físicamente."""
+        if not self.cargado:
+            return
+        with self._lock:
+            pos = np.searchsorted(self._cols["ids"], pk)
+            if pos < len(self._cols["ids"]) and self._cols["ids"][pos] == pk:
+                self._cols["activa"][pos] = False
+
+    def asegurar_actualizado(self):
+        """Carga o refresca el snapshot si superó STATISTICS_SNAPSHOT_MAX_AGE segundos."""
+        max_age = getattr(settings, "STATISTICS_SNAPSHOT_MAX_AGE", 60)
+        if not self.cargado or time.monotonic() - self.ultima_carga >= RECARGA_COMPLETA:
+            self.cargar()
+        elif time.monotonic() - self.ultima_actualizacion >= max_age:
+            self.refrescar()
+
+    # Consultas
+
+    def mascara(self, start, end, **filtros):
+        """
+        Máscara de citas activas entre start y end (inclusive).
+        Filtros opcionales por igualdad: therapist, payment_type, appointment_status,
+        patient, room y appointment_type (código de texto, ej. "CC").
+        """
+        return self._mascara(self._cols, start, end, **filtros)
+
+    def _mascara(self, cols, start, end, **filtros):
+        mask = cols["activa"] & (cols["dia"] >= start.toordinal()) & (cols["dia"] <= end.toordinal())
+        for nombre, valor in filtros.items():
+            if valor is None:
+                continue
+            if nombre == "appointment_type":
+                valor = self.tipos.index(valor.upper()) if valor.upper() in self.tipos else -2
+            elif nombre not in cols or nombre in ("ids", "dia", "centavos", "con_pago", "activa"):
+                raise ValueError(f"Filtro no soportado: {nombre}")
+            mask &= cols[nombre] == int(valor)
+        return mask
+
+    def resumen(self, start, end, **filtros):
+        """Totales del rango: sesiones, ingresos y pacientes distintos."""
+        # Una sola lectura de las columnas: refrescar puede reemplazarlas por otras más largas
+        cols = self._cols
+        mask = self._mascara(cols, start, end, **filtros)
+        pacientes = cols["patient"][mask]
+        return {
+            "ttlsesiones": int(mask.sum()),
+            "ttlganancias": self._a_decimal(cols["centavos"][mask].sum()) if cols["con_pago"][mask].any() else None,
+            "ttlpacientes": int(np.unique(pacientes[pacientes != SIN_VALOR]).size),
+        }
+
+    def agrupar(self, por, start, end, **filtros):
+        """
+        Sesiones, ingresos y pacientes distintos por grupo, ordenados por clave.
+        'por' debe ser uno de AGRUPACIONES.
+        """
+        if por not in AGRUPACIONES:
+            raise ValueError(f"Agrupación no soportada: {por}")
+
+        cols = self._cols
+        mask = self._mascara(cols, start, end, **filtros)
+        if por == "dia_semana":
+            # Misma numeración que ExtractWeekDay: 1 = Domingo ... 7 = Sábado
+            claves = cols["dia"][mask] % 7 + 1
+        else:
+            claves = cols[por][mask]
+
+        unicas, grupos = np.unique(claves, return_inverse=True)
+        sesiones = np.bincount(grupos, minlength=unicas.size)
+        centavos = np.bincount(grupos, weights=cols["centavos"][mask], minlength=unicas.size)
+
+        # Pacientes distintos por grupo: pares (grupo, paciente) únicos
+        pacientes = cols["patient"][mask]
+        con_paciente = pacientes != SIN_VALOR
+        pares = np.unique(np.stack([grupos[con_paciente], pacientes[con_paciente]]), axis=1)
+        distintos = np.bincount(pares[0], minlength=unicas.size) if pares.size else np.zeros(unicas.size, dtype=np.int64)
+
+        return [
+            {
+                "clave": self._clave(por, int(clave)),
+                "sesiones": int(sesiones[i]),
+                "ingresos": float(self._a_decimal(centavos[i])),
+                "pacientes": int(distintos[i]),
+            }
+            for i, clave in enumerate(unicas)
+        ]
+
+    def _clave(self, por, valor):
+        if por == "dia":
+            return date.fromordinal(valor).isoformat() if valor else None
+        if valor == SIN_VALOR:
+            return None
+        if por == "appointment_type":
+            return self.tipos[valor]
+        return valor
+
+    @staticmethod
+    def _a_decimal(centavos):
+        return Decimal(int(round(centavos))) / 100
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot():
+    """Snapshot compartido por el proceso, actualizado según STATISTICS_SNAPSHOT_MAX_AGE."""
+    global _snapshot
+    with _snapshot_lock:
+        if _snapshot is None:
+            _snapshot = AppointmentSnapshot()
+    _snapshot.asegurar_actualizado()
+    return _snapshot
+
+
+def notificar_eliminacion(pk):
+    """Llamado desde las señales de Appointment al eliminar físicamente una cita."""
+    if _snapshot is not None:
+        _snapshot.marcar_eliminada(pk)
+
+
+def descartar_snapshot():
+    """Libera el snapshot del proceso; se vuelve a cargar en el siguiente uso."""
+    global _snapshot
+    with _snapshot_lock:
+        _snapshot = None
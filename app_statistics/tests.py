@@ -1,13 +1,34 @@
-from django.test import TestCase, Client
+import json
+import os
+import tempfile
+import threading
+import time
+from asgiref.sync import async_to_sync
+from django.test import TestCase, TransactionTestCase, Client, override_settings
 from django.urls import reverse
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
+from unittest import skipUnless
 from unittest.mock import patch, MagicMock
-from datetime import date, datetime
+from datetime import date, datetime, timedelta, timezone as dt_timezone
 from decimal import Decimal
+from io import StringIO
+from django.core.cache import cache
+from django.db import connection
+from django.core.management import call_command
+from django.utils.timezone import localdate
+from django.core.management.base import CommandError
 
-from .services import StatisticsService
+from .services import StatisticsService, StatisticsCache, RollupService, DIAS_SEMANA
+from . import snapshot as snapshot_module
+from .snapshot import AppointmentSnapshot, descartar_snapshot
+from . import range_index
+from .range_index import FenwickTree, get_range_index, descartar_indice
 from .serializers import StatisticsResource
+from .models import AppointmentDailyRollup, DailyPatientSketch
+from .hll import HyperLogLog
+from .checks import cache_compartida
+from . import benchmark
 from base_models.models import Appointment, Therapist, Patient, PaymentType
 
 
@@ -237,6 +258,1099 @@ class StatisticsServiceTestCase(TestCase):
         self.assertEqual(result['ttlsesiones'], 0)
 
 
+class StatisticsSinglePassTestCase(TestCase):
+    """Tests para el cálculo de estadísticas en una sola pasada"""
+
+    def setUp(self):
+        self.service = StatisticsService()
+        self.start_date = date(2024, 1, 1)
+        self.end_date = date(2024, 1, 31)
+
+        self.therapist = Therapist.objects.create(
+            name='Juan',
+            paternal_lastname='Pérez',
+            maternal_lastname='González'
+        )
+        self.other_therapist = Therapist.objects.create(name='Ana')
+        self.patient = Patient.objects.create(name='Paciente Test')
+        self.other_patient = Patient.objects.create(name='Otro Paciente')
+        self.efectivo = PaymentType.objects.create(name='Efectivo')
+        self.yape = PaymentType.objects.create(name='Yape')
+
+        Appointment.objects.create(
+            appointment_date=date(2024, 1, 15), patient=self.patient,
+            therapist=self.therapist, payment=Decimal('100.00'),
+            payment_type=self.efectivo, appointment_type='C'
+        )
+        Appointment.objects.create(
+            appointment_date=date(2024, 1, 15), patient=self.patient,
+            therapist=self.therapist, payment=Decimal('50.50'),
+            payment_type=self.yape, appointment_type='cc'
+        )
+        Appointment.objects.create(
+            appointment_date=date(2024, 1, 20), patient=self.other_patient,
+            therapist=self.other_therapist, payment_type=self.efectivo
+        )
+        Appointment.objects.create(
+            appointment_date=date(2024, 1, 21), patient=None,
+            therapist=None, payment=Decimal('30.00')
+        )
+        # Fuera de rango y eliminada: no deben contarse
+        Appointment.objects.create(
+            appointment_date=date(2024, 2, 1), patient=self.patient,
+            therapist=self.therapist, payment=Decimal('999.00')
+        )
+        Appointment.objects.create(
+            appointment_date=date(2024, 1, 16), patient=self.other_patient,
+            therapist=self.therapist, payment=Decimal('999.00'),
+            deleted_at=datetime(2024, 1, 17, tzinfo=dt_timezone.utc)
+        )
+
+    def test_single_pass_matches_legacy(self):
+        """Test que ambos caminos producen el mismo resultado"""
+        legacy = self.service.get_statistics_legacy(self.start_date, self.end_date)
+        single_pass = self.service.get_statistics_single_pass(self.start_date, self.end_date)
+
+        self.assertEqual(StatisticsService.comparar_resultados(legacy, single_pass), [])
+        self.assertEqual(single_pass['metricas']['ttlpacientes'], 2)
+        self.assertEqual(single_pass['metricas']['ttlsesiones'], 4)
+        self.assertEqual(single_pass['metricas']['ttlganancias'], Decimal('180.50'))
+        self.assertEqual(single_pass['tipos_pacientes'], {'c': 1, 'cc': 1})
+
+    def test_single_pass_empty_range(self):
+        """Test single-pass sin citas en el rango"""
+        result = self.service.get_statistics_single_pass(date(2023, 1, 1), date(2023, 1, 31))
+        legacy = self.service.get_statistics_legacy(date(2023, 1, 1), date(2023, 1, 31))
+
+        self.assertEqual(result, legacy)
+
+    def test_single_pass_runs_one_query(self):
+        """Test que single-pass ejecuta una sola consulta"""
+        with self.assertNumQueries(1):
+            self.service.get_statistics_single_pass(self.start_date, self.end_date)
+
+    @override_settings(STATISTICS_SINGLE_PASS=True)
+    def test_get_statistics_uses_setting(self):
+        """Test que get_statistics respeta STATISTICS_SINGLE_PASS"""
+        with self.assertNumQueries(1):
+            self.service.get_statistics(self.start_date, self.end_date)
+
+    def test_get_statistics_verificar_returns_legacy(self):
+        """Test que el modo verificación devuelve el resultado legacy sin diferencias"""
+        with self.assertNoLogs('app_statistics.services', level='WARNING'):
+            result = self.service.get_statistics(self.start_date, self.end_date, verificar=True)
+
+        self.assertEqual(result, self.service.get_statistics_legacy(self.start_date, self.end_date))
+
+    def test_comparar_resultados_detects_difference(self):
+        """Test que comparar_resultados detecta secciones distintas"""
+        legacy = self.service.get_statistics_legacy(self.start_date, self.end_date)
+        alterado = dict(legacy, tipos_pago={'Efectivo': 99})
+
+        self.assertEqual(StatisticsService.comparar_resultados(legacy, alterado), ['tipos_pago'])
+
+
+@override_settings(APPOINTMENT_ROLLUP_ENABLED=True)
+class AppointmentDailyRollupTestCase(TestCase):
+    """Tests para el resumen diario de citas y su mantenimiento"""
+
+    def setUp(self):
+        self.service = StatisticsService()
+        self.therapist = Therapist.objects.create(
+            name='Juan',
+            paternal_lastname='Pérez',
+            maternal_lastname='González'
+        )
+        self.patient = Patient.objects.create(name='Paciente Test')
+        self.other_patient = Patient.objects.create(name='Otro Paciente')
+        self.efectivo = PaymentType.objects.create(name='Efectivo')
+
+    def crear_cita(self, **kwargs):
+        datos = {
+            'appointment_date': date(2024, 1, 15),
+            'patient': self.patient,
+            'therapist': self.therapist,
+            'payment': Decimal('100.00'),
+            'payment_type': self.efectivo,
+            'appointment_type': 'C',
+        }
+        datos.update(kwargs)
+        with self.captureOnCommitCallbacks(execute=True):
+            return Appointment.objects.create(**datos)
+
+    def test_rollup_created_on_save(self):
+        """Test que crear citas actualiza el resumen del día"""
+        self.crear_cita()
+        self.crear_cita(patient=self.other_patient, payment=Decimal('50.00'))
+
+        rollup = AppointmentDailyRollup.objects.get(day=date(2024, 1, 15))
+        self.assertEqual(rollup.sesiones, 2)
+        self.assertEqual(rollup.ingresos, Decimal('150.00'))
+        self.assertEqual(sorted(rollup.pacientes), sorted([self.patient.id, self.other_patient.id]))
+
+    def test_rollup_moves_with_date_change(self):
+        """Test que cambiar la fecha recalcula el día anterior y el nuevo"""
+        cita = self.crear_cita()
+        cita.appointment_date = date(2024, 1, 16)
+        with self.captureOnCommitCallbacks(execute=True):
+            cita.save()
+
+        self.assertFalse(AppointmentDailyRollup.objects.filter(day=date(2024, 1, 15)).exists())
+        self.assertEqual(AppointmentDailyRollup.objects.get(day=date(2024, 1, 16)).sesiones, 1)
+
+    def test_rollup_soft_delete_and_delete(self):
+        """Test que la eliminación lógica y física retiran la cita del resumen"""
+        cita = self.crear_cita()
+        otra = self.crear_cita(patient=self.other_patient)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cita.soft_delete()
+        self.assertEqual(AppointmentDailyRollup.objects.get(day=date(2024, 1, 15)).sesiones, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            otra.delete()
+        self.assertFalse(AppointmentDailyRollup.objects.filter(day=date(2024, 1, 15)).exists())
+
+    def test_rebuild_rollup_command(self):
+        """Test que el comando reconstruye el histórico"""
+        self.crear_cita()
+        self.crear_cita(appointment_date=date(2024, 1, 20), payment=None)
+        AppointmentDailyRollup.objects.all().delete()
+
+        out = StringIO()
+        call_command('rebuild_rollup', stdout=out)
+
+        self.assertIn('2 filas', out.getvalue())
+        self.assertIsNone(AppointmentDailyRollup.objects.get(day=date(2024, 1, 20)).ingresos)
+
+    def test_rebuild_rollup_command_invalid_date(self):
+        """Test error del comando con fecha inválida"""
+        with self.assertRaises(CommandError):
+            call_command('rebuild_rollup', start='2024/01/01')
+
+    def test_statistics_from_rollup_match_legacy(self):
+        """Test que las estadísticas desde el resumen coinciden con el camino legacy"""
+        self.crear_cita()
+        self.crear_cita(patient=self.other_patient, appointment_type='cc', payment=None)
+        self.crear_cita(appointment_date=date(2024, 1, 20), therapist=None, payment_type=None)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crear_cita(appointment_date=date(2024, 1, 21), patient=None).soft_delete()
+
+        start, end = date(2024, 1, 1), date(2024, 1, 31)
+        legacy = self.service.get_statistics_legacy(start, end)
+        rollup = self.service.get_statistics_rollup(start, end)
+
+        self.assertEqual(StatisticsService.comparar_resultados(legacy, rollup), [])
+
+    def test_rebuild_day_twice_keeps_one_row_per_group(self):
+        """Test que reconstruir un día con sketch existente no duplica filas"""
+        self.crear_cita()
+        self.assertEqual(RollupService.rebuild_day(date(2024, 1, 15)), 1)
+        self.assertEqual(RollupService.rebuild_day(date(2024, 1, 15)), 1)
+
+        self.assertEqual(AppointmentDailyRollup.objects.filter(day=date(2024, 1, 15)).count(), 1)
+        self.assertEqual(DailyPatientSketch.objects.filter(day=date(2024, 1, 15)).count(), 1)
+
+    def test_rollup_rebuilt_after_commit(self):
+        """Test que la reconstrucción se ejecuta al confirmar la transacción"""
+        with self.captureOnCommitCallbacks() as callbacks:
+            Appointment.objects.create(appointment_date=date(2024, 1, 15), patient=self.patient)
+        self.assertFalse(AppointmentDailyRollup.objects.exists())
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(AppointmentDailyRollup.objects.get(day=date(2024, 1, 15)).sesiones, 1)
+
+    @override_settings(APPOINTMENT_ROLLUP_ENABLED=False, STATISTICS_APPROX_ENABLED=False)
+    def test_no_maintenance_when_disabled(self):
+        """Test que sin resumen ni estimación aproximada guardar no toca el resumen"""
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            cita = Appointment.objects.create(appointment_date=date(2024, 1, 15), patient=self.patient)
+            cita.payment = Decimal('20.00')
+            cita.save()
+
+        self.assertFalse(AppointmentDailyRollup.objects.exists())
+        self.assertFalse(DailyPatientSketch.objects.exists())
+        self.assertNotIn(RollupService.rebuild_day, [getattr(c, 'func', None) for c in callbacks])
+
+    def test_get_statistics_uses_rollup_setting(self):
+        """Test que get_statistics lee el resumen con APPOINTMENT_ROLLUP_ENABLED"""
+        self.crear_cita()
+
+        with self.assertNumQueries(1):
+            result = self.service.get_statistics(date(2024, 1, 1), date(2024, 1, 31))
+
+        self.assertEqual(result['metricas']['ttlsesiones'], 1)
+
+
+@override_settings(STATISTICS_CACHE_ENABLED=True)
+class StatisticsCacheTestCase(TestCase):
+    """Tests para la caché de estadísticas por rango de fechas"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = reverse('statistics-get-statistics')
+        self.therapist = Therapist.objects.create(name='Ana')
+        self.patient = Patient.objects.create(name='Test Patient')
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_cached_response_skips_queries(self):
+        """Test que la segunda petición del mismo rango no consulta la base de datos"""
+        params = {'start': '2024-01-01', 'end': '2024-01-31'}
+        self.client.get(self.url, params)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, params)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_write_invalidates_only_ranges_with_date(self):
+        """Test que crear una cita solo invalida los rangos que contienen su fecha"""
+        enero = (date(2024, 1, 1), date(2024, 1, 31))
+        febrero = (date(2024, 2, 1), date(2024, 2, 29))
+        StatisticsCache.get_or_set(*enero, lambda: {'rango': 'enero'})
+        StatisticsCache.get_or_set(*febrero, lambda: {'rango': 'febrero'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.create(
+                appointment_date=date(2024, 1, 15),
+                patient=self.patient,
+                therapist=self.therapist
+            )
+
+        self.assertEqual(StatisticsCache.get_or_set(*enero, lambda: {'rango': 'nuevo'}), {'rango': 'nuevo'})
+        self.assertEqual(StatisticsCache.get_or_set(*febrero, lambda: {'rango': 'nuevo'}), {'rango': 'febrero'})
+
+    def test_invalidation_waits_for_commit(self):
+        """Test que la invalidación se aplica al confirmar la transacción"""
+        enero = (date(2024, 1, 1), date(2024, 1, 31))
+        StatisticsCache.get_or_set(*enero, lambda: {'rango': 'enero'})
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            Appointment.objects.create(appointment_date=date(2024, 1, 15), patient=self.patient)
+            # Antes del commit una lectura concurrente sigue viendo la versión anterior
+            self.assertEqual(StatisticsCache.get_or_set(*enero, lambda: {'rango': 'nuevo'}), {'rango': 'enero'})
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(StatisticsCache.get_or_set(*enero, lambda: {'rango': 'nuevo'}), {'rango': 'nuevo'})
+
+    def test_evicted_day_version_does_not_revive_old_entries(self):
+        """Test que si se pierde la versión de un día no se sirven entradas anteriores"""
+        enero = (date(2024, 1, 1), date(2024, 1, 31))
+        StatisticsCache.get_or_set(*enero, lambda: {'rango': 'enero'})
+        cache.delete(StatisticsCache.clave_dia(date(2024, 1, 15)))
+
+        self.assertEqual(StatisticsCache.get_or_set(*enero, lambda: {'rango': 'nuevo'}), {'rango': 'nuevo'})
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_check_warns_on_local_cache(self):
+        """Test que el chequeo avisa si la caché no es compartida entre procesos"""
+        self.assertEqual([w.id for w in cache_compartida(None)], ['app_statistics.W001'])
+
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache'}}):
+            self.assertEqual(cache_compartida(None), [])
+
+    def test_soft_delete_invalidates_range(self):
+        """Test que la eliminación lógica invalida el rango de la cita"""
+        cita = Appointment.objects.create(
+            appointment_date=date(2024, 1, 15),
+            patient=self.patient,
+            therapist=self.therapist,
+            payment=Decimal('100.00')
+        )
+        params = {'start': '2024-01-01', 'end': '2024-01-31'}
+        self.assertEqual(self.client.get(self.url, params).data['metricas']['ttlsesiones'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cita.soft_delete()
+
+        self.assertEqual(self.client.get(self.url, params).data['metricas']['ttlsesiones'], 0)
+
+    @override_settings(STATISTICS_CACHE_TTL_PAST=1000, STATISTICS_CACHE_TTL_CURRENT=10)
+    def test_ttl_depends_on_range_end(self):
+        """Test que los rangos pasados usan el TTL largo y los actuales el corto"""
+        hoy = localdate()
+
+        self.assertEqual(StatisticsCache.ttl(date(2024, 1, 31)), 1000)
+        self.assertEqual(StatisticsCache.ttl(hoy), 10)
+
+    @override_settings(STATISTICS_CACHE_ENABLED=False)
+    def test_disabled_cache_always_computes(self):
+        """Test que con la caché deshabilitada siempre se calcula"""
+        llamadas = []
+        for _ in range(2):
+            StatisticsCache.get_or_set(date(2024, 1, 1), date(2024, 1, 31), lambda: llamadas.append(1))
+
+        self.assertEqual(len(llamadas), 2)
+
+
+class StatisticsConditionalGetTestCase(TestCase):
+    """Tests para el GET condicional (ETag / Last-Modified) de /statistics/metricas/"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('statistics-get-statistics')
+        self.params = {'start': '2024-01-01', 'end': '2024-01-31'}
+        cita = Appointment.objects.create(appointment_date=date(2024, 1, 15), payment=Decimal('50.00'))
+        # save() fija updated_at en la hora actual; update() no pasa por save()
+        Appointment.objects.filter(pk=cita.pk).update(
+            created_at=datetime(2024, 1, 15, 10, 0, tzinfo=dt_timezone.utc),
+            updated_at=datetime(2024, 1, 15, 10, 0, tzinfo=dt_timezone.utc)
+        )
+
+    def test_if_none_match_returns_304_without_aggregation(self):
+        """Test que con el ETag vigente responde 304 con una sola consulta y sin calcular estadísticas"""
+        response = self.client.get(self.url, self.params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('ETag', response)
+        self.assertEqual(response['Last-Modified'], 'Mon, 15 Jan 2024 10:00:00 GMT')
+
+        with patch.object(StatisticsService, 'get_statistics') as get_statistics, self.assertNumQueries(1):
+            no_modificado = self.client.get(self.url, self.params, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(no_modificado.status_code, status.HTTP_304_NOT_MODIFIED)
+        get_statistics.assert_not_called()
+
+        no_modificado = self.client.get(self.url, self.params, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(no_modificado.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_write_changes_etag(self):
+        """Test que una cita nueva en el rango cambia el ETag y la respuesta vuelve a calcularse"""
+        etag = self.client.get(self.url, self.params)['ETag']
+        Appointment.objects.create(appointment_date=date(2024, 1, 20), payment=Decimal('10.00'))
+
+        response = self.client.get(self.url, self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_invalid_range_has_no_etag(self):
+        """Test que un rango inválido responde 400 sin validadores"""
+        response = self.client.get(self.url, {'start': '2024-01-31', 'end': '2024-01-01'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn('ETag', response)
+
+
+class StatisticsAsyncViewTestCase(TransactionTestCase):
+    """Tests para la variante asíncrona del endpoint de estadísticas"""
+
+    def setUp(self):
+        self.url = reverse('statistics_async')
+        self.therapist = Therapist.objects.create(name='Ana', paternal_lastname='García')
+        self.patient = Patient.objects.create(name='Test Patient')
+        Appointment.objects.create(
+            appointment_date=date(2024, 1, 15),
+            patient=self.patient,
+            therapist=self.therapist,
+            payment=Decimal('150.00'),
+            appointment_type='C'
+        )
+
+    def test_async_view_matches_sync_endpoint(self):
+        """Test que el endpoint asíncrono devuelve lo mismo que el síncrono"""
+        params = {'start': '2024-01-01', 'end': '2024-01-31'}
+        response = self.client.get(self.url, params)
+        expected = self.client.get(reverse('statistics-get-statistics'), params)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), expected.json())
+        self.assertEqual(response.json()['metricas']['ttlsesiones'], 1)
+
+    def test_async_view_invalid_range(self):
+        """Test error cuando start_date > end_date"""
+        response = self.client.get(self.url, {'start': '2024-01-31', 'end': '2024-01-01'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.json())
+
+    @override_settings(STATISTICS_ASYNC_CONCURRENCY=2)
+    def test_aget_statistics_respects_concurrency_limit(self):
+        """Test que nunca se ejecutan más secciones a la vez que el límite configurado"""
+        service = StatisticsService()
+        lock = threading.Lock()
+        estado = {'activas': 0, 'maximo': 0}
+
+        def seccion_lenta(start, end):
+            with lock:
+                estado['activas'] += 1
+                estado['maximo'] = max(estado['maximo'], estado['activas'])
+            time.sleep(0.02)
+            with lock:
+                estado['activas'] -= 1
+            return {}
+
+        with patch.object(StatisticsService, 'secciones', lambda self: {
+            f'seccion_{i}': seccion_lenta for i in range(6)
+        }):
+            result = async_to_sync(service.aget_statistics)(date(2024, 1, 1), date(2024, 1, 31))
+
+        self.assertEqual(len(result), 6)
+        self.assertEqual(estado['maximo'], 2)
+
+
+class AppointmentSnapshotTestCase(TestCase):
+    """Tests para el snapshot columnar de citas"""
+
+    def setUp(self):
+        descartar_snapshot()
+        self.therapist = Therapist.objects.create(name='Juan', paternal_lastname='Pérez')
+        self.other_therapist = Therapist.objects.create(name='Ana')
+        self.patient = Patient.objects.create(name='Paciente Test')
+        self.other_patient = Patient.objects.create(name='Otro Paciente')
+        self.efectivo = PaymentType.objects.create(name='Efectivo')
+
+        Appointment.objects.create(
+            appointment_date=date(2024, 1, 15), patient=self.patient, therapist=self.therapist,
+            payment=Decimal('100.00'), payment_type=self.efectivo, room=1, appointment_type='C'
+        )
+        Appointment.objects.create(
+            appointment_date=date(2024, 1, 16), patient=self.patient, therapist=self.therapist,
+            payment=Decimal('50.25'), room=2, appointment_type='cc'
+        )
+        Appointment.objects.create(
+            appointment_date=date(2024, 1, 20), patient=self.other_patient,
+            therapist=self.other_therapist, room=1
+        )
+        Appointment.objects.create(
+            appointment_date=date(2024, 1, 21), patient=self.other_patient, therapist=self.therapist,
+            payment=Decimal('999.00'), deleted_at=datetime(2024, 1, 22, tzinfo=dt_timezone.utc)
+        )
+
+        self.start_date = date(2024, 1, 1)
+        self.end_date = date(2024, 1, 31)
+
+    def tearDown(self):
+        descartar_snapshot()
+
+    def test_resumen_matches_metricas_principales(self):
+        """Test que el resumen coincide con la consulta SQL"""
+        snapshot = AppointmentSnapshot()
+        snapshot.cargar()
+
+        with self.assertNumQueries(0):
+            resumen = snapshot.resumen(self.start_date, self.end_date)
+
+        self.assertEqual(resumen, StatisticsService().get_metricas_principales(self.start_date, self.end_date))
+
+    def test_agrupar_por_room_y_filtros(self):
+        """Test group-by por sala y filtro por terapeuta"""
+        snapshot = AppointmentSnapshot()
+        snapshot.cargar()
+
+        grupos = snapshot.agrupar('room', self.start_date, self.end_date)
+        self.assertEqual(grupos, [
+            {'clave': 1, 'sesiones': 2, 'ingresos': 100.0, 'pacientes': 2},
+            {'clave': 2, 'sesiones': 1, 'ingresos': 50.25, 'pacientes': 1},
+        ])
+
+        grupos = snapshot.agrupar('appointment_type', self.start_date, self.end_date, therapist=self.therapist.id)
+        self.assertEqual([g['clave'] for g in grupos], ['C', 'CC'])
+
+    def test_agrupar_dia_semana_matches_sql(self):
+        """Test que dia_semana usa la numeración de ExtractWeekDay"""
+        snapshot = AppointmentSnapshot()
+        snapshot.cargar()
+
+        grupos = snapshot.agrupar('dia_semana', self.start_date, self.end_date)
+        sesiones = {DIAS_SEMANA[g['clave']]: g['sesiones'] for g in grupos}
+
+        self.assertEqual(sesiones, StatisticsService().get_sesiones_por_dia_semana(self.start_date, self.end_date))
+
+    def test_refrescar_incremental(self):
+        """Test que refrescar aplica citas nuevas y eliminaciones lógicas"""
+        snapshot = AppointmentSnapshot()
+        snapshot.cargar()
+
+        nueva = Appointment.objects.create(
+            appointment_date=date(2024, 1, 25), patient=self.patient, payment=Decimal('10.00')
+        )
+        snapshot.refrescar()
+        self.assertEqual(snapshot.resumen(self.start_date, self.end_date)['ttlsesiones'], 4)
+
+        nueva.soft_delete()
+        snapshot.refrescar()
+        self.assertEqual(snapshot.resumen(self.start_date, self.end_date)['ttlsesiones'], 3)
+
+    def test_refrescar_edicion_con_save(self):
+        """Test que refrescar ve una cita editada con save(), que renueva updated_at"""
+        snapshot = AppointmentSnapshot()
+        snapshot.cargar()
+
+        cita = Appointment.objects.get(appointment_date=date(2024, 1, 16))
+        cita.payment = Decimal('99.00')
+        cita.therapist = self.other_therapist
+        cita.save()
+        snapshot.refrescar()
+
+        self.assertEqual(
+            snapshot.resumen(self.start_date, self.end_date),
+            StatisticsService().get_metricas_principales(self.start_date, self.end_date)
+        )
+        grupos = snapshot.agrupar('therapist', self.start_date, self.end_date)
+        self.assertEqual({g['clave']: g['ingresos'] for g in grupos}, {self.therapist.id: 100.0, self.other_therapist.id: 99.0})
+
+    def test_refrescar_commit_tardio(self):
+        """Test que refrescar lee una edición con updated_at anterior a la marca (commit tardío)"""
+        snapshot = AppointmentSnapshot()
+        snapshot.cargar()
+
+        Appointment.objects.filter(appointment_date=date(2024, 1, 16)).update(
+            payment=Decimal('77.00'), updated_at=snapshot._marca - timedelta(seconds=30)
+        )
+        snapshot.refrescar()
+
+        self.assertEqual(
+            snapshot.resumen(self.start_date, self.end_date),
+            StatisticsService().get_metricas_principales(self.start_date, self.end_date)
+        )
+
+    def test_recarga_completa_periodica(self):
+        """Test que pasado RECARGA_COMPLETA el snapshot se recarga completo"""
+        snapshot = AppointmentSnapshot()
+        snapshot.cargar()
+        snapshot.ultima_carga -= snapshot_module.RECARGA_COMPLETA
+
+        with patch.object(snapshot, 'cargar') as cargar, patch.object(snapshot, 'refrescar') as refrescar:
+            snapshot.asegurar_actualizado()
+        cargar.assert_called_once()
+        refrescar.assert_not_called()
+
+    def test_carga_por_bloques(self):
+        """Test que la carga convierte las filas por bloques con el mismo resultado"""
+        completo = AppointmentSnapshot()
+        completo.cargar()
+        with patch.object(snapshot_module, 'FILAS_POR_BLOQUE', 2):
+            por_bloques = AppointmentSnapshot()
+            por_bloques.cargar()
+
+        for nombre, columna in completo._cols.items():
+            self.assertEqual(columna.tolist(), por_bloques._cols[nombre].tolist())
+
+    def test_consulta_con_refresco_concurrente(self):
+        """Test que resumen y agrupar usan una sola lectura de las columnas aunque cambien en medio"""
+        snapshot = AppointmentSnapshot()
+        snapshot.cargar()
+        esperado = snapshot.resumen(self.start_date, self.end_date)
+        original = snapshot._mascara
+
+        def mascara_y_refresco(cols, *args, **kwargs):
+            mask = original(cols, *args, **kwargs)
+            # Simula un refresco que agrega citas entre la máscara y la lectura de columnas
+            snapshot._cols = {n: snapshot_module.np.concatenate([c, c[:1]]) for n, c in cols.items()}
+            return mask
+
+        with patch.object(snapshot, '_mascara', side_effect=mascara_y_refresco):
+            self.assertEqual(snapshot.resumen(self.start_date, self.end_date), esperado)
+            self.assertTrue(snapshot.agrupar('room', self.start_date, self.end_date))
+
+    def test_adhoc_endpoint(self):
+        """Test del endpoint ad-hoc con agrupación"""
+        response = self.client.get(reverse('statistics-get-adhoc'), {
+            'start': '2024-01-01', 'end': '2024-01-31', 'group_by': 'room'
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['metricas']['ttlsesiones'], 3)
+        self.assertEqual(len(response.json()['grupos']), 2)
+
+    def test_adhoc_endpoint_invalid_group_by(self):
+        """Test error con group_by inválido"""
+        response = self.client.get(reverse('statistics-get-adhoc'), {
+            'start': '2024-01-01', 'end': '2024-01-31', 'group_by': 'color'
+        })
+
+        self.assertEqual(response.status_code, 400)
+
+
+class FenwickTreeTestCase(TestCase):
+    """Tests para el árbol de Fenwick disperso"""
+
+    def test_range_sums(self):
+        """Test sumas por rango contra una suma directa"""
+        arbol = FenwickTree(tamanio=64)
+        valores = {3: 5, 10: 2, 11: 7, 40: 1}
+        for posicion, valor in valores.items():
+            arbol.agregar(posicion, valor)
+
+        for inicio, fin in [(1, 63), (3, 3), (4, 10), (11, 40), (41, 63), (12, 5)]:
+            esperado = sum(v for p, v in valores.items() if inicio <= p <= fin)
+            self.assertEqual(arbol.rango(inicio, fin), esperado)
+
+
+class AppointmentRangeIndexTestCase(TestCase):
+    """Tests para el índice de sumas por rango de días"""
+
+    def setUp(self):
+        descartar_indice()
+        self.service = StatisticsService()
+        self.therapist = Therapist.objects.create(name='Juan', paternal_lastname='Pérez')
+        self.other_therapist = Therapist.objects.create(name='Ana')
+        self.patient = Patient.objects.create(name='Paciente Test')
+
+        Appointment.objects.create(
+            appointment_date=date(2024, 1, 15), patient=self.patient,
+            therapist=self.therapist, payment=Decimal('100.00')
+        )
+        Appointment.objects.create(
+            appointment_date=date(2024, 1, 20), patient=self.patient,
+            therapist=self.other_therapist, payment=Decimal('40.50')
+        )
+        Appointment.objects.create(
+            appointment_date=date(2024, 1, 22), patient=self.patient, therapist=None
+        )
+        self.start_date = date(2024, 1, 1)
+        self.end_date = date(2024, 1, 31)
+
+    def tearDown(self):
+        descartar_indice()
+
+    def test_index_matches_sql(self):
+        """Test que el índice devuelve lo mismo que las consultas SQL"""
+        esperado_metricas = self.service.get_metricas_principales(self.start_date, self.end_date)
+        esperado_terapeutas = self.service.get_rendimiento_terapeutas(self.start_date, self.end_date)
+
+        with self.settings(STATISTICS_RANGE_INDEX_ENABLED=True):
+            metricas = self.service.get_metricas_principales(self.start_date, self.end_date)
+            terapeutas = self.service.get_rendimiento_terapeutas(self.start_date, self.end_date)
+
+        self.assertEqual(metricas, esperado_metricas)
+        self.assertEqual(
+            sorted(terapeutas, key=lambda t: t['id'] or 0),
+            sorted(esperado_terapeutas, key=lambda t: t['id'] or 0)
+        )
+
+    @override_settings(STATISTICS_RANGE_INDEX_ENABLED=True)
+    def test_index_updated_on_commit(self):
+        """Test que las escrituras actualizan el índice al confirmar la transacción"""
+        indice = get_range_index()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cita = Appointment.objects.create(
+                appointment_date=date(2024, 1, 25), patient=self.patient,
+                therapist=self.therapist, payment=Decimal('10.00')
+            )
+        self.assertEqual(indice.sumas(self.start_date, self.end_date)['sesiones'], 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cita.appointment_date = date(2024, 2, 5)
+            cita.save()
+        self.assertEqual(indice.sumas(self.start_date, self.end_date)['sesiones'], 3)
+        self.assertEqual(indice.sumas(date(2024, 2, 1), date(2024, 2, 29))['ingresos'], Decimal('10.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cita.soft_delete()
+        self.assertEqual(indice.sumas(date(2024, 2, 1), date(2024, 2, 29))['sesiones'], 0)
+
+    @override_settings(STATISTICS_RANGE_INDEX_ENABLED=True)
+    def test_index_answers_without_scanning_appointments(self):
+        """Test que las sumas por terapeuta solo consultan los nombres"""
+        get_range_index()
+
+        with self.assertNumQueries(1):
+            result = self.service.get_rendimiento_terapeutas(self.start_date, self.end_date)
+
+        self.assertEqual(len(result), 3)
+
+    @override_settings(STATISTICS_RANGE_INDEX_ENABLED=True, STATISTICS_RANGE_INDEX_MAX_AGE=0)
+    def test_index_rebuilt_after_writes_from_other_process(self):
+        """Test que el índice se reconstruye si la tabla cambió sin pasar por sus señales"""
+        indice = get_range_index()
+
+        # Sin ejecutar los callbacks de commit: como una escritura de otro proceso
+        Appointment.objects.create(
+            appointment_date=date(2024, 1, 25), patient=self.patient,
+            therapist=self.therapist, payment=Decimal('10.00')
+        )
+        self.assertEqual(indice.sumas(self.start_date, self.end_date)['sesiones'], 3)
+
+        self.assertEqual(get_range_index().sumas(self.start_date, self.end_date)['sesiones'], 4)
+        with self.assertNumQueries(1):
+            self.assertFalse(indice.verificar())
+
+    def test_changes_during_build_are_applied(self):
+        """Test que los cambios confirmados mientras se construye el índice no se pierden"""
+        indice = range_index.AppointmentRangeIndex()
+        validador = range_index.validador_citas
+
+        def cambio_durante_la_carga():
+            # Cita que la carga no llega a leer (confirmada después de la consulta)
+            indice.actualizar(10 ** 9, None, (date(2024, 1, 25), self.therapist.id, Decimal('10.00')))
+            return validador()
+
+        with patch.object(range_index, 'validador_citas', side_effect=cambio_durante_la_carga):
+            indice.construir()
+
+        sumas = indice.sumas(self.start_date, self.end_date)
+        self.assertEqual(sumas['sesiones'], 4)
+        self.assertEqual(sumas['ingresos'], Decimal('150.50'))
+
+    def test_change_read_by_build_not_counted_twice(self):
+        """Test que un cambio que la carga ya lee de la base no se vuelve a aplicar"""
+        indice = range_index.AppointmentRangeIndex()
+        validador = range_index.validador_citas
+        # Confirmada antes de la consulta, pero su señal llega durante la carga
+        cita = Appointment.objects.create(
+            appointment_date=date(2024, 1, 25), patient=self.patient,
+            therapist=self.therapist, payment=Decimal('10.00')
+        )
+
+        def cambio_durante_la_carga():
+            indice.actualizar(cita.pk, None, (cita.appointment_date, self.therapist.id, cita.payment))
+            return validador()
+
+        with patch.object(range_index, 'validador_citas', side_effect=cambio_durante_la_carga):
+            indice.construir()
+
+        sumas = indice.sumas(self.start_date, self.end_date)
+        self.assertEqual(sumas['sesiones'], 4)
+        self.assertEqual(sumas['ingresos'], Decimal('150.50'))
+
+    def test_change_after_row_read_is_applied(self):
+        """Test que el cambio de una cita ya leída por la carga se aplica como diferencia"""
+        indice = range_index.AppointmentRangeIndex()
+        cita = Appointment.objects.order_by('id').first()
+        anterior = (cita.appointment_date, cita.therapist_id, cita.payment)
+        original = range_index.AppointmentRangeIndex._aplicar
+        disparado = []
+
+        def aplicar(arbol, *args):
+            original(arbol, *args)
+            if arbol is not indice and not disparado:
+                disparado.append(True)
+                indice.actualizar(cita.pk, anterior, (cita.appointment_date, cita.therapist_id, Decimal('110.00')))
+
+        with patch.object(range_index.AppointmentRangeIndex, '_aplicar', autospec=True, side_effect=aplicar):
+            indice.construir()
+
+        sumas = indice.sumas(self.start_date, self.end_date)
+        self.assertEqual(sumas['sesiones'], 3)
+        self.assertEqual(sumas['ingresos'], Decimal('150.50'))
+
+
+class HyperLogLogTestCase(TestCase):
+    """Tests para el estimador HyperLogLog"""
+
+    def test_estimate_within_error_bound(self):
+        """Test que el estimado cae dentro del intervalo reportado"""
+        hll = HyperLogLog()
+        for paciente in range(20000):
+            hll.agregar(paciente)
+
+        resumen = hll.resumen()
+        self.assertLessEqual(resumen['limite_inferior'], 20000)
+        self.assertGreaterEqual(resumen['limite_superior'], 20000)
+        self.assertAlmostEqual(resumen['estimado'] / 20000, 1, delta=0.05)
+
+    def test_small_cardinality_and_duplicates(self):
+        """Test conteos pequeños y valores repetidos"""
+        hll = HyperLogLog()
+        for paciente in [1, 2, 3, 1, 2, 3]:
+            hll.agregar(paciente)
+
+        self.assertEqual(hll.resumen()['estimado'], 3)
+        self.assertEqual(HyperLogLog().resumen()['estimado'], 0)
+
+    def test_union_matches_combined_sketch(self):
+        """Test que unir sketches equivale a un sketch con todos los valores"""
+        a, b, total = HyperLogLog(), HyperLogLog(), HyperLogLog()
+        for paciente in range(0, 3000):
+            a.agregar(paciente)
+            total.agregar(paciente)
+        for paciente in range(2000, 5000):
+            b.agregar(paciente)
+            total.agregar(paciente)
+
+        a.unir(HyperLogLog.desde_bytes(b.a_bytes()))
+        self.assertEqual(a.a_bytes(), total.a_bytes())
+
+
+@override_settings(STATISTICS_APPROX_ENABLED=True)
+class PacientesAproximadosTestCase(TestCase):
+    """Tests para la estimación de pacientes distintos con sketches diarios"""
+
+    def setUp(self):
+        self.service = StatisticsService()
+        self.therapist = Therapist.objects.create(name='Ana', paternal_lastname='García')
+        self.pacientes = [Patient.objects.create(name=f'Paciente {i}') for i in range(5)]
+        with self.captureOnCommitCallbacks(execute=True):
+            for i, paciente in enumerate(self.pacientes):
+                for dia in (15, 16):
+                    Appointment.objects.create(
+                        appointment_date=date(2024, 1, dia + i % 2), patient=paciente,
+                        therapist=self.therapist, payment=Decimal('10.00')
+                    )
+
+    def test_sketches_maintained_per_day(self):
+        """Test que cada día con citas tiene su sketch"""
+        dias = list(DailyPatientSketch.objects.order_by('day').values_list('day', flat=True))
+
+        self.assertEqual(dias, [date(2024, 1, 15), date(2024, 1, 16), date(2024, 1, 17)])
+
+    def test_metricas_aproximadas(self):
+        """Test que el estimado del rango une los días sin duplicar pacientes"""
+        result = self.service.get_metricas_principales(date(2024, 1, 1), date(2024, 1, 31), aproximado=True)
+
+        self.assertEqual(result['ttlpacientes'], 5)
+        self.assertEqual(result['ttlsesiones'], 10)
+        self.assertEqual(result['ttlpacientes_aprox']['estimado'], 5)
+        self.assertIn('error_estandar', result['ttlpacientes_aprox'])
+
+    def test_approx_query_param(self):
+        """Test del parámetro approx=true en el endpoint"""
+        response = APIClient().get(reverse('statistics-get-statistics'), {
+            'start': '2024-01-01', 'end': '2024-01-31', 'approx': 'true'
+        })
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        aprox = response.data['metricas']['ttlpacientes_aprox']
+        self.assertEqual(aprox['estimado'], 5)
+        self.assertLessEqual(aprox['limite_inferior'], 5)
+        self.assertGreaterEqual(aprox['limite_superior'], 5)
+        self.assertFalse(aprox['exacto'])
+
+    def test_dias_sin_sketch_usa_conteo_exacto(self):
+        """Test que un día con citas y sin sketch (previo a rebuild_rollup) cae al conteo exacto"""
+        DailyPatientSketch.objects.filter(day=date(2024, 1, 16)).delete()
+
+        result = self.service.get_metricas_principales(date(2024, 1, 1), date(2024, 1, 31), aproximado=True)
+
+        self.assertEqual(result['ttlpacientes'], 5)
+        self.assertTrue(result['ttlpacientes_aprox']['exacto'])
+        self.assertEqual(result['ttlpacientes_aprox']['dias_sin_sketch'], 1)
+        self.assertEqual(result['ttlpacientes_aprox']['limite_superior'], 5)
+
+        RollupService.rebuild_range()
+        result = self.service.get_metricas_principales(date(2024, 1, 1), date(2024, 1, 31), aproximado=True)
+        self.assertFalse(result['ttlpacientes_aprox']['exacto'])
+
+    def test_sketches_sin_mantener_usa_conteo_exacto(self):
+        """Test que sin las señales activas los sketches no se usan"""
+        with override_settings(STATISTICS_APPROX_ENABLED=False):
+            response = APIClient().get(reverse('statistics-get-statistics'), {
+                'start': '2024-01-01', 'end': '2024-01-31', 'approx': 'true'
+            })
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        aprox = response.data['metricas']['ttlpacientes_aprox']
+        self.assertTrue(aprox['exacto'])
+        self.assertIsNone(aprox['dias_sin_sketch'])
+        self.assertEqual(response.data['metricas']['ttlpacientes'], 5)
+
+
+class SerieTemporalTestCase(TestCase):
+    """Tests para la serie temporal de sesiones e ingresos"""
+
+    def setUp(self):
+        self.service = StatisticsService()
+        self.url = reverse('statistics-get-serie-temporal')
+        self.therapist = Therapist.objects.create(name='Juan')
+        self.other_therapist = Therapist.objects.create(name='Ana')
+        self.patient = Patient.objects.create(name='Paciente Test')
+        self.other_patient = Patient.objects.create(name='Otro Paciente')
+        self.efectivo = PaymentType.objects.create(name='Efectivo')
+
+        for dia, therapist, patient, payment in [
+            (date(2024, 1, 15), self.therapist, self.patient, Decimal('100.00')),
+            (date(2024, 1, 15), self.other_therapist, self.patient, Decimal('20.00')),
+            (date(2024, 1, 17), self.therapist, self.other_patient, None),
+            (date(2024, 2, 5), self.therapist, self.patient, Decimal('50.00')),
+        ]:
+            Appointment.objects.create(
+                appointment_date=dia, therapist=therapist, patient=patient,
+                payment=payment, payment_type=self.efectivo
+            )
+
+    def test_serie_por_dia(self):
+        """Test buckets diarios"""
+        buckets = list(self.service.get_serie_temporal(date(2024, 1, 1), date(2024, 2, 29)))
+
+        self.assertEqual([b['periodo'] for b in buckets], ['2024-01-15', '2024-01-17', '2024-02-05'])
+        self.assertEqual(buckets[0], {'periodo': '2024-01-15', 'sesiones': 2, 'ingresos': 120.0, 'pacientes': 1})
+
+    def test_serie_por_semana_y_mes(self):
+        """Test buckets semanales (lunes) y mensuales"""
+        semanas = list(self.service.get_serie_temporal(date(2024, 1, 1), date(2024, 2, 29), 'week'))
+        meses = list(self.service.get_serie_temporal(date(2024, 1, 1), date(2024, 2, 29), 'month'))
+
+        self.assertEqual([(b['periodo'], b['sesiones']) for b in semanas], [('2024-01-15', 3), ('2024-02-05', 1)])
+        self.assertEqual([(b['periodo'], b['pacientes']) for b in meses], [('2024-01-01', 2), ('2024-02-01', 1)])
+
+    def test_serie_por_terapeuta(self):
+        """Test una serie por terapeuta en una sola consulta"""
+        with self.assertNumQueries(1):
+            buckets = list(self.service.get_serie_temporal(date(2024, 1, 1), date(2024, 1, 31), 'month', 'therapist'))
+
+        self.assertEqual(
+            [(b['serie'], b['sesiones']) for b in buckets],
+            [(self.therapist.id, 2), (self.other_therapist.id, 1)]
+        )
+
+    def test_streaming_endpoint(self):
+        """Test que el endpoint responde JSON por partes"""
+        response = self.client.get(self.url, {
+            'start': '2024-01-01', 'end': '2024-02-29', 'granularidad': 'month', 'serie': 'payment_type'
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(data['granularidad'], 'month')
+        self.assertEqual([b['serie'] for b in data['buckets']], ['Efectivo', 'Efectivo'])
+
+    def test_invalid_granularidad(self):
+        """Test error con granularidad inválida"""
+        response = self.client.get(self.url, {'start': '2024-01-01', 'end': '2024-01-31', 'granularidad': 'year'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class ComparacionPeriodosTestCase(TestCase):
+    """Tests para la comparación entre periodos"""
+
+    def setUp(self):
+        self.service = StatisticsService()
+        self.url = reverse('statistics-get-comparacion')
+        self.therapist = Therapist.objects.create(name='Juan')
+        self.other_therapist = Therapist.objects.create(name='Ana')
+        self.patient = Patient.objects.create(name='Paciente Test')
+        self.efectivo = PaymentType.objects.create(name='Efectivo')
+
+        for dia, therapist, payment, tipo in [
+            (date(2024, 2, 5), self.therapist, Decimal('100.00'), 'C'),
+            (date(2024, 2, 6), self.therapist, Decimal('50.00'), 'CC'),
+            (date(2024, 1, 10), self.therapist, Decimal('40.00'), 'C'),
+            (date(2024, 1, 11), self.other_therapist, Decimal('10.00'), 'C'),
+        ]:
+            Appointment.objects.create(
+                appointment_date=dia, therapist=therapist, patient=self.patient,
+                payment=payment, payment_type=self.efectivo, appointment_type=tipo
+            )
+
+    def test_periodos_en_una_consulta(self):
+        """Test que cada periodo coincide con su cálculo por separado usando una sola consulta"""
+        periodos = [
+            (date(2024, 2, 1), date(2024, 2, 29)),
+            (date(2024, 1, 1), date(2024, 1, 31)),
+            (date(2024, 1, 1), date(2024, 2, 29)),
+        ]
+        with self.assertNumQueries(1):
+            resultados = self.service.get_statistics_por_periodos(periodos)
+
+        for (start, end), resultado in zip(periodos, resultados):
+            self.assertEqual(resultado, self.service.get_statistics_single_pass(start, end))
+
+    def test_variaciones(self):
+        """Test deltas y porcentajes por sección"""
+        febrero, enero = self.service.get_statistics_por_periodos([
+            (date(2024, 2, 1), date(2024, 2, 29)),
+            (date(2024, 1, 1), date(2024, 1, 31)),
+        ])
+        deltas = self.service.comparar_periodos(febrero, enero)
+
+        self.assertEqual(deltas['metricas']['ttlganancias'], {'delta': 100.0, 'porcentaje': 200.0})
+        self.assertEqual(deltas['metricas']['ttlsesiones'], {'delta': 0.0, 'porcentaje': 0.0})
+        self.assertEqual(deltas['tipos_pacientes']['cc'], {'delta': 1.0, 'porcentaje': None})
+        self.assertEqual(deltas['terapeutas'][str(self.other_therapist.id)]['sesiones'], {'delta': -1.0, 'porcentaje': -100.0})
+
+    def test_endpoint(self):
+        """Test respuesta del endpoint con periodo principal y comparaciones"""
+        response = self.client.get(self.url, {
+            'start': '2024-02-01', 'end': '2024-02-29', 'periodos': '2024-01-01:2024-01-31'
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['principal']['metricas']['ttlsesiones'], 2)
+        comparacion = response.data['comparaciones'][0]
+        self.assertEqual(comparacion['start'], '2024-01-01')
+        self.assertEqual(comparacion['datos']['metricas']['ttlsesiones'], 2)
+        self.assertEqual(comparacion['deltas']['metricas']['ttlganancias']['delta'], 100.0)
+
+    def test_periodos_invalidos(self):
+        """Test errores con periodos faltantes, mal formados o demasiados"""
+        base = {'start': '2024-02-01', 'end': '2024-02-29'}
+        for periodos in ('', '2024-01-01', '2024-01-31:2024-01-01', ','.join(['2024-01-01:2024-01-31'] * 5)):
+            response = self.client.get(self.url, dict(base, periodos=periodos))
+            self.assertEqual(response.status_code, 400)
+
+
+class BenchmarkTestCase(TestCase):
+    """Tests para el benchmark con carga sintética"""
+
+    def test_generador_determinista(self):
+        """Test que la misma semilla genera las mismas citas"""
+        def firma():
+            return list(
+                Appointment.objects.with_deleted().order_by('id')
+                .values_list('appointment_date', 'therapist__name', 'payment', 'appointment_type')
+            )
+
+        benchmark.generar_citas(300, semilla=7, dias=30)
+        primera = firma()
+        Appointment.objects.with_deleted().delete()
+        benchmark.generar_citas(300, semilla=7, dias=30)
+
+        self.assertEqual(len(primera), 300)
+        self.assertEqual(firma(), primera)
+
+    def test_generador_inserta_por_lotes(self):
+        """Test que las citas se insertan en lotes de BATCH_SIZE sin materializarlas todas"""
+        lotes = []
+        original = Appointment.objects.bulk_create
+
+        def registrar(objs, *args, **kwargs):
+            lotes.append(len(objs))
+            return original(objs, *args, **kwargs)
+
+        with patch.object(benchmark, 'BATCH_SIZE', 100), \
+                patch.object(Appointment.objects, 'bulk_create', side_effect=registrar):
+            benchmark.generar_citas(250, dias=30)
+
+        self.assertEqual(lotes, [100, 100, 50])
+        self.assertEqual(Appointment.objects.with_deleted().count(), 250)
+
+    def test_percentil(self):
+        """Test percentil por rango más cercano"""
+        valores = list(range(1, 101))
+        self.assertEqual(benchmark.percentil(valores, 50), 50)
+        self.assertEqual(benchmark.percentil(valores, 95), 95)
+        self.assertEqual(benchmark.percentil([3.0], 95), 3.0)
+
+    def test_comparar_con_base(self):
+        """Test detección de regresiones de latencia y de consultas"""
+        base = {'metodos': {'get_statistics': {'p50_ms': 10.0, 'consultas': 1}}}
+        igual = {'metodos': {'get_statistics': {'p50_ms': 11.0, 'consultas': 1}}}
+        lento = {'metodos': {'get_statistics': {'p50_ms': 15.0, 'consultas': 2}}}
+
+        self.assertEqual(benchmark.comparar_con_base(igual, base, 0.2), [])
+        self.assertEqual(len(benchmark.comparar_con_base(lento, base, 0.2)), 2)
+
+    def test_command(self):
+        """Test que el comando guarda el JSON, compara con la base y descarta los datos"""
+        with tempfile.TemporaryDirectory() as carpeta:
+            salida = os.path.join(carpeta, 'resultado.json')
+            call_command('benchmark_statistics', rows=200, days=10, repeat=2, output=salida, stdout=StringIO())
+
+            with open(salida, encoding='utf-8') as archivo:
+                resultado = json.load(archivo)
+            self.assertEqual(resultado['carga']['citas'], 200)
+            self.assertIn('get_statistics', resultado['metodos'])
+            self.assertEqual(
+                set(resultado['metodos']['get_statistics']),
+                {'p50_ms', 'p95_ms', 'min_ms', 'max_ms', 'consultas'}
+            )
+            self.assertFalse(Appointment.objects.exists())
+
+            # Una base con cero consultas fuerza una regresión
+            for medicion in resultado['metodos'].values():
+                medicion['consultas'] = 0
+            with open(salida, 'w', encoding='utf-8') as archivo:
+                json.dump(resultado, archivo)
+            with self.assertRaises(CommandError):
+                call_command('benchmark_statistics', rows=200, days=10, repeat=2, baseline=salida, stdout=StringIO())
+
+
 class DashboardViewTestCase(TestCase):
     """Tests para dashboard view"""
     
@@ -310,3 +1424,45 @@ class IntegrationTestCase(TestCase):
         # Verificar que hay datos
         self.assertEqual(data['metricas']['ttlpacientes'], 1)
         self.assertEqual(data['metricas']['ttlsesiones'], 1)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Los planes se leen con EXPLAIN QUERY PLAN de SQLite')
+class IndicesConsultasTestCase(TestCase):
+    """Tests que las consultas de StatisticsService usan índices de Appointment"""
+
+    @classmethod
+    def setUpTestData(cls):
+        benchmark.generar_citas(500, dias=60)
+
+    def assertUsaIndice(self, funcion):
+        planes = benchmark.planes_consultas(funcion)
+        self.assertTrue(planes)
+        for sql, pasos in planes:
+            if Appointment._meta.db_table not in sql:
+                continue
+            self.assertEqual(benchmark.recorridos_completos(pasos), [], f"{sql}\n{pasos}")
+            self.assertTrue(
+                any(paso.startswith(f"SEARCH {Appointment._meta.db_table} USING") for paso in pasos),
+                f"{sql}\n{pasos}"
+            )
+
+    def test_metodos_de_estadisticas(self):
+        """Test que cada método get_* busca las citas por índice, sin recorrer la tabla"""
+        start, end = date(2024, 1, 10), date(2024, 1, 20)
+        service = StatisticsService()
+        casos = dict(
+            benchmark.casos(start, end),
+            get_statistics_legacy=lambda: service.get_statistics_legacy(start, end),
+            get_statistics_por_periodos=lambda: service.get_statistics_por_periodos([(start, end), (date(2024, 2, 1), date(2024, 2, 5))]),
+            get_serie_temporal=lambda: service.get_serie_temporal(start, end),
+        )
+        for nombre, funcion in casos.items():
+            with self.subTest(nombre):
+                self.assertUsaIndice(funcion)
+
+    def test_indices_parciales_solo_citas_activas(self):
+        """Test que las consultas de citas activas usan los índices parciales (deleted_at IS NULL)"""
+        _, pasos = benchmark.planes_consultas(
+            lambda: StatisticsService().get_tipos_de_pago(date(2024, 1, 10), date(2024, 1, 20))
+        )[0]
+        self.assertTrue(any('appt_activa_' in paso for paso in pasos), pasos)
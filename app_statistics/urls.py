@@ -1,5 +1,5 @@
 from rest_framework.routers import DefaultRouter
-from app_statistics.views import StatisticsViewSet, dashboard_view
+from app_statistics.views import StatisticsViewSet, dashboard_view, statistics_async_view
 from django.urls import path, include
 
 router = DefaultRouter()
@@ -7,6 +7,7 @@ router.register(r'', StatisticsViewSet, basename='statistics')
 
 urlpatterns = [
     path('dashboard/', dashboard_view, name='statistics_dashboard'),
+    path('metricas-async/', statistics_async_view, name='statistics_async'),
     path('',include(router.urls)),
 ]
 
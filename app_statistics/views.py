@@ -2,51 +2,239 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from datetime import datetime
-from .services import StatisticsService
+from django.core.exceptions import ImproperlyConfigured
+import json
+from django.http import JsonResponse, StreamingHttpResponse
+from .services import StatisticsService, StatisticsCache, GRANULARIDADES, SERIES
 from .serializers import StatisticsResource
+from .snapshot import AGRUPACIONES, get_snapshot
 from django.shortcuts import render
+from django.utils.decorators import method_decorator
+from reports.services.conditional import condicional, rango_fechas, validadores
+
+
+def validar_rango(start, end):
+    """
+    Valida los parámetros 'start' y 'end' (YYYY-MM-DD).
+    Retorna (start_date, end_date, error); error es None si el rango es válido.
+    """
+    if not start or not end:
+        return None, None, "Parámetros 'start' y 'end' son requeridos."
+
+    try:
+        start_date = datetime.strptime(start, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end, '%Y-%m-%d').date()
+    except ValueError:
+        return None, None, "Formato de fecha inválido. Use YYYY-MM-DD."
+
+    if start_date > end_date:
+        return None, None, "La fecha de inicio no puede ser mayor que la fecha de fin."
+
+    return start_date, end_date, None
+
+
+def validadores_estadisticas(start, end):
+    """
+    ETag y Last-Modified de las estadísticas del rango. Con STATISTICS_CACHE_ENABLED
+    se cachean junto a los resultados y las señales de Appointment los invalidan igual,
+    así una respuesta cacheada no consulta la base de datos.
+    """
+    return StatisticsCache.get_or_set(start, end, lambda: validadores(start, end), variante="validadores")
+
+
+# Máximo de periodos de comparación por solicitud
+MAX_PERIODOS_COMPARACION = 4
+
 
 class StatisticsViewSet(viewsets.ViewSet):
     @action(detail=False, methods=["get"], url_path="metricas")
+    @method_decorator(condicional(rango_fechas("start", "end"), calcular_validadores=validadores_estadisticas))
     def get_statistics(self, request):
-        start = request.query_params.get("start")
-        end = request.query_params.get("end")
+        start_date, end_date, error = validar_rango(
+            request.query_params.get("start"),
+            request.query_params.get("end")
+        )
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
 
-        if not start or not end:
+        # approx=true: pacientes distintos estimados con HyperLogLog (con margen de error)
+        aproximado = request.query_params.get("approx", "").lower() in ("true", "1")
+
+        try:
+            service = StatisticsService()
+            data = StatisticsCache.get_or_set(
+                start_date, end_date,
+                lambda: service.get_statistics(start_date, end_date, aproximado=aproximado),
+                variante="aprox" if aproximado else ""
+            )
+            
+            serializer = StatisticsResource(data)
+            return Response(serializer.data, status=status.HTTP_200_OK)
+            
+        except Exception as e:
+            return Response(
+                {"error": f"Error interno del servidor: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    @action(detail=False, methods=["get"], url_path="comparar")
+    def get_comparacion(self, request):
+        """
+        Estadísticas del rango start-end comparadas con otros periodos.
+        Parámetros: start, end y periodos=YYYY-MM-DD:YYYY-MM-DD,... (máximo
+        MAX_PERIODOS_COMPARACION). Todos los periodos se calculan con una sola consulta
+        y cada comparación incluye la variación absoluta y porcentual por sección.
+        """
+        start_date, end_date, error = validar_rango(
+            request.query_params.get("start"),
+            request.query_params.get("end")
+        )
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+        periodos = []
+        for texto in filter(None, request.query_params.get("periodos", "").split(",")):
+            inicio, _, fin = texto.partition(":")
+            p_start, p_end, error = validar_rango(inicio.strip(), fin.strip())
+            if error:
+                return Response({"error": f"Periodo '{texto}' inválido: {error}"}, status=status.HTTP_400_BAD_REQUEST)
+            periodos.append((p_start, p_end))
+
+        if not periodos:
+            return Response({"error": "Parámetro 'periodos' es requerido."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(periodos) > MAX_PERIODOS_COMPARACION:
             return Response(
-                {"error": "Parámetros 'start' y 'end' son requeridos."},
+                {"error": f"Se permiten como máximo {MAX_PERIODOS_COMPARACION} periodos."},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Validar formato de fechas
-        try:
-            start_date = datetime.strptime(start, '%Y-%m-%d').date()
-            end_date = datetime.strptime(end, '%Y-%m-%d').date()
-            
-            if start_date > end_date:
+        service = StatisticsService()
+        principal, *resultados = service.get_statistics_por_periodos([(start_date, end_date)] + periodos)
+
+        data = {
+            "principal": StatisticsResource(principal).data,
+            "comparaciones": [
+                {
+                    "start": p_start.isoformat(),
+                    "end": p_end.isoformat(),
+                    "datos": StatisticsResource(resultado).data,
+                    "deltas": service.comparar_periodos(principal, resultado),
+                }
+                for (p_start, p_end), resultado in zip(periodos, resultados)
+            ],
+        }
+        return Response(data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=["get"], url_path="adhoc")
+    def get_adhoc(self, request):
+        """
+        Estadísticas ad-hoc desde el snapshot columnar en memoria (requiere NumPy).
+        Parámetros: start, end, group_by opcional y filtros opcionales por
+        therapist, payment_type, appointment_status, patient, room y appointment_type.
+        """
+        start_date, end_date, error = validar_rango(
+            request.query_params.get("start"),
+            request.query_params.get("end")
+        )
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+        group_by = request.query_params.get("group_by")
+        if group_by and group_by not in AGRUPACIONES:
+            return Response(
+                {"error": f"group_by inválido. Opciones: {', '.join(AGRUPACIONES)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        filtros = {}
+        for nombre in ("therapist", "payment_type", "appointment_status", "patient", "room", "appointment_type"):
+            valor = request.query_params.get(nombre)
+            if valor is None:
+                continue
+            if nombre != "appointment_type" and not valor.lstrip("-").isdigit():
                 return Response(
-                    {"error": "La fecha de inicio no puede ser mayor que la fecha de fin."},
+                    {"error": f"El filtro '{nombre}' debe ser numérico."},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-                
-        except ValueError:
+            filtros[nombre] = valor
+
+        try:
+            snapshot = get_snapshot()
+        except ImproperlyConfigured as e:
+            return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        resumen = snapshot.resumen(start_date, end_date, **filtros)
+        data = {
+            "metricas": {
+                "ttlpacientes": resumen["ttlpacientes"],
+                "ttlsesiones": resumen["ttlsesiones"],
+                "ttlganancias": float(resumen["ttlganancias"]) if resumen["ttlganancias"] is not None else None,
+            },
+        }
+        if group_by:
+            data["grupos"] = snapshot.agrupar(group_by, start_date, end_date, **filtros)
+        return Response(data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=["get"], url_path="serie-temporal")
+    def get_serie_temporal(self, request):
+        """
+        Serie temporal de sesiones, ingresos y pacientes distintos.
+        Parámetros: start, end, granularidad (day, week, month) y serie opcional
+        (therapist, payment_type). La respuesta JSON se envía por partes.
+        """
+        start_date, end_date, error = validar_rango(
+            request.query_params.get("start"),
+            request.query_params.get("end")
+        )
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+        granularidad = request.query_params.get("granularidad", "day")
+        if granularidad not in GRANULARIDADES:
             return Response(
-                {"error": "Formato de fecha inválido. Use YYYY-MM-DD."},
+                {"error": f"granularidad inválida. Opciones: {', '.join(GRANULARIDADES)}."},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        try:
-            service = StatisticsService()
-            data = service.get_statistics(start_date, end_date)
-            
-            serializer = StatisticsResource(data)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-            
-        except Exception as e:
+        serie = request.query_params.get("serie") or None
+        if serie and serie not in SERIES:
             return Response(
-                {"error": f"Error interno del servidor: {str(e)}"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {"error": f"serie inválida. Opciones: {', '.join(SERIES)}."},
+                status=status.HTTP_400_BAD_REQUEST
             )
+
+        buckets = StatisticsService().get_serie_temporal(start_date, end_date, granularidad, serie)
+        cabecera = {"granularidad": granularidad, "serie": serie}
+
+        def generar():
+            yield json.dumps(cabecera)[:-1] + ', "buckets": ['
+            for i, bucket in enumerate(buckets):
+                yield ("," if i else "") + json.dumps(bucket)
+            yield "]}"
+
+        return StreamingHttpResponse(generar(), content_type="application/json")
+
+
+async def statistics_async_view(request):
+    """
+    Variante asíncrona de /statistics/metricas/: las secciones se calculan en
+    paralelo (ver StatisticsService.aget_statistics). Pensada para servirse con ASGI.
+    """
+    start_date, end_date, error = validar_rango(request.GET.get("start"), request.GET.get("end"))
+    if error:
+        return JsonResponse({"error": error}, status=400)
+
+    try:
+        service = StatisticsService()
+        data = await StatisticsCache.aget_or_set(
+            start_date, end_date,
+            lambda: service.aget_statistics(start_date, end_date)
+        )
+        return JsonResponse(StatisticsResource(data).data)
+
+    except Exception as e:
+        return JsonResponse({"error": f"Error interno del servidor: {str(e)}"}, status=500)
+
         
 def dashboard_view(request):
     return render(request, 'dashboard.html')     
@@ -2,7 +2,23 @@ from django.contrib import admin
 from .models import Appointment, Therapist, PaymentType, Patient
 
 admin.site.register(Therapist)
-admin.site.register(Appointment)
 admin.site.register(PaymentType)
 admin.site.register(Patient)
 
+
+@admin.register(Appointment)
+class AppointmentAdmin(admin.ModelAdmin):
+    list_display = ("id", "appointment_date", "appointment_hour", "therapist", "patient", "deleted_at")
+    list_filter = (("deleted_at", admin.EmptyFieldListFilter),)
+    actions = ["restaurar"]
+
+    def get_queryset(self, request):
+        # Incluye las citas eliminadas lógicamente para poder restaurarlas
+        return Appointment.objects.with_deleted()
+
+    @admin.action(description="Restaurar citas eliminadas")
+    def restaurar(self, request, queryset):
+        # save() por cita para que se disparen las señales (resumen, caché, cierres)
+        for cita in queryset.filter(deleted_at__isnull=False):
+            cita.deleted_at = None
+            cita.save(update_fields=["deleted_at"])
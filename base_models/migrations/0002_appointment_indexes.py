@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-17 20:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base_models', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['appointment_date', 'therapist'], name='appt_fecha_terapeuta_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['appointment_date', 'payment_type'], name='appt_fecha_tipo_pago_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['appointment_date', 'appointment_hour'], name='appt_fecha_hora_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['appointment_date', 'therapist'], name='appt_activa_terapeuta_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['appointment_date', 'payment_type'], name='appt_activa_tipo_pago_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-17 20:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base_models', '0002_appointment_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['appointment_date', 'appointment_hour'], name='appt_activa_fecha_hora_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.5 on 2026-10-17 20:20
+
+import django.db.models.manager
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base_models', '0003_appointment_active_manager'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='appointment',
+            managers=[
+                ('all_objects', django.db.models.manager.Manager()),
+            ],
+        ),
+    ]
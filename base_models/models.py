@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 
 # Tablas mínimas para las llaves foráneas
@@ -73,6 +74,25 @@ class Therapist(models.Model):
 
 # Tabla Appointment
 
+class AppointmentQuerySet(models.QuerySet):
+    def activas(self):
+        return self.filter(deleted_at__isnull=True)
+
+
+class AppointmentManager(models.Manager.from_queryset(AppointmentQuerySet)):
+    """
+    Manager por defecto de Appointment: solo citas activas (deleted_at IS NULL),
+    el mismo predicado de los índices parciales. with_deleted() incluye las
+    citas eliminadas lógicamente.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().activas()
+
+    def with_deleted(self):
+        return super().get_queryset()
+
+
 class Appointment(models.Model):
     appointment_date = models.DateField(null=True, blank=True)
     appointment_hour = models.TimeField(null=True, blank=True)
@@ -99,7 +119,50 @@ class Appointment(models.Model):
     created_at = models.DateTimeField(null=True, blank=True)
     updated_at = models.DateTimeField(null=True, blank=True)
     deleted_at = models.DateTimeField(null=True, blank=True)
-    
+
+    # all_objects va primero y es el manager por defecto: dumpdata, el admin y las
+    # relaciones inversas (therapist.appointments) ven también las citas eliminadas.
+    # Los servicios usan Appointment.objects, que excluye las eliminadas;
+    # Appointment.objects.with_deleted() las incluye.
+    all_objects = models.Manager()
+    objects = AppointmentManager()
+
+    class Meta:
+        # Los reportes y las estadísticas filtran por fecha (Appointment.objects ya agrega
+        # deleted_at IS NULL) y agrupan por terapeuta o tipo de pago. Los índices parciales
+        # solo incluyen citas activas.
+        indexes = [
+            models.Index(fields=['appointment_date', 'therapist'], name='appt_fecha_terapeuta_idx'),
+            models.Index(fields=['appointment_date', 'payment_type'], name='appt_fecha_tipo_pago_idx'),
+            models.Index(fields=['appointment_date', 'appointment_hour'], name='appt_fecha_hora_idx'),
+            models.Index(
+                fields=['appointment_date', 'therapist'], name='appt_activa_terapeuta_idx',
+                condition=models.Q(deleted_at__isnull=True)
+            ),
+            models.Index(
+                fields=['appointment_date', 'payment_type'], name='appt_activa_tipo_pago_idx',
+                condition=models.Q(deleted_at__isnull=True)
+            ),
+            models.Index(
+                fields=['appointment_date', 'appointment_hour'], name='appt_activa_fecha_hora_idx',
+                condition=models.Q(deleted_at__isnull=True)
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Toda edición renueva updated_at: los validadores de los reportes, la huella de
+        # PDFCache y el refresco del snapshot detectan los cambios por este campo
+        self.updated_at = timezone.now()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "updated_at" not in update_fields:
+            kwargs["update_fields"] = [*update_fields, "updated_at"]
+        super().save(*args, **kwargs)
+
+    def soft_delete(self):
+        # Eliminación lógica: guarda con save() para que se disparen las señales
+        self.deleted_at = timezone.now()
+        self.save(update_fields=["deleted_at"])
+
     def __str__(self):
         patient_name = self.patient.name if self.patient else "No patient"
         return f"Appointment #{self.id} - {patient_name} - {self.appointment_date}"
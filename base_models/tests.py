@@ -1,3 +1,74 @@
-from django.test import TestCase
+import json
+from io import StringIO
+from django.contrib.admin.sites import site
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, RequestFactory
+from .models import Appointment, Therapist
 
-# Create your tests here.
+
+class AppointmentManagerTest(TestCase):
+    """
+    Pruebas del manager de Appointment que excluye las citas eliminadas.
+    """
+
+    def setUp(self):
+        """
+        Crear una cita activa y una eliminada lógicamente.
+        """
+        self.therapist = Therapist.objects.create(name="Juan")
+        self.activa = Appointment.objects.create(therapist=self.therapist)
+        self.eliminada = Appointment.objects.create(therapist=self.therapist)
+        self.eliminada.soft_delete()
+
+    def test_objects_solo_activas(self):
+        """
+        Verifica que Appointment.objects solo ve citas activas.
+        """
+        self.assertEqual(list(Appointment.objects.all()), [self.activa])
+        self.assertFalse(Appointment.objects.filter(pk=self.eliminada.pk).exists())
+
+    def test_manager_por_defecto_incluye_eliminadas(self):
+        """
+        Verifica que el manager por defecto (dumpdata, relaciones inversas) no pierde citas eliminadas.
+        """
+        self.assertIs(Appointment._default_manager, Appointment.all_objects)
+        self.assertEqual(self.therapist.appointments.count(), 2)
+
+        salida = StringIO()
+        call_command('dumpdata', 'base_models.Appointment', stdout=salida)
+        self.assertEqual(sorted(fila['pk'] for fila in json.loads(salida.getvalue())), [self.activa.pk, self.eliminada.pk])
+
+    def test_admin_lista_y_restaura_eliminadas(self):
+        """
+        Verifica que el admin lista las citas eliminadas y la acción restaurar las reactiva.
+        """
+        modelo_admin = site._registry[Appointment]
+        request = RequestFactory().get('/admin/base_models/appointment/')
+        request.user = User.objects.create_superuser('admin', 'admin@example.com', 'clave')
+        self.assertEqual(modelo_admin.get_queryset(request).count(), 2)
+
+        modelo_admin.restaurar(request, modelo_admin.get_queryset(request))
+        self.assertEqual(Appointment.objects.count(), 2)
+
+    def test_with_deleted(self):
+        """
+        Verifica que with_deleted() incluye las citas eliminadas y se puede seguir filtrando.
+        """
+        self.assertEqual(Appointment.objects.with_deleted().count(), 2)
+        self.assertEqual(
+            list(Appointment.objects.with_deleted().filter(deleted_at__isnull=False)),
+            [self.eliminada]
+        )
+        self.assertEqual(list(Appointment.objects.with_deleted().activas()), [self.activa])
+
+    def test_guardar_cita_eliminada(self):
+        """
+        Verifica que una cita eliminada se puede seguir editando y restaurando.
+        """
+        self.eliminada.observation = "Editada"
+        self.eliminada.save()
+        self.eliminada.deleted_at = None
+        self.eliminada.save()
+        self.assertEqual(Appointment.objects.count(), 2)
+        self.assertEqual(Appointment.objects.get(pk=self.eliminada.pk).observation, "Editada")
@@ -162,4 +162,51 @@ REST_FRAMEWORK = {
 # CSRF settings para formularios AJAX
 CSRF_COOKIE_HTTPONLY = False
 CSRF_USE_SESSIONS = False
-CSRF_COOKIE_NAME = 'csrftoken'
\ No newline at end of file
+CSRF_COOKIE_NAME = 'csrftoken'
+
+# Estadísticas
+# Calcula el dashboard con una sola consulta agrupada en lugar de una por sección
+STATISTICS_SINGLE_PASS = False
+# Calcula ambos caminos, registra diferencias y responde con el legacy
+STATISTICS_VERIFY_SINGLE_PASS = False
+# Lee estadísticas y caja diaria desde AppointmentDailyRollup
+# (reconstruir el histórico con: python manage.py rebuild_rollup)
+APPOINTMENT_ROLLUP_ENABLED = False
+# Mantiene los sketches HyperLogLog diarios de approx=true en /statistics/metricas/.
+# El resumen y los sketches solo se actualizan al guardar citas si este flag o
+# APPOINTMENT_ROLLUP_ENABLED están activos; al activarlos, correr rebuild_rollup
+STATISTICS_APPROX_ENABLED = False
+# Caché de /statistics/metricas/ por rango de fechas. Se invalida con las señales de
+# Appointment, así que solo debe activarse si las citas se escriben desde esta aplicación.
+# Requiere una caché compartida entre procesos en CACHES (Redis, Memcached o base de
+# datos); con la LocMemCache por defecto cada proceso invalida solo su copia
+# (chequeo app_statistics.W001)
+STATISTICS_CACHE_ENABLED = False
+STATISTICS_CACHE_TTL_PAST = 7 * 24 * 60 * 60  # Rangos que terminaron antes de hoy
+STATISTICS_CACHE_TTL_CURRENT = 60  # Rangos que incluyen hoy
+# Secciones que /statistics/metricas-async/ consulta en paralelo (una conexión por hilo)
+STATISTICS_ASYNC_CONCURRENCY = 3
+# Segundos antes de refrescar el snapshot columnar de /statistics/adhoc/ (requiere NumPy)
+STATISTICS_SNAPSHOT_MAX_AGE = 60
+# Índice Fenwick en memoria para sesiones e ingresos por rango (por proceso)
+STATISTICS_RANGE_INDEX_ENABLED = False
+# Segundos entre verificaciones del índice contra la tabla de citas: se reconstruye si
+# cambió, por ejemplo por escrituras de otros procesos
+STATISTICS_RANGE_INDEX_MAX_AGE = 60
+
+# Reportes
+# Caché en disco de los PDF de reportes por tipo, fecha y huella de las citas del día
+REPORTS_PDF_CACHE_ENABLED = False
+REPORTS_PDF_CACHE_DIR = BASE_DIR / 'pdf_cache'
+REPORTS_PDF_CACHE_MAX_BYTES = 100 * 1024 * 1024  # Al superarlo se eliminan los PDF usados hace más tiempo
+# Motor de render por reporte PDF: "xhtml2pdf" (plantilla HTML) o "reportlab" (directo)
+# Se puede forzar por petición con ?engine=
+REPORTS_PDF_ENGINES = {
+    "citas_terapeuta": "xhtml2pdf",
+    "pacientes_terapeuta": "xhtml2pdf",
+    "resumen_caja": "xhtml2pdf",
+}
+# Procesos para renderizar en paralelo los PDF de /reports/pdf/paquete/
+# (None = uno por núcleo, 0 = en el mismo proceso de la petición; como máximo
+# pdf_bundle.MAX_PROCESOS_PAQUETE por proceso web)
+REPORTS_PDF_BUNDLE_PROCESSES = None
@@ -0,0 +1,53 @@
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from app_statistics.benchmark import generar_citas
+from reports.services.export_service import escribir_excel_citas
+from reports.services.report_service import ReportService
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide el tiempo y el pico de memoria de la exportación a Excel de citas "
+        "con una carga sintética. Los datos generados se descartan al terminar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000, help="Citas sintéticas a generar (por defecto 1000000)")
+        parser.add_argument("--seed", type=int, default=42, help="Semilla del generador")
+        parser.add_argument("--days", type=int, default=365, help="Días que abarca la carga")
+
+    def handle(self, *args, **options):
+        if options["rows"] < 1 or options["days"] < 1:
+            raise CommandError("--rows y --days deben ser mayores a 0.")
+
+        start = date(2024, 1, 1)
+        end = start + timedelta(days=options["days"] - 1)
+
+        with transaction.atomic():
+            self.stdout.write(f"Generando {options['rows']} citas...")
+            generar_citas(options["rows"], options["seed"], start, options["days"])
+
+            filas = ReportService().iter_appointments_between_dates(start.isoformat(), end.isoformat())
+            with tempfile.TemporaryDirectory() as carpeta:
+                ruta = os.path.join(carpeta, "citas.xlsx")
+
+                tracemalloc.start()
+                inicio = time.perf_counter()
+                total = escribir_excel_citas(filas, ruta)
+                segundos = time.perf_counter() - inicio
+                _, pico = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                tamanio = os.path.getsize(ruta)
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"Filas exportadas: {total}")
+        self.stdout.write(f"Tiempo: {segundos:.2f} s")
+        self.stdout.write(f"Tamaño del archivo: {tamanio / 1024 / 1024:.1f} MB")
+        self.stdout.write(self.style.SUCCESS(f"Pico de memoria (tracemalloc): {pico / 1024 / 1024:.1f} MB"))
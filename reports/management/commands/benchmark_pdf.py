@@ -0,0 +1,74 @@
+import io
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand, CommandError
+from reports.services.pdf_service import MOTORES_PDF, REPORTES_PDF, renderizar_contexto
+
+
+def contexto_sintetico(tipo, terapeutas, pacientes):
+    """Contexto con el formato de pdf_service para terapeutas x pacientes filas, sin base de datos."""
+    base = {"date": "2024-01-15", "title": tipo}
+    if tipo == "pacientes_terapeuta":
+        data = [
+            {
+                "therapist_id": t,
+                "therapist": f"Terapeuta Apellido {t}",
+                "patients": [
+                    {"patient_id": p, "patient": f"Paciente Apellido Materno {t}-{p}", "appointments": 1 + p % 3}
+                    for p in range(pacientes)
+                ],
+            }
+            for t in range(terapeutas)
+        ]
+        return dict(base, data=data)
+    if tipo == "citas_terapeuta":
+        filas = [
+            {"id": t, "name": "Nombre", "paternal_lastname": f"Apellido {t}", "maternal_lastname": "Materno",
+             "appointments_count": pacientes, "percentage": 100 / terapeutas}
+            for t in range(terapeutas)
+        ]
+        return dict(base, data={"therapists_appointments": filas, "total_appointments_count": terapeutas * pacientes})
+    data = [{"payment_type": f"Tipo {t}", "total_payment": 10.0 * t} for t in range(terapeutas)]
+    return dict(base, data=data, total=sum(item["total_payment"] for item in data))
+
+
+class Command(BaseCommand):
+    help = "Compara tiempo y pico de memoria de los motores de PDF (xhtml2pdf y reportlab) con datos sintéticos."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--report", default="pacientes_terapeuta", choices=list(REPORTES_PDF))
+        parser.add_argument("--therapists", type=int, default=10, help="Terapeutas (filas de grupo)")
+        parser.add_argument("--patients", type=int, default=50, help="Pacientes por terapeuta")
+        parser.add_argument("--repeat", type=int, default=3, help="Repeticiones por motor")
+
+    def handle(self, *args, **options):
+        if options["therapists"] < 1 or options["patients"] < 1 or options["repeat"] < 1:
+            raise CommandError("--therapists, --patients y --repeat deben ser mayores a 0.")
+
+        tipo = options["report"]
+        context = contexto_sintetico(tipo, options["therapists"], options["patients"])
+        self.stdout.write(f"Reporte {tipo}: {options['therapists']} terapeutas x {options['patients']} pacientes")
+
+        resultados = {}
+        for motor in MOTORES_PDF:
+            tiempos = []
+            for _ in range(options["repeat"]):
+                inicio = time.perf_counter()
+                salida = renderizar_contexto(tipo, context, io.BytesIO(), motor)
+                tiempos.append(time.perf_counter() - inicio)
+
+            tracemalloc.start()
+            renderizar_contexto(tipo, context, io.BytesIO(), motor)
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            resultados[motor] = (min(tiempos), pico)
+            self.stdout.write(
+                f"{motor:<10} mejor tiempo {min(tiempos) * 1000:>9.1f} ms  "
+                f"pico de memoria {pico / 1024 / 1024:>7.1f} MB  tamaño {len(salida.getvalue()) / 1024:>7.1f} KB"
+            )
+
+        (t_html, m_html), (t_rl, m_rl) = resultados["xhtml2pdf"], resultados["reportlab"]
+        self.stdout.write(self.style.SUCCESS(
+            f"reportlab: {t_html / t_rl:.1f}x más rápido, {m_html / m_rl:.1f}x menos memoria"
+        ))
@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import localtime
+from reports.services.cash_closure import cerrar_dia, verificar_cierres
+
+
+class Command(BaseCommand):
+    help = (
+        "Cierra la caja de una fecha (por defecto ayer) congelando sus totales por tipo de pago. "
+        "Con --verify revisa los cierres existentes y marca los que ya no coinciden con las citas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date", help="Fecha a cerrar YYYY-MM-DD (por defecto ayer)")
+        parser.add_argument("--replace", action="store_true", help="Volver a cerrar una fecha ya cerrada")
+        parser.add_argument("--verify", action="store_true", help="Verificar los cierres en lugar de cerrar una fecha")
+
+    def handle(self, *args, **options):
+        if options["verify"]:
+            marcados = verificar_cierres()
+            for cierre in marcados:
+                self.stdout.write(self.style.WARNING(f"Cierre modificado: {cierre.day.isoformat()}"))
+            self.stdout.write(self.style.SUCCESS(f"Cierres verificados; {len(marcados)} marcados como modificados."))
+            return
+
+        try:
+            dia = (
+                datetime.strptime(options["date"], "%Y-%m-%d").date() if options["date"]
+                else localtime().date() - timedelta(days=1)
+            )
+        except ValueError:
+            raise CommandError("Formato de fecha inválido. Use YYYY-MM-DD.")
+
+        cierre, error = cerrar_dia(dia, reemplazar=options["replace"])
+        if error:
+            raise CommandError(error)
+        self.stdout.write(self.style.SUCCESS(f"Caja del {cierre.day.isoformat()} cerrada: S/. {cierre.total:.2f}"))
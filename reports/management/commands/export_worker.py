@@ -0,0 +1,97 @@
+import multiprocessing
+import django
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from reports.services.export_jobs import (
+    TIMEOUT_JOB, reclamar_pendientes, ejecutar_job, marcar_error, reencolar_vencidos,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Ejecuta las exportaciones pendientes (ExportJob) en un pool de procesos. "
+        "Con --processes 0 las ejecuta en este mismo proceso, una a la vez."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=os.cpu_count() or 1,
+                            help="Procesos del pool (por defecto, uno por núcleo)")
+        parser.add_argument("--poll", type=float, default=2.0, help="Segundos entre consultas de trabajos pendientes")
+        parser.add_argument("--once", action="store_true", help="Procesar los trabajos pendientes y terminar")
+        parser.add_argument("--timeout", type=int, default=TIMEOUT_JOB,
+                            help="Segundos en proceso tras los cuales un trabajo abandonado vuelve a la cola")
+
+    def handle(self, *args, **options):
+        procesos = options["processes"]
+        if procesos < 0:
+            raise CommandError("--processes no puede ser negativo.")
+
+        reencolados = reencolar_vencidos(options["timeout"])
+        if reencolados:
+            self.stdout.write(f"{reencolados} exportaciones abandonadas vuelven a la cola")
+
+        if procesos == 0:
+            self._ejecutar_en_linea(options)
+            return
+
+        # spawn: cada proceso inicia su propio Django (django.setup) y sus propias conexiones
+        contexto = multiprocessing.get_context("spawn")
+        connections.close_all()
+        pool = ProcessPoolExecutor(max_workers=procesos, mp_context=contexto, initializer=django.setup)
+        en_curso = {}
+        try:
+            while True:
+                libres = procesos - len(en_curso)
+                if libres:
+                    reencolar_vencidos(options["timeout"], excluir=en_curso.values())
+                    for job_id in reclamar_pendientes(libres):
+                        self.stdout.write(f"Exportación {job_id} iniciada")
+                        en_curso[pool.submit(ejecutar_job, job_id)] = job_id
+
+                if not en_curso:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll"])
+                    continue
+
+                terminados, _ = wait(en_curso, timeout=options["poll"], return_when=FIRST_COMPLETED)
+                roto = False
+                for futuro in terminados:
+                    roto |= isinstance(self._terminar(futuro, en_curso.pop(futuro)), BrokenProcessPool)
+
+                if roto:
+                    # Un proceso murió: el pool ya no acepta trabajos y sus futuros fallan
+                    for futuro, job_id in en_curso.items():
+                        self._terminar(futuro, job_id)
+                    en_curso = {}
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = ProcessPoolExecutor(max_workers=procesos, mp_context=contexto, initializer=django.setup)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _terminar(self, futuro, job_id):
+        """
+        Registra el resultado de un trabajo. Si el futuro falló (ej. murió el proceso),
+        el trabajo se marca con error en lugar de quedar en proceso. Retorna la excepción o None.
+        """
+        try:
+            self.stdout.write(f"Exportación {futuro.result(timeout=0)} terminada")
+            return None
+        except Exception as e:
+            self.stderr.write(f"Error en el proceso de exportación {job_id}: {e!r}")
+            marcar_error(job_id, f"El proceso de exportación terminó de forma inesperada: {e!r}")
+            return e
+
+    def _ejecutar_en_linea(self, options):
+        while True:
+            reclamados = reclamar_pendientes(1)
+            if not reclamados:
+                if options["once"]:
+                    break
+                time.sleep(options["poll"])
+                continue
+            self.stdout.write(f"Exportación {ejecutar_job(reclamados[0])} terminada")
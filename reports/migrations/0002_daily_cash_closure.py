@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-17 19:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCashClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('lineas', models.JSONField(default=list)),
+                ('total', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('closed_at', models.DateTimeField(auto_now_add=True)),
+                ('modificado', models.BooleanField(default=False)),
+                ('modificado_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -40,4 +40,56 @@ class Appointment(models.Model):
 
     def __str__(self):
         return f"Cita {self.appointment_date} {self.appointment_hour} - {self.patient}"
-'''
\ No newline at end of file
+'''
+from django.db import models
+
+
+class ExportJob(models.Model):
+    # Exportación ejecutada en segundo plano por el comando export_worker
+    PENDIENTE = "pendiente"
+    EN_PROCESO = "en_proceso"
+    COMPLETADO = "completado"
+    ERROR = "error"
+    ESTADOS = [
+        (PENDIENTE, "Pendiente"),
+        (EN_PROCESO, "En proceso"),
+        (COMPLETADO, "Completado"),
+        (ERROR, "Error"),
+    ]
+
+    tipo = models.CharField(max_length=50)  # Formato de citas (citas_xlsx, ...) o reporte PDF (pdf_resumen_caja, ...)
+    parametros = models.JSONField(default=dict)  # Parámetros GET del reporte (date, start_date, end_date)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default=PENDIENTE)
+    progreso = models.PositiveSmallIntegerField(default=0)  # Porcentaje de avance (0 a 100)
+    archivo = models.CharField(max_length=255, blank=True)  # Ruta relativa a MEDIA_ROOT del archivo generado
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["estado", "created_at"], name="exportjob_estado_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} #{self.pk} ({self.estado})"
+
+
+class DailyCashClosure(models.Model):
+    # Cierre de caja de un día: totales por tipo de pago congelados al cerrar.
+    # Es inmutable; solo se actualiza la marca de modificación (ver services/cash_closure.py)
+    day = models.DateField(unique=True)
+    lineas = models.JSONField(default=list)  # [{"payment_type", "total_payment"}] en el orden del reporte; montos como texto
+    total = models.DecimalField(max_digits=14, decimal_places=2)
+    closed_at = models.DateTimeField(auto_now_add=True)
+    modificado = models.BooleanField(default=False)  # Las citas del día cambiaron después del cierre
+    modificado_at = models.DateTimeField(null=True, blank=True)
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Un cierre de caja no se puede modificar.")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"Cierre de caja {self.day}{' (modificado)' if self.modificado else ''}"
@@ -0,0 +1,111 @@
+"""
+Cierre de caja diario.
+
+Al cerrar un día se congelan en DailyCashClosure sus totales por tipo de pago.
+Desde entonces daily-cash y pdf/resumen-caja de esa fecha leen el cierre en
+lugar de agregar las citas, y el resumen de caja por rango solo agrega los días
+que siguen abiertos.
+
+El cierre no se modifica. Si después se crean, editan o eliminan citas del día
+y los totales dejan de coincidir, las señales de Appointment lo marcan como
+modificado (ver reports/signals.py). verificar_cierres hace la misma comprobación
+para cambios que no pasan por las señales (ej. QuerySet.update).
+"""
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.timezone import localtime
+from reports.models import DailyCashClosure
+from .report_service import ReportService
+
+# Error de cerrar_dia cuando la fecha ya tiene cierre
+CAJA_YA_CERRADA = "La caja de esa fecha ya está cerrada."
+
+
+def _lineas_congeladas(dia):
+    # Montos como texto para conservar los decimales exactos en el JSON. Se leen de
+    # las citas y no del resumen diario: las señales verifican los cierres antes de
+    # que el resumen se reconstruya en on_commit
+    return [
+        {"payment_type": linea["payment_type"], "total_payment": str(linea["total_payment"])}
+        for linea in ReportService().totales_caja(dia, desde_citas=True)
+    ]
+
+
+def cierre_json(cierre):
+    """Representación JSON de un cierre."""
+    return {
+        "date": cierre.day.isoformat(),
+        "payments": [
+            {"payment_type": linea["payment_type"], "total_payment": float(linea["total_payment"])}
+            for linea in cierre.lineas
+        ],
+        "total": float(cierre.total),
+        "closed_at": cierre.closed_at.isoformat() if cierre.closed_at else None,
+        "modified": cierre.modificado,
+        "modified_at": cierre.modificado_at.isoformat() if cierre.modificado_at else None,
+    }
+
+
+def cerrar_dia(dia, reemplazar=False):
+    """
+    Congela los totales de caja de dia (date o "YYYY-MM-DD"). Retorna (cierre, error);
+    error es None si el día se cerró. Un día ya cerrado solo se vuelve a cerrar con
+    reemplazar=True, que descarta el cierre anterior.
+    """
+    if not isinstance(dia, date):
+        try:
+            dia = datetime.strptime(str(dia), "%Y-%m-%d").date()
+        except ValueError:
+            return None, "Formato de fecha inválido. Use YYYY-MM-DD."
+    if dia > localtime().date():
+        return None, "No se puede cerrar la caja de una fecha futura."
+
+    try:
+        with transaction.atomic():
+            if reemplazar:
+                DailyCashClosure.objects.filter(day=dia).delete()
+            lineas = _lineas_congeladas(dia)
+            cierre = DailyCashClosure.objects.create(
+                day=dia,
+                lineas=lineas,
+                total=sum((Decimal(linea["total_payment"]) for linea in lineas), Decimal("0")),
+            )
+    except IntegrityError:
+        return None, CAJA_YA_CERRADA
+    return cierre, None
+
+
+def verificar_cierre(cierre):
+    """
+    Compara el cierre con los totales actuales de las citas y lo marca como
+    modificado si no coinciden. Retorna True si el cierre quedó marcado.
+    """
+    if cierre.modificado:
+        return True
+    if _lineas_congeladas(cierre.day) == cierre.lineas:
+        return False
+
+    cierre.modificado_at = timezone.now()
+    cierre.modificado = True
+    # update() y no save(): el cierre es inmutable salvo por esta marca
+    DailyCashClosure.objects.filter(pk=cierre.pk).update(modificado=True, modificado_at=cierre.modificado_at)
+    return True
+
+
+def verificar_dias(dias):
+    """Verifica los cierres de las fechas indicadas que aún no están marcados."""
+    cierres = DailyCashClosure.objects.filter(day__in=[d for d in dias if d], modificado=False)
+    return [cierre for cierre in cierres if verificar_cierre(cierre)]
+
+
+def verificar_cierres(start=None, end=None):
+    """Verifica todos los cierres (o los del rango) y retorna los que quedaron marcados."""
+    cierres = DailyCashClosure.objects.filter(modificado=False)
+    if start:
+        cierres = cierres.filter(day__gte=start)
+    if end:
+        cierres = cierres.filter(day__lte=end)
+    return [cierre for cierre in cierres if verificar_cierre(cierre)]
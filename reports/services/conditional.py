@@ -0,0 +1,116 @@
+"""
+GET condicional (ETag / Last-Modified) para los endpoints JSON de reportes y estadísticas.
+
+Los validadores salen de un agregado barato sobre las citas del rango de fechas
+(cantidad, eliminadas, máximo id, máximos de created_at/updated_at/deleted_at y
+suma de pagos) y, en los reportes de caja, del estado de los cierres de caja.
+Con If-None-Match o If-Modified-Since vigentes la vista responde 304 sin ejecutar
+la agregación del reporte ni serializar la respuesta.
+
+Appointment.save() renueva updated_at, así que cualquier edición de una cita
+(terapeuta, paciente, tipo de pago, hora...) cambia max_updated_at. Las escrituras
+con QuerySet.update deben actualizar updated_at ellas mismas.
+
+Como en PDFCache, los cambios de nombres de terapeutas, pacientes o tipos de
+pago no alteran los validadores.
+"""
+import hashlib
+from datetime import datetime
+
+from django.db.models import Count, Max, Q, Sum
+from django.utils.timezone import localtime
+from django.views.decorators.http import condition
+from base_models.models import Appointment
+from reports.models import DailyCashClosure
+
+# Campos del resumen de citas que forman el ETag, en orden
+CAMPOS_RESUMEN = ("citas", "eliminadas", "max_id", "max_created_at", "max_updated_at", "max_deleted_at", "pagos")
+
+
+def resumen_citas(start, end):
+    """Agregado de las citas entre start y end (inclusive) que cambia si se crean, editan o eliminan citas."""
+    return Appointment.objects.with_deleted().filter(appointment_date__range=(start, end)).aggregate(
+        citas=Count("id"),
+        eliminadas=Count("id", filter=Q(deleted_at__isnull=False)),
+        max_id=Max("id"),
+        max_created_at=Max("created_at"),
+        max_updated_at=Max("updated_at"),
+        max_deleted_at=Max("deleted_at"),
+        pagos=Sum("payment"),
+    )
+
+
+def validadores(start, end, caja=False):
+    """
+    (etag, last_modified) de las citas entre start y end. Con caja=True también
+    cuentan los cierres de caja del rango, que cambian lo que muestran los reportes de caja.
+    """
+    datos = resumen_citas(start, end)
+    partes = [str(datos[campo]) for campo in CAMPOS_RESUMEN]
+    fechas = [datos["max_created_at"], datos["max_updated_at"], datos["max_deleted_at"]]
+
+    if caja:
+        cierres = DailyCashClosure.objects.filter(day__range=(start, end)).aggregate(
+            cierres=Count("id"),
+            max_closed_at=Max("closed_at"),
+            max_modificado_at=Max("modificado_at"),
+        )
+        partes += [str(cierres[campo]) for campo in ("cierres", "max_closed_at", "max_modificado_at")]
+        fechas += [cierres["max_closed_at"], cierres["max_modificado_at"]]
+
+    etag = hashlib.sha1("|".join(partes).encode()).hexdigest()
+    return etag, max(filter(None, fechas), default=None)
+
+
+def _fecha(valor):
+    try:
+        return datetime.strptime(valor, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None
+
+
+def fecha_unica(parametros, por_defecto_hoy=True):
+    """(fecha, fecha) desde el parámetro date; hoy si no viene (y por_defecto_hoy). None si es inválido."""
+    valor = parametros.get("date")
+    if not valor:
+        return (localtime().date(),) * 2 if por_defecto_hoy else None
+    fecha = _fecha(valor)
+    return (fecha, fecha) if fecha else None
+
+
+def fecha_obligatoria(parametros):
+    """Como fecha_unica, pero sin date no hay validadores (la vista exige el parámetro)."""
+    return fecha_unica(parametros, por_defecto_hoy=False)
+
+
+def rango_fechas(inicio, fin):
+    """Función que lee el rango desde los parámetros inicio y fin (ej. start_date/end_date)."""
+    def leer(parametros):
+        start, end = _fecha(parametros.get(inicio)), _fecha(parametros.get(fin))
+        return (start, end) if start and end and start <= end else None
+    return leer
+
+
+def condicional(leer_rango, caja=False, calcular_validadores=None):
+    """
+    Decorador de vistas GET: agrega ETag y Last-Modified y responde 304 si el
+    cliente ya tiene la versión actual. leer_rango recibe los parámetros GET y
+    retorna (start, end), o None si son inválidos (la vista responde su error).
+    calcular_validadores(start, end) reemplaza a validadores (ej. para cachearlos).
+    Los validadores se calculan una sola vez por petición.
+    """
+    def calcular(request):
+        if not hasattr(request, "_validadores"):
+            rango = leer_rango(request.GET)
+            if rango is None:
+                request._validadores = (None, None)
+            elif calcular_validadores:
+                request._validadores = calcular_validadores(*rango)
+            else:
+                request._validadores = validadores(*rango, caja=caja)
+        return request._validadores
+
+    return condition(
+        etag_func=lambda request, *args, **kwargs: calcular(request)[0],
+        last_modified_func=lambda request, *args, **kwargs: calcular(request)[1],
+    )
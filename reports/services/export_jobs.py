@@ -0,0 +1,198 @@
+"""
+Exportaciones en segundo plano.
+
+Las vistas crean un ExportJob pendiente y responden de inmediato; el comando
+export_worker reclama los trabajos pendientes y los ejecuta en un pool de procesos.
+Cada trabajo escribe su archivo en MEDIA_ROOT/exports y actualiza su progreso,
+que se consulta desde /reports/jobs/<id>/.
+
+Si el proceso que ejecuta un trabajo muere, el worker lo marca con error; si
+muere el worker completo, los trabajos que quedaron en proceso más de
+TIMEOUT_JOB segundos vuelven a la cola (reencolar_vencidos).
+"""
+import logging
+import os
+import shutil
+import traceback
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from reports.models import ExportJob
+from .export_service import (
+    FORMATOS_EXPORTACION, csv_citas, ndjson_gzip_citas, escribir_excel_citas, parquet_citas_temporal,
+)
+from .pdf_service import REPORTES_PDF, renderizar_pdf, request_con_parametros
+from .report_service import ReportService
+
+logger = logging.getLogger(__name__)
+
+# Carpeta de los archivos generados, relativa a MEDIA_ROOT
+CARPETA_EXPORTS = "exports"
+
+# Filas procesadas entre actualizaciones del progreso
+FILAS_POR_PROGRESO = 5000
+
+# Segundos en proceso tras los cuales un trabajo se considera abandonado
+TIMEOUT_JOB = 30 * 60
+
+# Tipos de trabajo: exportaciones del rango de citas y reportes PDF de un día
+TIPOS_CITAS = {f"citas_{formato}": formato for formato in FORMATOS_EXPORTACION}
+TIPOS_PDF = {f"pdf_{tipo}": tipo for tipo in REPORTES_PDF}
+TIPOS_JOB = {**TIPOS_CITAS, **TIPOS_PDF}
+
+
+def crear_job(tipo, parametros):
+    """
+    Valida y registra un trabajo pendiente. Retorna (job, error); error es None
+    si el trabajo se creó.
+    """
+    if tipo not in TIPOS_JOB:
+        return None, f"Tipo no soportado. Opciones: {', '.join(TIPOS_JOB)}."
+
+    if tipo in TIPOS_CITAS:
+        request = request_con_parametros(parametros)
+        start_date, end_date, error = ReportService().validar_rango_citas(request)
+        if error:
+            return None, error
+        parametros = {"start_date": start_date, "end_date": end_date}
+    else:
+        fecha = parametros.get("date")
+        if fecha:
+            try:
+                datetime.strptime(fecha, "%Y-%m-%d")
+            except (TypeError, ValueError):
+                return None, "Formato de fecha inválido. Use YYYY-MM-DD."
+        parametros = {"date": fecha} if fecha else {}
+
+    return ExportJob.objects.create(tipo=tipo, parametros=parametros), None
+
+
+def estado_job(job):
+    """Representación JSON del trabajo para el polling."""
+    return {
+        "id": job.id,
+        "tipo": job.tipo,
+        "estado": job.estado,
+        "progreso": job.progreso,
+        "error": job.error or None,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def reclamar_pendientes(limite):
+    """
+    Marca como en proceso hasta limite trabajos pendientes (los más antiguos primero)
+    y retorna sus ids. La actualización condicional evita que dos workers tomen
+    el mismo trabajo.
+    """
+    reclamados = []
+    candidatos = (
+        ExportJob.objects
+        .filter(estado=ExportJob.PENDIENTE)
+        .order_by("created_at", "id")
+        .values_list("id", flat=True)[:limite]
+    )
+    for job_id in list(candidatos):
+        actualizados = ExportJob.objects.filter(id=job_id, estado=ExportJob.PENDIENTE).update(
+            estado=ExportJob.EN_PROCESO, started_at=timezone.now()
+        )
+        if actualizados:
+            reclamados.append(job_id)
+    return reclamados
+
+
+def marcar_error(job_id, error):
+    """Marca con error un trabajo que sigue en proceso (ej. si murió el proceso que lo ejecutaba)."""
+    return ExportJob.objects.filter(id=job_id, estado=ExportJob.EN_PROCESO).update(
+        estado=ExportJob.ERROR, error=error, finished_at=timezone.now()
+    )
+
+
+def reencolar_vencidos(segundos=TIMEOUT_JOB, excluir=()):
+    """
+    Devuelve a pendiente los trabajos en proceso desde hace más de segundos
+    (el worker que los reclamó dejó de ejecutarse). excluir son los ids que el
+    worker sigue ejecutando: una exportación larga no se reencola mientras corre.
+    Retorna la cantidad.
+    """
+    limite = timezone.now() - timedelta(seconds=segundos)
+    vencidos = ExportJob.objects.filter(estado=ExportJob.EN_PROCESO, started_at__lt=limite)
+    return vencidos.exclude(id__in=list(excluir)).update(
+        estado=ExportJob.PENDIENTE, started_at=None, progreso=0
+    )
+
+
+def _actualizar_progreso(job_id, progreso):
+    ExportJob.objects.filter(id=job_id).update(progreso=progreso)
+
+
+def _con_progreso(job_id, filas, total):
+    """Recorre filas actualizando el progreso del trabajo cada FILAS_POR_PROGRESO filas."""
+    for i, fila in enumerate(filas, start=1):
+        if total and i % FILAS_POR_PROGRESO == 0:
+            _actualizar_progreso(job_id, min(99, i * 100 // total))
+        yield fila
+
+
+def _exportar_citas(job, formato, ruta):
+    service = ReportService()
+    start_date, end_date = job.parametros["start_date"], job.parametros["end_date"]
+    total = service.contar_appointments_between_dates(start_date, end_date)
+    filas = _con_progreso(job.id, service.iter_appointments_between_dates(start_date, end_date), total)
+
+    if formato == "xlsx":
+        escribir_excel_citas(filas, ruta)
+    elif formato == "csv":
+        with open(ruta, "w", encoding="utf-8", newline="") as archivo:
+            archivo.writelines(csv_citas(filas))
+    elif formato == "ndjson":
+        with open(ruta, "wb") as archivo:
+            archivo.writelines(ndjson_gzip_citas(filas))
+    else:
+        with parquet_citas_temporal(filas) as temporal, open(ruta, "wb") as archivo:
+            shutil.copyfileobj(temporal, archivo)
+
+
+def _nombre_archivo(job):
+    if job.tipo in TIPOS_CITAS:
+        extension = FORMATOS_EXPORTACION[TIPOS_CITAS[job.tipo]][1]
+        return f"{job.id}_citas_{job.parametros['start_date']}_a_{job.parametros['end_date']}.{extension}"
+    nombre = REPORTES_PDF[TIPOS_PDF[job.tipo]]["pdfname"]
+    return f"{job.id}_{job.parametros.get('date', 'hoy')}_{nombre}"
+
+
+def ejecutar_job(job_id):
+    """
+    Ejecuta un trabajo ya reclamado y guarda el resultado en MEDIA_ROOT.
+    Pensado para correr dentro de un proceso del pool de export_worker.
+    """
+    close_old_connections()
+    job = ExportJob.objects.get(id=job_id)
+
+    carpeta = os.path.join(settings.MEDIA_ROOT, CARPETA_EXPORTS)
+    os.makedirs(carpeta, exist_ok=True)
+    relativa = os.path.join(CARPETA_EXPORTS, _nombre_archivo(job))
+    ruta = os.path.join(settings.MEDIA_ROOT, relativa)
+
+    try:
+        if job.tipo in TIPOS_CITAS:
+            _exportar_citas(job, TIPOS_CITAS[job.tipo], ruta)
+        else:
+            with open(ruta, "wb") as archivo:
+                renderizar_pdf(TIPOS_PDF[job.tipo], request_con_parametros(job.parametros), archivo)
+    except Exception:
+        logger.exception("Error en la exportación %s", job_id)
+        if os.path.exists(ruta):
+            os.remove(ruta)
+        ExportJob.objects.filter(id=job_id).update(
+            estado=ExportJob.ERROR, error=traceback.format_exc(limit=3), finished_at=timezone.now()
+        )
+        return job_id
+
+    ExportJob.objects.filter(id=job_id).update(
+        estado=ExportJob.COMPLETADO, progreso=100, archivo=relativa, finished_at=timezone.now()
+    )
+    return job_id
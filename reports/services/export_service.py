@@ -0,0 +1,198 @@
+import csv
+import json
+import tempfile
+import zlib
+from datetime import date
+import xlsxwriter
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depende del entorno
+    pa = pq = None
+
+# Encabezados y campos de cada fila del reporte de citas entre fechas
+COLUMNAS_CITAS = [
+    ("Fecha", "appointment_date"),
+    ("Hora", "appointment_hour"),
+    ("Terapeuta", "therapist"),
+    ("Paciente", "patient"),
+    ("Pago", "payment"),
+    ("Tipo de Pago", "payment_type"),
+]
+
+# Campos de las exportaciones para carga de datos (CSV, NDJSON y Parquet)
+CAMPOS_EXPORTACION = ["appointment_id"] + [campo for _, campo in COLUMNAS_CITAS]
+
+# Formatos de exportación: nombre -> (content type, extensión del archivo)
+FORMATOS_EXPORTACION = {
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/gzip", "ndjson.gz"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+# Tipos del encabezado Accept reconocidos -> formato
+ACCEPT_FORMATOS = {
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": "xlsx",
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/gzip": "ndjson",
+    "application/vnd.apache.parquet": "parquet",
+}
+
+# Tamaño aproximado de cada parte comprimida del NDJSON y filas por grupo de Parquet
+NDJSON_CHUNK_SIZE = 64 * 1024
+PARQUET_BATCH_SIZE = 10000
+
+
+def formato_solicitado(parametro, accept):
+    """
+    Formato pedido por el parámetro format o, si no viene, por el encabezado Accept.
+    Retorna None si el formato no está soportado y "xlsx" si no se indicó ninguno.
+    """
+    if parametro:
+        return parametro.lower() if parametro.lower() in FORMATOS_EXPORTACION else None
+    for tipo in (accept or "").split(","):
+        tipo = tipo.split(";")[0].strip().lower()
+        if tipo in ACCEPT_FORMATOS:
+            return ACCEPT_FORMATOS[tipo]
+    return "xlsx"
+
+
+class _Eco:
+    """Pseudo-archivo para csv.writer: write retorna la línea en lugar de guardarla."""
+
+    def write(self, valor):
+        return valor
+
+
+def csv_citas(filas):
+    """Genera el CSV de citas línea por línea, empezando por el encabezado."""
+    writer = csv.writer(_Eco())
+    yield writer.writerow(CAMPOS_EXPORTACION)
+    for fila in filas:
+        yield writer.writerow([fila[campo] for campo in CAMPOS_EXPORTACION])
+
+
+def ndjson_gzip_citas(filas):
+    """
+    Genera las citas como NDJSON comprimido con gzip, en partes de
+    aproximadamente NDJSON_CHUNK_SIZE bytes comprimidos.
+    """
+    compresor = zlib.compressobj(wbits=31)  # wbits=31: formato gzip
+    parte = []
+    tamanio = 0
+    for fila in filas:
+        datos = compresor.compress((json.dumps(fila) + "\n").encode())
+        if datos:
+            parte.append(datos)
+            tamanio += len(datos)
+        if tamanio >= NDJSON_CHUNK_SIZE:
+            yield b"".join(parte)
+            parte, tamanio = [], 0
+    parte.append(compresor.flush())
+    yield b"".join(parte)
+
+
+def _esquema_parquet():
+    return pa.schema([
+        ("appointment_id", pa.int64()),
+        ("appointment_date", pa.date32()),
+        ("appointment_hour", pa.string()),
+        ("therapist", pa.string()),
+        ("patient", pa.string()),
+        ("payment", pa.float64()),
+        ("payment_type", pa.string()),
+    ])
+
+
+def _tabla_parquet(lote, esquema):
+    columnas = {campo: [fila[campo] for fila in lote] for campo in CAMPOS_EXPORTACION}
+    columnas["appointment_date"] = [date.fromisoformat(d) for d in columnas["appointment_date"]]
+    return pa.Table.from_pydict(columnas, schema=esquema)
+
+
+def parquet_citas_temporal(filas):
+    """
+    Escribe las citas en Parquet sobre un archivo temporal, un grupo de filas
+    por cada PARQUET_BATCH_SIZE citas, y lo retorna abierto al inicio.
+    Requiere pyarrow (dependencia opcional).
+    """
+    if pq is None:
+        raise ImproperlyConfigured("La exportación a Parquet requiere pyarrow (pip install pyarrow).")
+
+    esquema = _esquema_parquet()
+    archivo = tempfile.TemporaryFile()
+    try:
+        with pq.ParquetWriter(archivo, esquema) as writer:
+            lote = []
+            for fila in filas:
+                lote.append(fila)
+                if len(lote) >= PARQUET_BATCH_SIZE:
+                    writer.write_table(_tabla_parquet(lote, esquema))
+                    lote = []
+            if lote:
+                writer.write_table(_tabla_parquet(lote, esquema))
+    except Exception:
+        archivo.close()
+        raise
+    archivo.seek(0)
+    return archivo
+
+
+def escribir_excel_citas(filas, salida):
+    """
+    Escribe las citas en un libro de Excel sobre salida (ruta o archivo abierto).
+    Usa el modo constant_memory de xlsxwriter: cada fila se vuelca a un archivo
+    temporal en cuanto se escribe, por lo que filas puede ser un generador y la
+    memoria no crece con la cantidad de citas.
+    """
+    workbook = xlsxwriter.Workbook(salida, {
+        "constant_memory": True,
+        "tmpdir": tempfile.gettempdir(),
+    })
+    worksheet = workbook.add_worksheet('Citas')
+
+    # Formato para encabezados
+    header_format = workbook.add_format({
+        'bold': True,
+        'bg_color': '#2c3e50',
+        'font_color': 'white',
+        'border': 1
+    })
+
+    # Ajustar anchos de columna (en constant_memory debe hacerse antes de escribir filas)
+    worksheet.set_column('A:A', 15)
+    worksheet.set_column('B:B', 10)
+    worksheet.set_column('C:D', 30)
+    worksheet.set_column('E:E', 12)
+    worksheet.set_column('F:F', 15)
+
+    # Escribir encabezados
+    worksheet.write_row(0, 0, [titulo for titulo, _ in COLUMNAS_CITAS], header_format)
+
+    # Escribir datos fila por fila, en orden (requisito de constant_memory)
+    total = 0
+    for row, appointment in enumerate(filas, start=1):
+        worksheet.write_row(row, 0, [appointment.get(campo, '') for _, campo in COLUMNAS_CITAS])
+        total = row
+
+    workbook.close()
+    return total
+
+
+def excel_citas_temporal(filas):
+    """
+    Genera el Excel de citas en un archivo temporal y lo retorna abierto y
+    posicionado al inicio. El archivo se elimina al cerrarse.
+    """
+    archivo = tempfile.TemporaryFile()
+    try:
+        escribir_excel_citas(filas, archivo)
+    except Exception:
+        archivo.close()
+        raise
+    archivo.seek(0)
+    return archivo
@@ -0,0 +1,171 @@
+"""
+Paquetes de reportes PDF por rango de fechas.
+
+Cada combinación (día, reporte) se renderiza en un proceso de un pool compartido,
+así que el tiempo total depende de los núcleos disponibles y no de la cantidad de
+días. Los PDF ya presentes en PDFCache no se vuelven a renderizar. El resultado
+es un ZIP con un archivo por día y reporte, o un único PDF unido con pypdf.
+
+Si un proceso del pool muere (ej. por memoria), el pool queda roto: se descarta,
+el paquete en curso se renderiza en el proceso actual y la siguiente petición
+crea un pool nuevo.
+"""
+import io
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.db import close_old_connections
+from pypdf import PdfWriter
+from .pdf_cache import PDFCache
+from .pdf_service import REPORTES_PDF, motor_pdf, renderizar_pdf, request_con_parametros
+
+# Formatos del paquete
+FORMATOS_PAQUETE = ("zip", "pdf")
+
+# Máximo de días por paquete
+MAX_DIAS_PAQUETE = 62
+
+# Máximo de procesos del pool por proceso web (cada uno carga Django completo)
+MAX_PROCESOS_PAQUETE = 4
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def procesos_paquete():
+    """
+    Procesos del pool (REPORTS_PDF_BUNDLE_PROCESSES, como máximo MAX_PROCESOS_PAQUETE);
+    None usa uno por núcleo y 0 renderiza en el proceso actual.
+    """
+    procesos = getattr(settings, "REPORTS_PDF_BUNDLE_PROCESSES", None)
+    if procesos is None:
+        procesos = os.cpu_count() or 1
+    return min(procesos, MAX_PROCESOS_PAQUETE)
+
+
+def _get_pool():
+    """Pool de procesos compartido; se crea en el primer uso y se reutiliza entre peticiones."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=procesos_paquete(),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=django.setup,
+            )
+        return _pool
+
+
+def _descartar_pool(pool):
+    """Descarta un pool roto; el siguiente _get_pool crea uno nuevo."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _renderizar_en_pool(pendientes, motores):
+    pool = _get_pool()
+    try:
+        return list(pool.map(
+            _renderizar_dia_en_proceso,
+            [tipo for _, tipo in pendientes],
+            [fecha for fecha, _ in pendientes],
+            [motores[tipo] for _, tipo in pendientes],
+        ))
+    except BrokenProcessPool:
+        logger.warning("Pool de PDF roto; se descarta y el paquete se renderiza en el proceso actual.")
+        _descartar_pool(pool)
+        return [renderizar_dia(tipo, fecha, motores[tipo]) for fecha, tipo in pendientes]
+
+
+def renderizar_dia(tipo, fecha, motor):
+    """Renderiza el reporte tipo de un día y retorna los bytes del PDF."""
+    request = request_con_parametros({"date": fecha})
+    return renderizar_pdf(tipo, request, io.BytesIO(), motor).getvalue()
+
+
+def _renderizar_dia_en_proceso(tipo, fecha, motor):
+    """
+    renderizar_dia dentro de un proceso del pool. Los procesos viven entre
+    peticiones: como en export_jobs.ejecutar_job, se descartan las conexiones
+    caídas o vencidas antes y después de cada render.
+    """
+    close_old_connections()
+    try:
+        return renderizar_dia(tipo, fecha, motor)
+    finally:
+        close_old_connections()
+
+
+def renderizar_rango(tipos, start, end, engine=None):
+    """
+    Lista [(fecha, tipo, bytes)] ordenada por fecha y luego por tipo, para
+    start..end (fechas date) y los reportes tipos. engine fuerza el motor de
+    render; si es None se usa el configurado para cada tipo.
+    """
+    motores = {tipo: motor_pdf(tipo, engine) for tipo in tipos}
+    trabajos = []
+    dia = start
+    while dia <= end:
+        trabajos.extend((dia.isoformat(), tipo) for tipo in tipos)
+        dia += timedelta(days=1)
+
+    # Se reutilizan los PDF cacheados y solo se renderiza el resto
+    resultados = {}
+    huellas = {}
+    if PDFCache.habilitado():
+        for fecha, tipo in trabajos:
+            huellas[(fecha, tipo)] = PDFCache.huella(fecha, tipo)
+            contenido = PDFCache.obtener(PDFCache.clave(tipo, motores[tipo]), fecha, huellas[(fecha, tipo)])
+            if contenido is not None:
+                resultados[(fecha, tipo)] = contenido
+
+    pendientes = [t for t in trabajos if t not in resultados]
+    if procesos_paquete() > 0 and len(pendientes) > 1:
+        renderizados = _renderizar_en_pool(pendientes, motores)
+    else:
+        renderizados = (renderizar_dia(tipo, fecha, motores[tipo]) for fecha, tipo in pendientes)
+
+    for (fecha, tipo), contenido in zip(pendientes, renderizados):
+        resultados[(fecha, tipo)] = contenido
+        if (fecha, tipo) in huellas:
+            PDFCache.guardar(PDFCache.clave(tipo, motores[tipo]), fecha, huellas[(fecha, tipo)], contenido)
+
+    return [(fecha, tipo, resultados[(fecha, tipo)]) for fecha, tipo in trabajos]
+
+
+def generar_paquete(tipos, start, end, formato, engine=None):
+    """
+    Renderiza los reportes del rango y los escribe en un archivo temporal (ZIP o
+    PDF unido). Retorna el archivo abierto al inicio; se elimina al cerrarse.
+    """
+    pdfs = renderizar_rango(tipos, start, end, engine)
+    archivo = tempfile.TemporaryFile()
+    try:
+        if formato == "zip":
+            with zipfile.ZipFile(archivo, "w", zipfile.ZIP_DEFLATED) as paquete:
+                for fecha, tipo, contenido in pdfs:
+                    paquete.writestr(f"{fecha}_{REPORTES_PDF[tipo]['pdfname']}", contenido)
+        else:
+            writer = PdfWriter()
+            for _, _, contenido in pdfs:
+                writer.append(io.BytesIO(contenido))
+            writer.write(archivo)
+    except Exception:
+        archivo.close()
+        raise
+    archivo.seek(0)
+    return archivo
@@ -0,0 +1,114 @@
+"""
+Caché en disco de los PDF renderizados con xhtml2pdf.
+
+Cada archivo se identifica por tipo de reporte, fecha y una huella de las citas de
+esa fecha: el mismo agregado que los validadores del GET condicional (ver
+conditional.py), así que cualquier alta, edición o eliminación de una cita del día
+la cambia. En resumen_caja la huella también incluye el cierre de caja del día
+(closed_at y modificado_at), que cambia al reemplazar o marcar el cierre.
+Los cambios en nombres de terapeutas, pacientes o tipos de pago no alteran la huella.
+
+El tamaño total se limita con REPORTS_PDF_CACHE_MAX_BYTES: al guardar se eliminan
+los archivos usados hace más tiempo (LRU por fecha de modificación, que se
+actualiza en cada acierto).
+"""
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+from .conditional import validadores
+
+# Reportes cuyo contenido depende del cierre de caja del día
+TIPOS_CON_CIERRE = ("resumen_caja",)
+
+
+class PDFCache:
+    EXTENSION = ".pdf"
+    _lock = threading.Lock()
+
+    @staticmethod
+    def habilitado():
+        return getattr(settings, "REPORTS_PDF_CACHE_ENABLED", False)
+
+    @staticmethod
+    def carpeta():
+        return str(getattr(settings, "REPORTS_PDF_CACHE_DIR", os.path.join(settings.BASE_DIR, "pdf_cache")))
+
+    @staticmethod
+    def max_bytes():
+        return getattr(settings, "REPORTS_PDF_CACHE_MAX_BYTES", 100 * 1024 * 1024)
+
+    @staticmethod
+    def huella(fecha, tipo=None):
+        """
+        Resumen de las citas de la fecha; cambia si se crean, editan o eliminan citas.
+        Para los tipos de TIPOS_CON_CIERRE también cambia con el cierre de caja.
+        """
+        etag, _ = validadores(fecha, fecha, caja=tipo in TIPOS_CON_CIERRE)
+        return etag[:16]
+
+    @staticmethod
+    def clave(tipo, motor):
+        """Tipo usado en la caché: cada motor de render tiene sus propias entradas."""
+        return tipo if motor == "xhtml2pdf" else f"{tipo}-{motor}"
+
+    @classmethod
+    def _ruta(cls, tipo, fecha, huella):
+        return os.path.join(cls.carpeta(), f"{tipo}_{fecha}_{huella}{cls.EXTENSION}")
+
+    @classmethod
+    def obtener(cls, tipo, fecha, huella):
+        """Bytes del PDF cacheado o None. Un acierto marca el archivo como recién usado."""
+        ruta = cls._ruta(tipo, fecha, huella)
+        try:
+            with open(ruta, "rb") as archivo:
+                contenido = archivo.read()
+            os.utime(ruta)
+        except FileNotFoundError:
+            return None
+        return contenido
+
+    @classmethod
+    def guardar(cls, tipo, fecha, huella, contenido):
+        """Guarda el PDF (escritura atómica), borra versiones anteriores del mismo día y aplica el límite."""
+        carpeta = cls.carpeta()
+        os.makedirs(carpeta, exist_ok=True)
+
+        descriptor, temporal = tempfile.mkstemp(dir=carpeta, suffix=".tmp")
+        with os.fdopen(descriptor, "wb") as archivo:
+            archivo.write(contenido)
+        ruta = cls._ruta(tipo, fecha, huella)
+        os.replace(temporal, ruta)
+
+        with cls._lock:
+            # Versiones del mismo reporte y fecha con otra huella ya no se usarán
+            prefijo = f"{tipo}_{fecha}_"
+            for nombre in os.listdir(carpeta):
+                if nombre.startswith(prefijo) and os.path.join(carpeta, nombre) != ruta:
+                    cls._eliminar(os.path.join(carpeta, nombre))
+            cls.recortar()
+
+    @classmethod
+    def recortar(cls):
+        """Elimina los archivos menos usados hasta que el total no supere max_bytes()."""
+        carpeta = cls.carpeta()
+        archivos = []
+        for entrada in os.scandir(carpeta):
+            if entrada.is_file() and entrada.name.endswith(cls.EXTENSION):
+                estado = entrada.stat()
+                archivos.append((estado.st_mtime, estado.st_size, entrada.path))
+
+        total = sum(tamanio for _, tamanio, _ in archivos)
+        for _, tamanio, ruta in sorted(archivos):
+            if total <= cls.max_bytes():
+                break
+            cls._eliminar(ruta)
+            total -= tamanio
+
+    @staticmethod
+    def _eliminar(ruta):
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
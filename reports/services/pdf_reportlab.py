@@ -0,0 +1,140 @@
+"""
+Render directo con ReportLab de los reportes PDF.
+
+Alternativa al camino plantilla HTML -> xhtml2pdf: usa el mismo contexto que las
+plantillas de pdf_templates/ y construye el documento con flowables (títulos y
+tablas), sin generar ni interpretar HTML/CSS. Mantiene la misma estructura y
+colores que las plantillas.
+"""
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import mm
+from reportlab.platypus import LongTable, Paragraph, SimpleDocTemplate, Spacer, TableStyle
+from xml.sax.saxutils import escape
+
+# Colores de las plantillas HTML
+AZUL = colors.HexColor("#2c3e50")
+GRIS_BORDE = colors.HexColor("#dddddd")
+
+_estilos = getSampleStyleSheet()
+TITULO = ParagraphStyle("titulo", parent=_estilos["Title"], fontName="Helvetica-Bold", textColor=AZUL)
+FECHA = ParagraphStyle("fecha", parent=_estilos["Normal"], fontName="Helvetica", alignment=TA_CENTER)
+TOTAL = ParagraphStyle("total", parent=_estilos["Normal"], fontName="Helvetica-Bold", spaceBefore=15)
+TOTAL_DESTACADO = ParagraphStyle(
+    "total_destacado", parent=TOTAL, alignment=TA_CENTER, textColor=colors.white,
+    backColor=AZUL, borderPadding=10, spaceBefore=20,
+)
+
+# Estilo común de las tablas: encabezado azul y filas con borde inferior gris
+ESTILO_TABLA = [
+    ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
+    ("FONTSIZE", (0, 0), (-1, -1), 10),
+    ("BACKGROUND", (0, 0), (-1, 0), AZUL),
+    ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+    ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+    ("LINEBELOW", (0, 1), (-1, -1), 0.5, GRIS_BORDE),
+    ("TOPPADDING", (0, 0), (-1, -1), 6),
+    ("BOTTOMPADDING", (0, 0), (-1, -1), 6),
+    ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+]
+
+
+def _documento(salida, context):
+    doc = SimpleDocTemplate(
+        salida, pagesize=A4, title=context["title"],
+        leftMargin=15 * mm, rightMargin=15 * mm, topMargin=15 * mm, bottomMargin=15 * mm,
+    )
+    encabezado = [
+        Paragraph(escape(context["title"]), TITULO),
+        Paragraph(f"Fecha: {escape(str(context['date']))}", FECHA),
+        Spacer(1, 20),
+    ]
+    return doc, encabezado
+
+
+def _tabla(filas, anchos, estilo=()):
+    # LongTable reparte las filas entre páginas sin medir toda la tabla de una vez
+    tabla = LongTable(filas, colWidths=anchos, repeatRows=1)
+    tabla.setStyle(TableStyle(ESTILO_TABLA + list(estilo)))
+    return tabla
+
+
+def _ancho(doc, *proporciones):
+    return [doc.width * p for p in proporciones]
+
+
+def citas_terapeuta(context, salida):
+    doc, elementos = _documento(salida, context)
+    data = context["data"]
+    total = data.get("total_appointments_count", 0)
+
+    filas = [["Terapeuta", "Cantidad", "Porcentaje"]]
+    for therapist in data.get("therapists_appointments", []):
+        nombre = f"{therapist['paternal_lastname'] or ''} {therapist['maternal_lastname'] or ''} {therapist['name'] or ''}"
+        porcentaje = f"{therapist.get('percentage') or 0:.1f}%" if total > 0 else "0%"
+        filas.append([nombre, therapist["appointments_count"], porcentaje])
+
+    elementos.append(_tabla(filas, _ancho(doc, 0.6, 0.2, 0.2)))
+    elementos.append(Paragraph(f"Total de citas: {total}", TOTAL))
+    doc.build(elementos)
+    return salida
+
+
+def pacientes_terapeuta(context, salida):
+    doc, elementos = _documento(salida, context)
+    data = context["data"] if isinstance(context["data"], list) else []
+
+    # Una sola tabla: fila azul por terapeuta seguida de sus pacientes
+    filas = []
+    estilo = [
+        ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
+        ("FONTSIZE", (0, 0), (-1, -1), 10),
+        ("TOPPADDING", (0, 0), (-1, -1), 4),
+        ("BOTTOMPADDING", (0, 0), (-1, -1), 4),
+        ("ALIGN", (1, 0), (1, -1), "RIGHT"),
+    ]
+    for therapist in data:
+        fila = len(filas)
+        filas.append([therapist["therapist"], f"{len(therapist['patients'])} pacientes"])
+        estilo += [
+            ("BACKGROUND", (0, fila), (-1, fila), AZUL),
+            ("TEXTCOLOR", (0, fila), (-1, fila), colors.white),
+            ("TOPPADDING", (0, fila), (-1, fila), 8),
+            ("BOTTOMPADDING", (0, fila), (-1, fila), 8),
+        ]
+        for patient in therapist["patients"]:
+            citas = patient["appointments"]
+            filas.append([f"    {patient['patient']} - {citas} cita{'s' if citas != 1 else ''}", ""])
+        if therapist["patients"]:
+            # Separación entre grupos, como el margen de .therapist-group
+            estilo.append(("BOTTOMPADDING", (0, len(filas) - 1), (-1, len(filas) - 1), 14))
+
+    if filas:
+        tabla = LongTable(filas, colWidths=_ancho(doc, 0.75, 0.25))
+        tabla.setStyle(TableStyle(estilo))
+        elementos.append(tabla)
+    doc.build(elementos)
+    return salida
+
+
+def resumen_caja(context, salida):
+    doc, elementos = _documento(salida, context)
+
+    filas = [["Tipo de Pago", "Monto"]]
+    for item in context["data"] if isinstance(context["data"], list) else []:
+        filas.append([item["payment_type"], f"S/. {item['total_payment']:.2f}"])
+
+    elementos.append(_tabla(filas, _ancho(doc, 0.6, 0.4)))
+    elementos.append(Paragraph(f"Total del día: S/. {context['total']:.2f}", TOTAL_DESTACADO))
+    doc.build(elementos)
+    return salida
+
+
+# Renderizadores por tipo de reporte (mismas claves que REPORTES_PDF)
+RENDERIZADORES = {
+    "citas_terapeuta": citas_terapeuta,
+    "pacientes_terapeuta": pacientes_terapeuta,
+    "resumen_caja": resumen_caja,
+}
@@ -0,0 +1,109 @@
+from datetime import datetime
+from django.conf import settings
+from django.http import HttpRequest, QueryDict
+from django_xhtml2pdf.utils import generate_pdf
+from .report_service import ReportService
+from . import pdf_reportlab
+
+report_service = ReportService()
+
+
+def request_con_parametros(parametros):
+    """
+    Crea un HttpRequest con los parámetros GET indicados, para reutilizar los
+    métodos de ReportService fuera de una petición (por ejemplo, en el worker).
+    """
+    request = HttpRequest()
+    request.GET = QueryDict(mutable=True)
+    request.GET.update({k: v for k, v in parametros.items() if v is not None})
+    return request
+
+
+def contexto_citas_terapeuta(request):
+    date = request.GET.get('date', datetime.today().strftime('%Y-%m-%d'))
+    data = report_service.get_appointments_count_by_therapist(request)
+
+    # Calcular porcentajes si no vienen en los datos
+    if 'therapists_appointments' in data:
+        total = data.get('total_appointments_count', 1)  # Evitar división por cero
+        for therapist in data['therapists_appointments']:
+            therapist['percentage'] = (therapist['appointments_count'] / total) * 100 if total > 0 else 0
+
+    return {
+        'date': date,
+        'data': data,
+        'title': 'Citas por Terapeuta'
+    }
+
+
+def contexto_pacientes_terapeuta(request):
+    date = request.GET.get('date', datetime.today().strftime('%Y-%m-%d'))
+    data = report_service.get_patients_by_therapist(request)
+    return {
+        'date': date,
+        'data': data,
+        'title': 'Pacientes por Terapeuta'
+    }
+
+
+def contexto_resumen_caja(request):
+    date = request.GET.get('date', datetime.today().strftime('%Y-%m-%d'))
+    data = report_service.get_daily_cash(request)
+
+    # Calcular el total aquí en la vista
+    total = sum(item['total_payment'] for item in data) if data else 0
+
+    return {
+        'date': date,
+        'data': data,
+        'total': total,  # Pasamos el total calculado
+        'title': 'Resumen de Caja Diaria'
+    }
+
+
+# Reportes PDF: tipo -> plantilla, nombre del archivo y función que arma el contexto
+REPORTES_PDF = {
+    "citas_terapeuta": {
+        "template": 'pdf_templates/citas_terapeuta.html',
+        "pdfname": 'citas_terapeuta.pdf',
+        "contexto": contexto_citas_terapeuta,
+    },
+    "pacientes_terapeuta": {
+        "template": 'pdf_templates/pacientes_terapeuta.html',
+        "pdfname": 'pacientes_por_terapeuta.pdf',
+        "contexto": contexto_pacientes_terapeuta,
+    },
+    "resumen_caja": {
+        "template": 'pdf_templates/resumen_caja.html',
+        "pdfname": 'resumen_caja.pdf',
+        "contexto": contexto_resumen_caja,
+    },
+}
+
+
+# Motores de render: plantilla HTML con xhtml2pdf o construcción directa con ReportLab
+MOTORES_PDF = ("xhtml2pdf", "reportlab")
+
+
+def motor_pdf(tipo, solicitado=None):
+    """
+    Motor para el reporte tipo: el solicitado (parámetro engine) o el configurado
+    en REPORTS_PDF_ENGINES para ese tipo, xhtml2pdf por defecto.
+    Retorna None si el motor solicitado no existe.
+    """
+    if solicitado:
+        return solicitado if solicitado in MOTORES_PDF else None
+    return getattr(settings, "REPORTS_PDF_ENGINES", {}).get(tipo, "xhtml2pdf")
+
+
+def renderizar_pdf(tipo, request, salida, motor=None):
+    """Renderiza el reporte PDF tipo sobre salida (archivo abierto en binario) con el motor indicado."""
+    context = REPORTES_PDF[tipo]["contexto"](request)
+    return renderizar_contexto(tipo, context, salida, motor or motor_pdf(tipo))
+
+
+def renderizar_contexto(tipo, context, salida, motor):
+    """Renderiza un contexto ya armado con el motor indicado."""
+    if motor == "reportlab":
+        return pdf_reportlab.RENDERIZADORES[tipo](context, salida)
+    return generate_pdf(REPORTES_PDF[tipo]["template"], file_object=salida, context=context)
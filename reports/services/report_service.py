@@ -1,8 +1,128 @@
-from datetime import datetime
+import base64
+import json
+from decimal import Decimal
+from datetime import date, datetime, time, timedelta
+from django.conf import settings
 from django.utils.timezone import localtime
-from django.db.models import Count, Q, Sum
+from django.db.models import Count, F, Min, Q, Sum
 from base_models.models import Appointment, PaymentType, Therapist  # Debes tener estos modelos creados
 from django.db import models
+from app_statistics.models import AppointmentDailyRollup
+from reports.models import DailyCashClosure
+
+# Campos leídos para el reporte de citas entre fechas
+CAMPOS_CITA = (
+    "id", "appointment_date", "appointment_hour", "payment",
+    "therapist_id", "therapist__paternal_lastname", "therapist__maternal_lastname", "therapist__name",
+    "patient_id", "patient__paternal_lastname", "patient__maternal_lastname", "patient__name",
+    "payment_type_id", "payment_type__name",
+)
+
+# Campos por los que se agrupan las citas en los reportes de pacientes por terapeuta
+CAMPOS_TERAPEUTA_PACIENTE = (
+    "therapist_id", "therapist__paternal_lastname", "therapist__maternal_lastname", "therapist__name",
+    "patient_id", "patient__paternal_lastname", "patient__maternal_lastname", "patient__name",
+)
+
+# Filas leídas por bloque al recorrer citas
+CHUNK_SIZE = 2000
+
+# Tamaño máximo de página del reporte de citas paginado
+MAX_PAGE_SIZE = 1000
+
+# Máximo de días de la matriz de citas por terapeuta
+MAX_DIAS_MATRIZ = 92
+
+# Máximo de días del resumen de caja por rango
+MAX_DIAS_CAJA = 366
+
+
+def codificar_cursor(fecha, hora, pk):
+    """Cursor opaco (base64 url-safe) con la posición de la última cita de una página."""
+    posicion = [fecha.isoformat(), hora.isoformat() if hora else None, pk]
+    return base64.urlsafe_b64encode(json.dumps(posicion).encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor):
+    """Inverso de codificar_cursor. Lanza ValueError si el cursor no es válido."""
+    try:
+        datos = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        fecha, hora, pk = json.loads(datos)
+        return (
+            date.fromisoformat(fecha),
+            time.fromisoformat(hora) if hora is not None else None,
+            int(pk)
+        )
+    except (TypeError, ValueError) as e:
+        raise ValueError("Cursor inválido.") from e
+
+# Orden de los tipos de pago en el resumen de caja; los demás van al final
+ORDEN_TIPOS_PAGO = {"Cupón": 0, "EFECTIVO": 1, "Yape": 2}
+
+
+def ordenar_lineas_caja(lineas):
+    """Ordena las líneas {"payment_type", ...} del resumen de caja: Cupón, EFECTIVO, Yape, Otros."""
+    lineas = list(lineas)
+    # sort es estable: los "otros" conservan el orden en que llegaron
+    return sorted(lineas, key=lambda x: ORDEN_TIPOS_PAGO.get(x["payment_type"], len(ORDEN_TIPOS_PAGO)))
+
+
+def formatear_lineas_caja(lineas):
+    """Líneas del resumen de caja con los montos como float, tal como las devuelve la API."""
+    return [
+        {
+            "payment_type": linea["payment_type"],
+            "total_payment": float(linea["total_payment"])
+        }
+        for linea in lineas
+    ]
+
+
+def armar_pacientes_por_terapeuta(grupos):
+    """
+    Reporte de pacientes por terapeuta a partir de filas agrupadas por (terapeuta, paciente)
+    con los nombres y appointments, ya ordenadas. Los pacientes sin terapeuta van al
+    final en "sinTherapist".
+    """
+    # Diccionario donde se almacenará el reporte final agrupado por terapeuta
+    report = {}
+
+    # Estructura para pacientes que no tienen terapeuta asignado
+    sin_terapeuta = {
+        "therapist_id": "",
+        "therapist": "Sin terapeuta asignado",
+        "patients": []
+    }
+
+    # Repartir cada par en su terapeuta (o en sin_terapeuta)
+    for grupo in grupos:
+        patient_data = {
+            "patient_id": grupo["patient_id"],
+            "patient": f"{grupo['patient__paternal_lastname']} {grupo['patient__maternal_lastname']} {grupo['patient__name']}".strip(),
+            "appointments": grupo["appointments"]
+        }
+
+        t_id = grupo["therapist_id"]
+        if t_id is None:
+            sin_terapeuta["patients"].append(patient_data)
+            continue
+
+        if t_id not in report:
+            # Crear entrada para el terapeuta si no existe
+            report[t_id] = {
+                "therapist_id": t_id,
+                "therapist": f"{grupo['therapist__paternal_lastname']} {grupo['therapist__maternal_lastname']} {grupo['therapist__name']}".strip(),
+                "patients": []
+            }
+        report[t_id]["patients"].append(patient_data)
+
+    # Si hay pacientes sin terapeuta, agregarlos al reporte final
+    if sin_terapeuta["patients"]:
+        report["sinTherapist"] = sin_terapeuta
+
+    # Retornar la lista de terapeutas con sus pacientes y conteo de citas
+    return list(report.values())
+
 
 class ReportService:
     def get_appointments_count_by_therapist(self, request):
@@ -21,31 +141,95 @@ class ReportService:
             # Si no se pasa fecha, usar la fecha local actual en formato YYYY-MM-DD
             query_date = localtime().date().strftime("%Y-%m-%d")
 
-        # Consultar terapeutas con la cantidad de citas en la fecha indicada
-        therapists = (
-            Therapist.objects
-            .annotate(
-                # Anotar cada terapeuta con el conteo de citas filtradas por la fecha
-                appointments_count=Count(
-                    "appointments",
-                    filter=Q(appointments__appointment_date=query_date)
-                )
-            )
-            # Filtrar para quedarnos solo con terapeutas que tengan citas en esa fecha
-            .filter(appointments_count__gt=0)
-            # Solo seleccionar campos específicos para el resultado
-            .values("id", "name", "paternal_lastname", "maternal_lastname", "appointments_count")
+        # Agrupar las citas activas de la fecha por terapeuta: la consulta parte de las citas
+        # del día (índice parcial por fecha y terapeuta) en lugar de recorrer todos los terapeutas
+        grupos = (
+            Appointment.objects
+            .filter(appointment_date=query_date, therapist__isnull=False)
+            .values("therapist_id", "therapist__name", "therapist__paternal_lastname", "therapist__maternal_lastname")
+            .annotate(appointments_count=Count("id"))
+            .order_by("therapist_id")
         )
+        therapists = [
+            {
+                "id": grupo["therapist_id"],
+                "name": grupo["therapist__name"],
+                "paternal_lastname": grupo["therapist__paternal_lastname"],
+                "maternal_lastname": grupo["therapist__maternal_lastname"],
+                "appointments_count": grupo["appointments_count"]
+            }
+            for grupo in grupos
+        ]
 
         # Sumar el total de citas de todos los terapeutas en la fecha
         total_appointments = sum(t["appointments_count"] for t in therapists)
 
         # Retornar el listado de terapeutas con su conteo y el total general
         return {
-            "therapists_appointments": list(therapists),
+            "therapists_appointments": therapists,
             "total_appointments_count": total_appointments
         }
 
+    def get_appointments_matrix_by_therapist(self, request):
+        """
+        Matriz terapeuta x fecha con la cantidad de citas entre start_date y end_date
+        (inclusive), con totales por terapeuta (filas) y por fecha (columnas).
+        Se calcula con una sola consulta agrupada por (terapeuta, fecha).
+        """
+        start_date, end_date, error = self.validar_rango_citas(request)
+        if error:
+            return {"error": error}
+
+        start = datetime.strptime(start_date, "%Y-%m-%d").date()
+        end = datetime.strptime(end_date, "%Y-%m-%d").date()
+        if start > end:
+            return {"error": "La fecha de inicio no puede ser mayor que la fecha de fin."}
+        if (end - start).days + 1 > MAX_DIAS_MATRIZ:
+            return {"error": f"El rango no puede superar {MAX_DIAS_MATRIZ} días."}
+
+        dates = [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+        columna = {fecha: i for i, fecha in enumerate(dates)}
+
+        # Una fila por (terapeuta, fecha) con citas, ordenadas por terapeuta
+        grupos = (
+            Appointment.objects
+            .filter(
+                appointment_date__range=(start, end),
+                therapist__isnull=False
+            )
+            .values(
+                "therapist_id", "therapist__name", "therapist__paternal_lastname",
+                "therapist__maternal_lastname", "appointment_date"
+            )
+            .annotate(appointments_count=Count("id"))
+            .order_by("therapist__paternal_lastname", "therapist__maternal_lastname", "therapist__name", "therapist_id")
+        )
+
+        therapists = {}
+        totals_by_date = [0] * len(dates)
+        for grupo in grupos:
+            t_id = grupo["therapist_id"]
+            if t_id not in therapists:
+                therapists[t_id] = {
+                    "id": t_id,
+                    "name": grupo["therapist__name"],
+                    "paternal_lastname": grupo["therapist__paternal_lastname"],
+                    "maternal_lastname": grupo["therapist__maternal_lastname"],
+                    "appointments": [0] * len(dates),
+                    "total": 0
+                }
+            i = columna[grupo["appointment_date"].isoformat()]
+            therapists[t_id]["appointments"][i] = grupo["appointments_count"]
+            therapists[t_id]["total"] += grupo["appointments_count"]
+            totals_by_date[i] += grupo["appointments_count"]
+
+        return {
+            "dates": dates,
+            "therapists": list(therapists.values()),
+            "totals_by_date": totals_by_date,
+            "total_appointments_count": sum(totals_by_date)
+        }
+
     def get_patients_by_therapist(self, request):
         # Obtener fecha de parámetro GET "date"
         query_date = request.GET.get("date")
@@ -60,189 +244,346 @@ class ReportService:
         except ValueError:
             return {"error": "Formato de fecha inválido. Use YYYY-MM-DD."}
 
-        # Consultar citas para la fecha, que no estén marcadas como eliminadas (deleted_at is null)
-        # y traer datos relacionados de paciente y terapeuta para evitar consultas adicionales
-        appointments = (
+        # Agrupar en la base de datos las citas activas de la fecha por (terapeuta, paciente):
+        # solo vuelve una fila por par con los nombres y la cantidad de citas.
+        # primera_cita conserva el orden en que aparecen terapeutas y pacientes.
+        grupos = (
             Appointment.objects
-            .select_related("patient", "therapist")
             .filter(
                 appointment_date=query_date,
-                deleted_at__isnull=True
+                patient__isnull=False
             )
+            .values(*CAMPOS_TERAPEUTA_PACIENTE)
+            .annotate(appointments=Count("id"), primera_cita=Min("id"))
+            .order_by("primera_cita")
         )
 
-        # Diccionario donde se almacenará el reporte final agrupado por terapeuta
-        report = {}
+        return armar_pacientes_por_terapeuta(grupos)
 
-        # Estructura para pacientes que no tienen terapeuta asignado
-        sin_terapeuta = {
-            "therapist_id": "",
-            "therapist": "Sin terapeuta asignado",
-            "patients": {}
-        }
-
-        # Recorrer cada cita
-        for appointment in appointments:
-            patient = appointment.patient
-            therapist = appointment.therapist
+    def get_single_date_reports(self, request):
+        """
+        Los tres reportes de una fecha (citas por terapeuta, pacientes por terapeuta y
+        resumen de caja) con una sola consulta sobre las citas del día, agrupada por
+        terapeuta, paciente y tipo de pago. Cada sección se
+        arma desde esas filas con las mismas reglas que su endpoint individual. Si el
+        día tiene cierre de caja, el resumen de caja se lee del cierre.
+        """
+        query_date = request.GET.get("date")
 
-            # Si no hay paciente asignado, ignorar esa cita
-            if not patient:
-                continue
+        if query_date:
+            try:
+                datetime.strptime(query_date, "%Y-%m-%d")
+            except ValueError:
+                return {"error": "Formato de fecha inválido. Use YYYY-MM-DD."}
+        else:
+            query_date = localtime().date().strftime("%Y-%m-%d")
 
-            # Datos básicos del paciente junto con un contador inicial de citas = 1
-            patient_data = {
-                "patient_id": patient.id,
-                "patient": f"{patient.paternal_lastname} {patient.maternal_lastname} {patient.name}".strip(),
-                "appointments": 1
-            }
+        grupos = (
+            Appointment.objects
+            .filter(appointment_date=query_date)
+            .values(*CAMPOS_TERAPEUTA_PACIENTE, "payment_type__name")
+            .annotate(citas=Count("id"), monto=Sum("payment"), primera_cita=Min("id"))
+            .order_by("primera_cita")
+        )
 
-            if not therapist:
-                # Si la cita no tiene terapeuta, agregar o actualizar en sin_terapeuta
-                key = patient.id
-                if key not in sin_terapeuta["patients"]:
-                    sin_terapeuta["patients"][key] = patient_data
-                else:
-                    sin_terapeuta["patients"][key]["appointments"] += 1
-            else:
-                # Si tiene terapeuta, agregar o actualizar en report bajo el terapeuta correspondiente
-                t_id = therapist.id
-                if t_id not in report:
-                    # Crear entrada para el terapeuta si no existe
-                    report[t_id] = {
-                        "therapist_id": t_id,
-                        "therapist": f"{therapist.paternal_lastname} {therapist.maternal_lastname} {therapist.name}".strip(),
-                        "patients": {}
+        terapeutas = {}
+        pares = {}
+        caja = {}
+        for grupo in grupos:
+            # Citas por terapeuta: citas del día con terapeuta
+            t_id = grupo["therapist_id"]
+            if t_id is not None:
+                if t_id not in terapeutas:
+                    terapeutas[t_id] = {
+                        "id": t_id,
+                        "name": grupo["therapist__name"],
+                        "paternal_lastname": grupo["therapist__paternal_lastname"],
+                        "maternal_lastname": grupo["therapist__maternal_lastname"],
+                        "appointments_count": 0
                     }
-                key = patient.id
-                if key not in report[t_id]["patients"]:
-                    report[t_id]["patients"][key] = patient_data
-                else:
-                    report[t_id]["patients"][key]["appointments"] += 1
+                terapeutas[t_id]["appointments_count"] += grupo["citas"]
 
-        # Si hay pacientes sin terapeuta, agregarlos al reporte final
-        if sin_terapeuta["patients"]:
-            report["sinTherapist"] = sin_terapeuta
+            # Pacientes por terapeuta: citas con paciente, en orden de su primera cita
+            if grupo["patient_id"] is not None:
+                clave = (t_id, grupo["patient_id"])
+                if clave not in pares:
+                    pares[clave] = dict(grupo, appointments=0)
+                pares[clave]["appointments"] += grupo["citas"]
 
-        # Convertir los diccionarios de pacientes a listas para facilitar manejo en frontend/JSON
-        for therapist_id in report:
-            report[therapist_id]["patients"] = list(report[therapist_id]["patients"].values())
+            # Caja: montos de las citas con pago y tipo de pago
+            if grupo["monto"] is not None and grupo["payment_type__name"] is not None:
+                caja[grupo["payment_type__name"]] = caja.get(grupo["payment_type__name"], 0) + grupo["monto"]
 
-        # Retornar la lista de terapeutas con sus pacientes y conteo de citas
-        return list(report.values())
+        therapists = sorted(terapeutas.values(), key=lambda t: t["id"])
+
+        cierre = DailyCashClosure.objects.filter(day=query_date).first()
+        if cierre is not None:
+            lineas = cierre.lineas
+        else:
+            lineas = ordenar_lineas_caja(
+                {"payment_type": nombre, "total_payment": total} for nombre, total in caja.items()
+            )
+
+        return {
+            "date": query_date,
+            "appointments_per_therapist": {
+                "therapists_appointments": therapists,
+                "total_appointments_count": sum(t["appointments_count"] for t in therapists)
+            },
+            "patients_by_therapist": armar_pacientes_por_terapeuta(pares.values()),
+            "daily_cash": formatear_lineas_caja(lineas),
+            "cash_closure": None if cierre is None else ("modified" if cierre.modificado else "closed")
+        }
 
     def get_daily_cash(self, request):
         """
         Obtiene el resumen diario de efectivo agrupado por tipo de pago y monto total,
         ordenado específicamente: Cupón, EFECTIVO, Yape, Otros.
         """
+        data, _ = self.get_daily_cash_con_cierre(request)
+        return data
+
+    def get_daily_cash_con_cierre(self, request):
+        """
+        Igual que get_daily_cash, pero retorna (data, cierre). Si el día tiene
+        cierre de caja se leen sus totales congelados (una consulta por la fecha)
+        en lugar de agregar las citas; cierre es None si el día no está cerrado.
+        """
         query_date = request.GET.get("date")
 
         if query_date:
             try:
                 datetime.strptime(query_date, "%Y-%m-%d")
             except ValueError:
-                return {"error": "Formato de fecha inválido. Use YYYY-MM-DD."}
+                return {"error": "Formato de fecha inválido. Use YYYY-MM-DD."}, None
         else:
             query_date = localtime().date().strftime("%Y-%m-%d")
 
-        # Consulta: citas del día con pago, que no estén eliminadas
-        payments = (
+        cierre = DailyCashClosure.objects.filter(day=query_date).first()
+        if cierre is not None:
+            return formatear_lineas_caja(cierre.lineas), cierre
+
+        return formatear_lineas_caja(self.totales_caja(query_date)), None
+
+    def pagos_agrupados(self, lookup, valor, desde_citas=False):
+        """
+        Montos por (día, tipo de pago) de las citas activas con pago cuya fecha
+        cumple lookup (sufijo sobre el campo de fecha, ej. "" o "__range") con valor.
+        Con desde_citas=True se ignora el resumen diario aunque esté habilitado.
+        Retorna filas {dia, payment_type__name, total_payment}.
+        """
+        if not desde_citas and getattr(settings, "APPOINTMENT_ROLLUP_ENABLED", False):
+            # Consulta sobre el resumen diario: una fila por grupo del día, no por cita
+            return (
+                AppointmentDailyRollup.objects
+                .filter(
+                    ingresos__isnull=False,
+                    payment_type__isnull=False,
+                    **{f"day{lookup}": valor}
+                )
+                .values('payment_type__name', dia=F('day'))
+                .annotate(total_payment=models.Sum('ingresos'))
+            )
+
+        # Consulta: citas activas con pago (Appointment.objects excluye las eliminadas)
+        return (
             Appointment.objects
             .filter(
-                appointment_date=query_date,
-                deleted_at__isnull=True,
                 payment__isnull=False,
                 payment_type__isnull=False,
+                **{f"appointment_date{lookup}": valor}
             )
-            .values('payment_type__name')
+            .values('payment_type__name', dia=F('appointment_date'))
             .annotate(total_payment=models.Sum('payment'))
         )
 
-        # Crear diccionario para ordenar segun orden requerido
-        order = {"Cupón": 0, "EFECTIVO": 1, "Yape": 2}
-
-        # Separar los que tienen nombre en orden y los otros
-        pagos_ordenados = []
-        otros = []
-
-        for p in payments:
-            tipo = p['payment_type__name']
-            if tipo in order:
-                pagos_ordenados.append(p)
-            else:
-                otros.append(p)
-
-        # Ordenar pagos_ordenados según el orden definido
-        pagos_ordenados.sort(key=lambda x: order[x['payment_type__name']])
-        # Agregar al final los "otros"
-        pagos_ordenados.extend(otros)
+    def totales_caja(self, query_date, desde_citas=False):
+        """
+        Totales por tipo de pago de una fecha, calculados sobre las citas, como
+        [{"payment_type", "total_payment" (Decimal)}] en el orden del reporte.
+        """
+        payments = self.pagos_agrupados("", query_date, desde_citas=desde_citas)
+        return ordenar_lineas_caja(
+            {"payment_type": p['payment_type__name'], "total_payment": p['total_payment']}
+            for p in payments
+        )
 
-        # Cambiar estructura para mejor legibilidad, si quieres:
-        result = [
-            {
-                "payment_type": p['payment_type__name'],
-                "total_payment": float(p['total_payment'])
-            }
-            for p in pagos_ordenados
-        ]
+    def get_daily_cash_between_dates(self, request):
+        """
+        Resumen de caja de cada día entre start_date y end_date (inclusive) y del
+        rango completo. Los días cerrados se leen del registro de cierres; solo los
+        días sin cierre se agregan desde las citas, en una única consulta.
+        """
+        start_date, end_date, error = self.validar_rango_citas(request)
+        if error:
+            return {"error": error}
+        start = datetime.strptime(start_date, "%Y-%m-%d").date()
+        end = datetime.strptime(end_date, "%Y-%m-%d").date()
+        if start > end:
+            return {"error": "La fecha de inicio no puede ser mayor que la fecha de fin."}
+        if (end - start).days + 1 > MAX_DIAS_CAJA:
+            return {"error": f"El rango no puede superar {MAX_DIAS_CAJA} días."}
+
+        dias = {}
+        for cierre in DailyCashClosure.objects.filter(day__range=(start, end)):
+            dias[cierre.day] = {"lineas": cierre.lineas, "closed": True, "modified": cierre.modificado}
+
+        # Días sin cierre: montos por (día, tipo de pago) desde las citas
+        abiertos = {}
+        for p in self.pagos_agrupados("__range", (start, end)).exclude(dia__in=list(dias)):
+            abiertos.setdefault(p["dia"], []).append(
+                {"payment_type": p["payment_type__name"], "total_payment": p["total_payment"]}
+            )
+        for dia, lineas in abiertos.items():
+            dias[dia] = {"lineas": ordenar_lineas_caja(lineas), "closed": False, "modified": False}
+
+        totales = {}
+        days = []
+        for dia in sorted(dias):
+            lineas = [
+                {"payment_type": linea["payment_type"], "total_payment": Decimal(str(linea["total_payment"]))}
+                for linea in dias[dia]["lineas"]
+            ]
+            for linea in lineas:
+                totales[linea["payment_type"]] = totales.get(linea["payment_type"], 0) + linea["total_payment"]
+            days.append({
+                "date": dia.isoformat(),
+                "payments": formatear_lineas_caja(lineas),
+                "total": float(sum(linea["total_payment"] for linea in lineas)),
+                "closed": dias[dia]["closed"],
+                "modified": dias[dia]["modified"],
+            })
 
-        return result
+        payment_types = ordenar_lineas_caja(
+            {"payment_type": nombre, "total_payment": total} for nombre, total in totales.items()
+        )
+        return {
+            "start_date": start_date,
+            "end_date": end_date,
+            "days": days,
+            "payment_types": formatear_lineas_caja(payment_types),
+            "total": float(sum(totales.values())),
+        }
 
-    def get_appointments_between_dates(self, request):
+    def validar_rango_citas(self, request):
         """
-        Obtiene todas las citas entre dos fechas dadas (inclusive),
-        con información del paciente y terapeuta.
+        Valida los parámetros GET start_date y end_date (YYYY-MM-DD).
+        Retorna (start_date, end_date, error); error es None si el rango es válido.
         """
         start_date = request.GET.get("start_date")
         end_date = request.GET.get("end_date")
 
         if not start_date or not end_date:
-            return {"error": "Parámetros start_date y end_date son obligatorios."}
+            return None, None, "Parámetros start_date y end_date son obligatorios."
 
         try:
             datetime.strptime(start_date, "%Y-%m-%d")
             datetime.strptime(end_date, "%Y-%m-%d")
         except ValueError:
-            return {"error": "Formato de fecha inválido. Use YYYY-MM-DD."}
+            return None, None, "Formato de fecha inválido. Use YYYY-MM-DD."
+
+        return start_date, end_date, None
+
+    def get_appointments_between_dates(self, request):
+        """
+        Obtiene todas las citas entre dos fechas dadas (inclusive),
+        con información del paciente y terapeuta.
+        """
+        start_date, end_date, error = self.validar_rango_citas(request)
+        if error:
+            return {"error": error}
+
+        return list(self.iter_appointments_between_dates(start_date, end_date))
+
+    def iter_appointments_between_dates(self, start_date, end_date):
+        """
+        Recorre las citas entre dos fechas (inclusive) sin instanciar modelos.
+        Una sola consulta con los campos necesarios (incluido el tipo de pago),
+        leída por bloques, por lo que la memoria no crece con el tamaño del rango.
+        """
+        appointments = self._citas_entre_fechas(start_date, end_date)
+        for app in appointments.iterator(chunk_size=CHUNK_SIZE):
+            yield self.formatear_cita(app)
+
+    def contar_appointments_between_dates(self, start_date, end_date):
+        """Cantidad de citas activas entre dos fechas (inclusive)."""
+        return self._citas_entre_fechas(start_date, end_date).count()
 
-        appointments = (
+    def _citas_entre_fechas(self, start_date, end_date):
+        """
+        Citas activas del rango con los campos de CAMPOS_CITA, en orden
+        (appointment_date, appointment_hour, id); las horas nulas van primero.
+        """
+        return (
             Appointment.objects
-            .select_related("patient", "therapist")
             .filter(
                 appointment_date__gte=start_date,
-                appointment_date__lte=end_date,
-                deleted_at__isnull=True
+                appointment_date__lte=end_date
             )
-            .order_by("appointment_date", "appointment_hour")
+            .order_by("appointment_date", F("appointment_hour").asc(nulls_first=True), "id")
+            .values(*CAMPOS_CITA)
         )
 
-        result = []
-        for app in appointments:
-            therapist_name = "Sin terapeuta asignado"
-            if app.therapist:
-                therapist_name = " ".join(filter(None, [
-                    app.therapist.paternal_lastname,
-                    app.therapist.maternal_lastname,
-                    app.therapist.name
-                ]))
-
-            patient_name = "Paciente desconocido"
-            if app.patient:
-                patient_name = " ".join(filter(None, [
-                    app.patient.paternal_lastname,
-                    app.patient.maternal_lastname,
-                    app.patient.name
-                ]))
-
-            result.append({
-                "appointment_id": app.id,
-                "appointment_date": app.appointment_date.strftime("%Y-%m-%d"),
-                "appointment_hour": app.appointment_hour if isinstance(app.appointment_hour, str) else app.appointment_hour.strftime("%H:%M"),
-                "therapist": therapist_name,
-                "patient": patient_name,
-                "payment": float(app.payment) if app.payment else 0,
-                "payment_type": app.payment_type.name if app.payment_type else "No definido"
-            })
+    def get_appointments_page(self, start_date, end_date, limit, cursor=None):
+        """
+        Página de citas del rango con paginación por llave (keyset) sobre
+        (appointment_date, appointment_hour, id). En lugar de OFFSET se filtra
+        a partir de la última cita de la página anterior, así que cualquier página
+        cuesta lo mismo que la primera.
+        Retorna {"results": [...], "next": cursor opaco o None}.
+        """
+        appointments = self._citas_entre_fechas(start_date, end_date)
+        if cursor:
+            appointments = appointments.filter(self._despues_de(*cursor))
+
+        # Se pide una fila extra para saber si hay una página siguiente
+        filas = list(appointments[:limit + 1])
+        siguiente = None
+        if len(filas) > limit:
+            filas = filas[:limit]
+            ultima = filas[-1]
+            siguiente = codificar_cursor(ultima["appointment_date"], ultima["appointment_hour"], ultima["id"])
 
-        return result
+        return {
+            "results": [self.formatear_cita(app) for app in filas],
+            "next": siguiente
+        }
+
+    @staticmethod
+    def _despues_de(fecha, hora, pk):
+        """Condición de las citas posteriores a (fecha, hora, pk) en el orden del reporte."""
+        if hora is None:
+            misma_fecha = Q(appointment_hour__isnull=True, id__gt=pk) | Q(appointment_hour__isnull=False)
+        else:
+            misma_fecha = Q(appointment_hour__gt=hora) | Q(appointment_hour=hora, id__gt=pk)
+        return Q(appointment_date__gt=fecha) | (Q(appointment_date=fecha) & misma_fecha)
+
+    @staticmethod
+    def formatear_cita(app):
+        """Convierte una fila de CAMPOS_CITA al formato del reporte de citas."""
+        therapist_name = "Sin terapeuta asignado"
+        if app["therapist_id"]:
+            therapist_name = " ".join(filter(None, [
+                app["therapist__paternal_lastname"],
+                app["therapist__maternal_lastname"],
+                app["therapist__name"]
+            ]))
+
+        patient_name = "Paciente desconocido"
+        if app["patient_id"]:
+            patient_name = " ".join(filter(None, [
+                app["patient__paternal_lastname"],
+                app["patient__maternal_lastname"],
+                app["patient__name"]
+            ]))
+
+        hour = app["appointment_hour"]
+        return {
+            "appointment_id": app["id"],
+            "appointment_date": app["appointment_date"].strftime("%Y-%m-%d"),
+            "appointment_hour": hour.strftime("%H:%M") if hour else "",
+            "therapist": therapist_name,
+            "patient": patient_name,
+            "payment": float(app["payment"]) if app["payment"] else 0,
+            "payment_type": app["payment_type__name"] if app["payment_type_id"] else "No definido"
+        }
@@ -0,0 +1,25 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from base_models.models import Appointment
+from app_statistics.signals import _como_fecha
+from .services.cash_closure import verificar_dias
+
+
+@receiver(post_save, sender=Appointment)
+def verificar_cierre_al_guardar(sender, instance, raw=False, **kwargs):
+    # Marca como modificado el cierre de caja de la fecha (y de la anterior, si la cita
+    # cambió de día) cuando sus totales ya no coinciden. _rollup_dia_anterior lo
+    # guarda la señal pre_save de app_statistics.
+    if raw:
+        return
+    dias = {
+        _como_fecha(instance.appointment_date),
+        getattr(instance, "_rollup_dia_anterior", None),
+    }
+    verificar_dias(dias)
+
+
+@receiver(post_delete, sender=Appointment)
+def verificar_cierre_al_eliminar(sender, instance, **kwargs):
+    dia = _como_fecha(instance.appointment_date)
+    verificar_dias({dia})
@@ -103,174 +103,207 @@ function showNotification(message, type = 'info') {
 }
 
 /**
- * Carga el reporte de citas por terapeuta
- * @param {string} date - Fecha en formato YYYY-MM-DD
+ * Muestra el reporte de citas por terapeuta
+ * @param {Object} data - Respuesta de appointments-per-therapist
  */
-async function loadTherapistAppointments(date) {
-    const loading = document.getElementById('loading-therapist-appointments');
+function renderTherapistAppointments(data) {
     const tbody = document.getElementById('therapist-appointments-body');
     const totalEl = document.getElementById('total-appointments');
     
-    loading.style.display = 'block';
+    tbody.innerHTML = '';
+    totalEl.textContent = data.total_appointments_count || 0;
     
-    try {
-        const data = await fetchData(`${window.API_URLS.appointmentsPerTherapist}?date=${date}`);
-        
-        tbody.innerHTML = '';
-        totalEl.textContent = data.total_appointments_count || 0;
-        
-        if (data.therapists_appointments && data.therapists_appointments.length > 0) {
-            data.therapists_appointments.forEach(therapist => {
-                const percentage = data.total_appointments_count > 0 ? 
-                    ((therapist.appointments_count / data.total_appointments_count) * 100).toFixed(1) : 0;
-                
-                const row = document.createElement('tr');
-                const therapistName = [
-                    therapist.paternal_lastname,
-                    therapist.maternal_lastname, 
-                    therapist.name
-                ].filter(Boolean).join(' ');
-                
-                row.innerHTML = `
-                    <td title="${therapistName}">${therapistName}</td>
-                    <td><span class="badge">${therapist.appointments_count}</span></td>
-                    <td><span class="percentage">${percentage}%</span></td>
-                `;
-                tbody.appendChild(row);
-            });
-        } else {
-            tbody.innerHTML = '<tr class="no-data"><td colspan="3">No hay datos para esta fecha</td></tr>';
-        }
-    } catch (error) {
-        tbody.innerHTML = '<tr class="no-data"><td colspan="3">Error al cargar los datos</td></tr>';
-        totalEl.textContent = '0';
-        console.error('Error loading therapist appointments:', error);
-    } finally {
-        loading.style.display = 'none';
+    if (data.therapists_appointments && data.therapists_appointments.length > 0) {
+        data.therapists_appointments.forEach(therapist => {
+            const percentage = data.total_appointments_count > 0 ? 
+                ((therapist.appointments_count / data.total_appointments_count) * 100).toFixed(1) : 0;
+            
+            const row = document.createElement('tr');
+            const therapistName = [
+                therapist.paternal_lastname,
+                therapist.maternal_lastname, 
+                therapist.name
+            ].filter(Boolean).join(' ');
+            
+            row.innerHTML = `
+                <td title="${therapistName}">${therapistName}</td>
+                <td><span class="badge">${therapist.appointments_count}</span></td>
+                <td><span class="percentage">${percentage}%</span></td>
+            `;
+            tbody.appendChild(row);
+        });
+    } else {
+        tbody.innerHTML = '<tr class="no-data"><td colspan="3">No hay datos para esta fecha</td></tr>';
     }
 }
 
 /**
- * Carga el reporte de pacientes por terapeuta
- * @param {string} date - Fecha en formato YYYY-MM-DD
+ * Muestra el error del reporte de citas por terapeuta
  */
-async function loadPatientsByTherapist(date) {
-    const loading = document.getElementById('loading-patients');
+function renderTherapistAppointmentsError() {
+    document.getElementById('therapist-appointments-body').innerHTML =
+        '<tr class="no-data"><td colspan="3">Error al cargar los datos</td></tr>';
+    document.getElementById('total-appointments').textContent = '0';
+}
+
+/**
+ * Muestra el reporte de pacientes por terapeuta
+ * @param {Array} data - Respuesta de patients-by-therapist
+ */
+function renderPatientsByTherapist(data) {
     const container = document.getElementById('patients-container');
     
-    loading.style.display = 'block';
+    container.innerHTML = '';
     
-    try {
-        const data = await fetchData(`${window.API_URLS.patientsByTherapist}?date=${date}`);
-        
-        container.innerHTML = '';
-        
-        if (data && data.length > 0) {
-            data.forEach(therapist => {
-                const therapistDiv = document.createElement('div');
-                therapistDiv.className = 'therapist-group';
-                
-                // Crear lista de pacientes
-                const patientsHtml = therapist.patients.map(patient => 
-                    `<div class="patient-item">
-                        <span class="patient-name" title="${patient.patient}">${patient.patient}</span>
-                        <span class="patient-appointments">${patient.appointments} cita${patient.appointments > 1 ? 's' : ''}</span>
-                    </div>`
-                ).join('');
-                
-                // Calcular total de citas para este terapeuta
-                const totalAppointments = therapist.patients.reduce((sum, patient) => sum + patient.appointments, 0);
-                
-                therapistDiv.innerHTML = `
-                    <h4 class="therapist-name">
-                        <i class="fas fa-user-md"></i>
-                        ${therapist.therapist}
-                        <span class="patient-count">${therapist.patients.length} pacientes - ${totalAppointments} citas</span>
-                    </h4>
-                    <div class="patients-list">
-                        ${patientsHtml}
-                    </div>
-                `;
-                
-                container.appendChild(therapistDiv);
-            });
-        } else {
-            container.innerHTML = '<p class="no-data-message">No hay pacientes para esta fecha</p>';
-        }
-    } catch (error) {
-        container.innerHTML = '<p class="no-data-message">Error al cargar los pacientes</p>';
-        console.error('Error loading patients by therapist:', error);
-    } finally {
-        loading.style.display = 'none';
+    if (data && data.length > 0) {
+        data.forEach(therapist => {
+            const therapistDiv = document.createElement('div');
+            therapistDiv.className = 'therapist-group';
+            
+            // Crear lista de pacientes
+            const patientsHtml = therapist.patients.map(patient => 
+                `<div class="patient-item">
+                    <span class="patient-name" title="${patient.patient}">${patient.patient}</span>
+                    <span class="patient-appointments">${patient.appointments} cita${patient.appointments > 1 ? 's' : ''}</span>
+                </div>`
+            ).join('');
+            
+            // Calcular total de citas para este terapeuta
+            const totalAppointments = therapist.patients.reduce((sum, patient) => sum + patient.appointments, 0);
+            
+            therapistDiv.innerHTML = `
+                <h4 class="therapist-name">
+                    <i class="fas fa-user-md"></i>
+                    ${therapist.therapist}
+                    <span class="patient-count">${therapist.patients.length} pacientes - ${totalAppointments} citas</span>
+                </h4>
+                <div class="patients-list">
+                    ${patientsHtml}
+                </div>
+            `;
+            
+            container.appendChild(therapistDiv);
+        });
+    } else {
+        container.innerHTML = '<p class="no-data-message">No hay pacientes para esta fecha</p>';
     }
 }
 
 /**
- * Carga el resumen de caja diaria
- * @param {string} date - Fecha en formato YYYY-MM-DD
+ * Muestra el error del reporte de pacientes por terapeuta
  */
-async function loadDailyCash(date) {
-    const loading = document.getElementById('loading-cash');
+function renderPatientsByTherapistError() {
+    document.getElementById('patients-container').innerHTML =
+        '<p class="no-data-message">Error al cargar los pacientes</p>';
+}
+
+/**
+ * Muestra el resumen de caja diaria
+ * @param {Array} data - Respuesta de daily-cash
+ */
+function renderDailyCash(data) {
     const container = document.getElementById('cash-summary');
     
-    loading.style.display = 'block';
+    container.innerHTML = '';
     
-    try {
-        const data = await fetchData(`${window.API_URLS.dailyCash}?date=${date}`);
+    if (data && data.length > 0) {
+        let total = 0;
         
-        container.innerHTML = '';
-        
-        if (data && data.length > 0) {
-            let total = 0;
-            
-            // Crear elementos de cada tipo de pago
-            const cashItems = data.map(item => {
-                total += item.total_payment;
-                return `
-                    <div class="cash-item">
-                        <span class="payment-type">${item.payment_type}</span>
-                        <span class="payment-amount">S/. ${item.total_payment.toFixed(2)}</span>
-                    </div>
-                `;
-            }).join('');
-            
-            container.innerHTML = `
-                <div class="cash-items">
-                    ${cashItems}
-                </div>
-                <div class="cash-total">
-                    <strong>Total del día: S/. ${total.toFixed(2)}</strong>
+        // Crear elementos de cada tipo de pago
+        const cashItems = data.map(item => {
+            total += item.total_payment;
+            return `
+                <div class="cash-item">
+                    <span class="payment-type">${item.payment_type}</span>
+                    <span class="payment-amount">S/. ${item.total_payment.toFixed(2)}</span>
                 </div>
             `;
-        } else {
-            container.innerHTML = '<p class="no-data-message">No hay movimientos de caja para esta fecha</p>';
-        }
+        }).join('');
+        
+        container.innerHTML = `
+            <div class="cash-items">
+                ${cashItems}
+            </div>
+            <div class="cash-total">
+                <strong>Total del día: S/. ${total.toFixed(2)}</strong>
+            </div>
+        `;
+    } else {
+        container.innerHTML = '<p class="no-data-message">No hay movimientos de caja para esta fecha</p>';
+    }
+}
+
+/**
+ * Muestra el error del resumen de caja diaria
+ */
+function renderDailyCashError() {
+    document.getElementById('cash-summary').innerHTML =
+        '<p class="no-data-message">Error al cargar el resumen de caja</p>';
+}
+
+// Indicadores de carga de los reportes de fecha única
+const SINGLE_DATE_LOADINGS = ['loading-therapist-appointments', 'loading-patients', 'loading-cash'];
+
+/**
+ * Carga los tres reportes de una fecha con una sola petición
+ * @param {string} date - Fecha en formato YYYY-MM-DD
+ */
+async function loadSingleDateData(date) {
+    SINGLE_DATE_LOADINGS.forEach(id => { document.getElementById(id).style.display = 'block'; });
+    
+    try {
+        const data = await fetchData(`${window.API_URLS.singleDateReports}?date=${date}`);
+        
+        renderTherapistAppointments(data.appointments_per_therapist);
+        renderPatientsByTherapist(data.patients_by_therapist);
+        renderDailyCash(data.daily_cash);
     } catch (error) {
-        container.innerHTML = '<p class="no-data-message">Error al cargar el resumen de caja</p>';
-        console.error('Error loading daily cash:', error);
+        renderTherapistAppointmentsError();
+        renderPatientsByTherapistError();
+        renderDailyCashError();
+        console.error('Error loading single date reports:', error);
     } finally {
-        loading.style.display = 'none';
+        SINGLE_DATE_LOADINGS.forEach(id => { document.getElementById(id).style.display = 'none'; });
     }
 }
 
+// Citas por página en el reporte de rango de fechas
+const DATE_RANGE_PAGE_SIZE = 200;
+
+// Estado del reporte de rango: se acumula mientras se cargan más páginas
+const dateRangeState = { startDate: null, endDate: null, next: null, count: 0, total: 0 };
+
 /**
- * Carga las citas en un rango de fechas
+ * Carga las citas en un rango de fechas, una página a la vez
  * @param {string} startDate - Fecha de inicio en formato YYYY-MM-DD
  * @param {string} endDate - Fecha de fin en formato YYYY-MM-DD
+ * @param {string|null} cursor - Cursor 'next' de la página anterior (null para la primera)
  */
-async function loadDateRangeAppointments(startDate, endDate) {
+async function loadDateRangeAppointments(startDate, endDate, cursor = null) {
     const loading = document.getElementById('loading-date-range');
     const tbody = document.getElementById('date-range-body');
     
     loading.style.display = 'block';
     
     try {
-        const data = await fetchData(`${window.API_URLS.appointmentsBetweenDates}?start_date=${startDate}&end_date=${endDate}`);
+        let url = `${window.API_URLS.appointmentsBetweenDates}?start_date=${startDate}&end_date=${endDate}&limit=${DATE_RANGE_PAGE_SIZE}`;
+        if (cursor) {
+            url += `&cursor=${encodeURIComponent(cursor)}`;
+        }
+        const data = await fetchData(url);
         
-        tbody.innerHTML = '';
+        if (!cursor) {
+            tbody.innerHTML = '';
+            Object.assign(dateRangeState, { startDate, endDate, next: null, count: 0, total: 0 });
+        }
+        // Quitar el resumen y el botón de la página anterior
+        tbody.querySelectorAll('.summary-row, .load-more-row').forEach(row => row.remove());
+        
+        const appointments = data.results || [];
+        dateRangeState.next = data.next;
         
-        if (data && data.length > 0) {
-            data.forEach(appointment => {
+        if (appointments.length > 0 || dateRangeState.count > 0) {
+            appointments.forEach(appointment => {
                 const row = document.createElement('tr');
                 row.innerHTML = `
                     <td>${formatDate(appointment.appointment_date)}</td>
@@ -283,17 +316,30 @@ async function loadDateRangeAppointments(startDate, endDate) {
                 tbody.appendChild(row);
             });
             
-            // Agregar fila con resumen
-            const totalPayment = data.reduce((sum, app) => sum + parseFloat(app.payment), 0);
+            dateRangeState.count += appointments.length;
+            dateRangeState.total += appointments.reduce((sum, app) => sum + parseFloat(app.payment), 0);
+            
+            // Agregar fila con resumen de las citas cargadas
             const summaryRow = document.createElement('tr');
             summaryRow.className = 'summary-row';
             summaryRow.innerHTML = `
-                <td colspan="4"><strong>Total (${data.length} citas)</strong></td>
-                <td class="payment-cell"><strong>S/. ${totalPayment.toFixed(2)}</strong></td>
+                <td colspan="4"><strong>Total (${dateRangeState.count} citas${dateRangeState.next ? ' cargadas' : ''})</strong></td>
+                <td class="payment-cell"><strong>S/. ${dateRangeState.total.toFixed(2)}</strong></td>
                 <td></td>
             `;
             tbody.appendChild(summaryRow);
             
+            // Botón para la página siguiente
+            if (dateRangeState.next) {
+                const moreRow = document.createElement('tr');
+                moreRow.className = 'load-more-row';
+                moreRow.innerHTML = '<td colspan="6"><button class="btn btn-secondary">Cargar más citas</button></td>';
+                moreRow.querySelector('button').addEventListener('click', () => {
+                    loadDateRangeAppointments(dateRangeState.startDate, dateRangeState.endDate, dateRangeState.next);
+                });
+                tbody.appendChild(moreRow);
+            }
+            
         } else {
             tbody.innerHTML = '<tr class="no-data"><td colspan="6">No hay citas en este rango de fechas</td></tr>';
         }
@@ -321,10 +367,8 @@ function loadSingleDateReports() {
         return;
     }
     
-    // Cargar todos los reportes de fecha única
-    loadTherapistAppointments(date);
-    loadPatientsByTherapist(date);
-    loadDailyCash(date);
+    // Cargar todos los reportes de fecha única en una sola petición
+    loadSingleDateData(date);
     
     showNotification(`Reportes cargados para el ${formatDate(date)}`, 'success');
 }
@@ -443,6 +487,66 @@ function addExportButtons() {
         window.open(`${window.API_URLS.appointmentsBetweenDates.replace('appointments-between-dates', 'excel/citas-rango')}?start_date=${startDate}&end_date=${endDate}`, '_blank');
     });
     report4Card.appendChild(excelButton);
+
+    // Reporte 4: Citas en Rango (Excel en segundo plano, para rangos grandes)
+    const excelJobButton = createExportButton('Excel (segundo plano)', 'btn-excel', () => {
+        const startDate = document.getElementById('start-date').value;
+        const endDate = document.getElementById('end-date').value;
+        runExportJob({ tipo: 'citas_xlsx', start_date: startDate, end_date: endDate });
+    });
+    report4Card.appendChild(excelJobButton);
+}
+
+// Milisegundos entre consultas del estado de una exportación
+const EXPORT_JOB_POLL_MS = 1500;
+// Milisegundos máximos de espera de una exportación antes de dejar de consultar
+const EXPORT_JOB_TIMEOUT_MS = 30 * 60 * 1000;
+
+/**
+ * Registra una exportación en segundo plano y consulta su progreso hasta que termine
+ * @param {Object} params - tipo de exportación y parámetros del reporte
+ */
+async function runExportJob(params) {
+    try {
+        const response = await axios.post(window.API_URLS.exportJobs, params, {
+            headers: { 'X-CSRFToken': getCookie('csrftoken') }
+        });
+        let job = response.data;
+        showNotification('Exportación en cola...', 'info');
+        const limite = Date.now() + EXPORT_JOB_TIMEOUT_MS;
+
+        while (job.estado === 'pendiente' || job.estado === 'en_proceso') {
+            if (Date.now() > limite) {
+                showNotification('La exportación está tardando demasiado; intente más tarde', 'error');
+                return;
+            }
+            await new Promise(resolve => setTimeout(resolve, EXPORT_JOB_POLL_MS));
+            job = await fetchData(response.data.status_url);
+            if (job.estado === 'en_proceso') {
+                showNotification(`Exportando... ${job.progreso}%`, 'info');
+            }
+        }
+
+        if (job.estado === 'completado') {
+            showNotification('Exportación lista', 'success');
+            window.location.href = job.download_url;
+        } else {
+            showNotification('La exportación falló', 'error');
+        }
+    } catch (error) {
+        showNotification('No se pudo completar la exportación', 'error');
+        console.error('Error in export job:', error);
+    }
+}
+
+/**
+ * Lee una cookie por nombre (se usa para el token CSRF)
+ * @param {string} name - Nombre de la cookie
+ * @returns {string|null} - Valor de la cookie
+ */
+function getCookie(name) {
+    const match = document.cookie.match(new RegExp('(?:^|; )' + name + '=([^;]*)'));
+    return match ? decodeURIComponent(match[1]) : null;
 }
 
 function createExportButton(text, className, onClick) {
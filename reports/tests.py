@@ -1,8 +1,39 @@
-from django.test import TestCase, RequestFactory
+from django.test import TestCase, RequestFactory, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.core.management import call_command
 from reports.services.report_service import ReportService
-from reports.views import get_number_appointments_per_therapist, get_patients_by_therapist, get_daily_cash, get_appointments_between_dates
+from reports.views import get_number_appointments_per_therapist, get_patients_by_therapist, get_daily_cash, get_appointments_between_dates, exportar_excel_citas, exportar_citas, get_daily_cash_between_dates, get_single_date_reports
 from base_models.models import Therapist, Appointment, Patient, PaymentType
-from datetime import date
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import csv
+import gzip
+import json
+import io
+import zipfile
+from unittest import skipUnless
+from unittest.mock import patch, MagicMock
+from reports.services import export_service
+from reports.services.export_jobs import reclamar_pendientes, reencolar_vencidos
+from reports.management.commands.export_worker import Command as ExportWorkerCommand
+from concurrent.futures import Future
+from reports.models import ExportJob, DailyCashClosure
+from reports.services.cash_closure import cerrar_dia
+from reports.services.conditional import validadores
+from reports.services.pdf_service import request_con_parametros
+from app_statistics import benchmark
+from app_statistics.services import RollupService
+from django.db import connection
+from reports.services.pdf_cache import PDFCache
+from reports.services.pdf_service import contexto_resumen_caja
+from reports.views import pdf_resumen_caja, pdf_pacientes_terapeuta, pdf_paquete
+from reports.services import pdf_reportlab, pdf_bundle
+from pypdf import PdfReader
+from concurrent.futures.process import BrokenProcessPool
+import os
+import time
+import tempfile
 
 class ReportServiceTest(TestCase):
     """
@@ -60,6 +91,65 @@ class ReportServiceTest(TestCase):
         therapist_data = response['therapists_appointments'][0]
         self.assertEqual(therapist_data['id'], self.therapist.id)
 
+    def test_get_appointments_count_by_therapist_excluye_eliminadas(self):
+        """
+        Verifica que las citas eliminadas no cuentan en el conteo por terapeuta.
+        """
+        Appointment.objects.create(therapist=self.therapist, appointment_date=date.today(), deleted_at=timezone.now())
+        eliminada = Appointment.objects.create(therapist=self.therapist, appointment_date=date.today())
+        eliminada.soft_delete()
+
+        request = RequestFactory().get('/reports/appointments-per-therapist/', {'date': date.today().strftime("%Y-%m-%d")})
+        response = self.report_service.get_appointments_count_by_therapist(request)
+        self.assertEqual(response['therapists_appointments'][0]['appointments_count'], 1)
+        self.assertEqual(response['total_appointments_count'], 1)
+
+    def test_get_appointments_count_by_therapist_single_query(self):
+        """
+        Verifica que el conteo de una fecha evalúa la consulta una sola vez.
+        """
+        factory = RequestFactory()
+        request = factory.get('/reports/appointments-per-therapist/', {'date': date.today().strftime("%Y-%m-%d")})
+        with self.assertNumQueries(1):
+            response = self.report_service.get_appointments_count_by_therapist(request)
+        self.assertEqual(response['total_appointments_count'], 1)
+
+    def test_get_appointments_matrix_by_therapist(self):
+        """
+        Verifica la matriz terapeuta x fecha con sus totales, calculada en una consulta.
+        """
+        rosa = Therapist.objects.create(name="Rosa", paternal_lastname="Quispe", maternal_lastname="Mamani")
+        for dia, therapist in [(1, self.therapist), (1, rosa), (1, rosa), (3, rosa), (3, None), (5, rosa)]:
+            Appointment.objects.create(appointment_date=date(2024, 1, dia), therapist=therapist)
+
+        factory = RequestFactory()
+        request = factory.get('/reports/appointments-per-therapist/matrix/', {'start_date': '2024-01-01', 'end_date': '2024-01-03'})
+        with self.assertNumQueries(1):
+            response = self.report_service.get_appointments_matrix_by_therapist(request)
+
+        self.assertEqual(response['dates'], ['2024-01-01', '2024-01-02', '2024-01-03'])
+        self.assertEqual([(t['name'], t['appointments'], t['total']) for t in response['therapists']], [
+            ("Juan", [1, 0, 0], 1),
+            ("Rosa", [2, 0, 1], 3),
+        ])
+        self.assertEqual(response['totals_by_date'], [3, 0, 1])
+        self.assertEqual(response['total_appointments_count'], 4)
+
+        # Cada columna coincide con el conteo de una sola fecha
+        dia = self.report_service.get_appointments_count_by_therapist(factory.get('/', {'date': '2024-01-01'}))
+        self.assertEqual(dia['total_appointments_count'], response['totals_by_date'][0])
+
+    def test_get_appointments_matrix_rango_invalido(self):
+        """
+        Verifica los errores de la matriz: rango invertido y rango demasiado largo.
+        """
+        factory = RequestFactory()
+        for params in ({'start_date': '2024-01-05', 'end_date': '2024-01-01'},
+                       {'start_date': '2024-01-01', 'end_date': '2024-12-31'},
+                       {'start_date': '2024-01-01'}):
+            response = self.report_service.get_appointments_matrix_by_therapist(factory.get('/', params))
+            self.assertIn('error', response)
+
     def test_get_patients_by_therapist(self):
         """
         Verifica que se obtienen los pacientes agrupados por terapeuta.
@@ -86,6 +176,35 @@ class ReportServiceTest(TestCase):
         self.assertIn('patient', patient)
         self.assertIn('appointments', patient)
 
+    def test_get_patients_by_therapist_agrupado(self):
+        """
+        Verifica que el agrupamiento se resuelve en una consulta, cuenta las citas
+        por paciente, ignora las eliminadas y deja "sin terapeuta" al final.
+        """
+        rosa = Therapist.objects.create(name="Rosa", paternal_lastname="Quispe", maternal_lastname="Mamani")
+        luis = Patient.objects.create(name="Luis", paternal_lastname="Rojas", maternal_lastname="Vega")
+        hoy = date.today()
+        Appointment.objects.create(appointment_date=hoy, patient=luis)
+        Appointment.objects.create(appointment_date=hoy, therapist=rosa, patient=luis)
+        Appointment.objects.create(appointment_date=hoy, therapist=self.therapist, patient=luis)
+        Appointment.objects.create(appointment_date=hoy, therapist=self.therapist, patient=self.patient)
+        Appointment.objects.create(appointment_date=hoy, therapist=rosa, patient=luis, deleted_at=timezone.now())
+        Appointment.objects.create(appointment_date=hoy, therapist=rosa)
+
+        factory = RequestFactory()
+        request = factory.get('/reports/patients-by-therapist/', {'date': hoy.strftime("%Y-%m-%d")})
+        with self.assertNumQueries(1):
+            response = self.report_service.get_patients_by_therapist(request)
+
+        self.assertEqual([t['therapist'] for t in response], ["Perez Lopez Juan", "Quispe Mamani Rosa", "Sin terapeuta asignado"])
+        self.assertEqual(response[0]['patients'], [
+            {'patient_id': self.patient.id, 'patient': "Gomez Diaz Ana", 'appointments': 2},
+            {'patient_id': luis.id, 'patient': "Rojas Vega Luis", 'appointments': 1},
+        ])
+        self.assertEqual(response[1]['patients'], [{'patient_id': luis.id, 'patient': "Rojas Vega Luis", 'appointments': 1}])
+        self.assertEqual(response[2]['therapist_id'], "")
+        self.assertEqual(response[2]['patients'][0]['appointments'], 1)
+
     def test_get_daily_cash(self):
         """
         Valida la suma diaria de efectivo agrupado por tipo de pago,
@@ -149,6 +268,39 @@ class ReportServiceTest(TestCase):
         cupón = next(filter(lambda x: x['payment_type'] == "Cupón", response))
         self.assertEqual(cupón['total_payment'], 50.0)
 
+    def test_get_daily_cash_from_rollup(self):
+        """
+        Verifica que la caja diaria leída desde el resumen diario coincide
+        con la consulta directa sobre las citas.
+        """
+        factory = RequestFactory()
+        yape = PaymentType.objects.create(name="Yape")
+        Appointment.objects.create(
+            therapist=self.therapist,
+            patient=self.patient,
+            appointment_date=date.today(),
+            payment=20,
+            payment_type=yape,
+            appointment_hour="12:00"
+        )
+        Appointment.objects.create(
+            therapist=self.therapist,
+            patient=self.patient,
+            appointment_date=date.today(),
+            payment=None,
+            payment_type=yape,
+            appointment_hour="13:00"
+        )
+
+        request = factory.get('/reports/daily-cash/', {'date': date.today().strftime("%Y-%m-%d")})
+        expected = self.report_service.get_daily_cash(request)
+        with override_settings(APPOINTMENT_ROLLUP_ENABLED=True):
+            RollupService.rebuild_range()
+            response = self.report_service.get_daily_cash(request)
+
+        self.assertEqual(response, expected)
+        self.assertEqual([item['payment_type'] for item in response], ["EFECTIVO", "Yape"])
+
     def test_get_appointments_between_dates(self):
         """
         Valida que se obtienen las citas en el rango de fechas indicado,
@@ -195,6 +347,36 @@ class ReportServiceTest(TestCase):
         self.assertIn('payment_type', appointment)
 
 
+    def test_get_appointments_between_dates_single_query(self):
+        """
+        Verifica que el rango de citas se obtiene con una sola consulta,
+        sin consultas adicionales por tipo de pago.
+        """
+        yape = PaymentType.objects.create(name="Yape")
+        for hour in ("11:00", "12:00", "13:00"):
+            Appointment.objects.create(
+                therapist=self.therapist,
+                patient=self.patient,
+                appointment_date=date.today(),
+                payment=20,
+                payment_type=yape,
+                appointment_hour=hour
+            )
+        Appointment.objects.create(appointment_date=date.today(), appointment_hour="14:00")
+
+        factory = RequestFactory()
+        today = date.today().strftime("%Y-%m-%d")
+        request = factory.get('/reports/appointments-between-dates/', {'start_date': today, 'end_date': today})
+        with self.assertNumQueries(1):
+            response = self.report_service.get_appointments_between_dates(request)
+
+        self.assertEqual([item['appointment_hour'] for item in response], ["10:00", "11:00", "12:00", "13:00", "14:00"])
+        self.assertEqual(response[1]['payment_type'], "Yape")
+        self.assertEqual(response[1]['therapist'], "Perez Lopez Juan")
+        self.assertEqual(response[4]['therapist'], "Sin terapeuta asignado")
+        self.assertEqual(response[4]['patient'], "Paciente desconocido")
+        self.assertEqual(response[4]['payment_type'], "No definido")
+
 class ReportViewsTest(TestCase):
     """
     Pruebas para las vistas del módulo reports.
@@ -250,6 +432,18 @@ class ReportViewsTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b'therapist', response.content)
 
+    def test_get_appointments_matrix_view(self):
+        """
+        Valida la vista de la matriz terapeuta x fecha y su error por parámetros faltantes.
+        """
+        hoy = date.today().strftime("%Y-%m-%d")
+        response = self.client.get(reverse('appointments_per_therapist_matrix'), {'start_date': hoy, 'end_date': hoy})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['dates'], [hoy])
+
+        response = self.client.get(reverse('appointments_per_therapist_matrix'), {'start_date': hoy})
+        self.assertEqual(response.status_code, 400)
+
     def test_get_daily_cash_view(self):
         """
         Valida la respuesta de la vista que muestra el resumen de caja diaria.
@@ -272,3 +466,989 @@ class ReportViewsTest(TestCase):
 
         self.assertEqual(response.status_code, 200)
         self.assertIn(b'appointment_id', response.content)
+
+    def test_get_appointments_between_dates_stream_view(self):
+        """
+        Valida que con stream=true la respuesta se envía por partes
+        y contiene las mismas citas que la respuesta completa.
+        """
+        params = {
+            'start_date': date.today().strftime("%Y-%m-%d"),
+            'end_date': date.today().strftime("%Y-%m-%d")
+        }
+        expected = json.loads(get_appointments_between_dates(self.factory.get('/reports/appointments-between-dates/', params)).content)
+        response = get_appointments_between_dates(
+            self.factory.get('/reports/appointments-between-dates/', dict(params, stream='true'))
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), expected)
+
+        error = get_appointments_between_dates(
+            self.factory.get('/reports/appointments-between-dates/', {'start_date': 'x', 'end_date': 'y', 'stream': 'true'})
+        )
+        self.assertEqual(error.status_code, 400)
+
+    def test_get_appointments_between_dates_paginated_view(self):
+        """
+        Valida que la paginación por cursor recorre todas las citas una sola vez
+        y en el mismo orden que la respuesta sin paginar.
+        """
+        for hour in ("10:00", "10:00", None, "09:00", None):
+            Appointment.objects.create(
+                therapist=self.therapist,
+                patient=self.patient,
+                appointment_date=date.today(),
+                payment=10,
+                payment_type=self.payment_type,
+                appointment_hour=hour
+            )
+
+        params = {
+            'start_date': date.today().strftime("%Y-%m-%d"),
+            'end_date': date.today().strftime("%Y-%m-%d")
+        }
+        expected = json.loads(get_appointments_between_dates(self.factory.get('/reports/appointments-between-dates/', params)).content)
+
+        ids = []
+        cursor = None
+        while True:
+            page_params = dict(params, limit=2)
+            if cursor:
+                page_params['cursor'] = cursor
+            # Validadores del GET condicional y la página
+            with self.assertNumQueries(2):
+                response = get_appointments_between_dates(self.factory.get('/reports/appointments-between-dates/', page_params))
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.content)
+            self.assertLessEqual(len(data['results']), 2)
+            ids.extend(item['appointment_id'] for item in data['results'])
+            cursor = data['next']
+            if not cursor:
+                break
+
+        self.assertEqual(len(expected), 6)
+        self.assertEqual(ids, [item['appointment_id'] for item in expected])
+        self.assertEqual([item['appointment_hour'] for item in expected], ["", "", "09:00", "10:00", "10:00", "10:00"])
+
+    def test_get_appointments_between_dates_paginated_invalid(self):
+        """
+        Valida errores de la paginación con limit o cursor inválidos.
+        """
+        params = {
+            'start_date': date.today().strftime("%Y-%m-%d"),
+            'end_date': date.today().strftime("%Y-%m-%d")
+        }
+        for extra in ({'limit': '0'}, {'limit': 'abc'}, {'limit': '5000'}, {'cursor': 'no-es-un-cursor'}):
+            response = get_appointments_between_dates(self.factory.get('/reports/appointments-between-dates/', dict(params, **extra)))
+            self.assertEqual(response.status_code, 400)
+
+    def test_exportar_excel_citas_view(self):
+        """
+        Valida que el Excel de citas se envía por partes como adjunto
+        y contiene una fila por cita más el encabezado.
+        """
+        request = self.factory.get('/reports/excel/citas-rango/', {
+            'start_date': date.today().strftime("%Y-%m-%d"),
+            'end_date': date.today().strftime("%Y-%m-%d")
+        })
+        response = exportar_excel_citas(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment', response['Content-Disposition'])
+
+        contenido = b''.join(response.streaming_content)
+        with zipfile.ZipFile(io.BytesIO(contenido)) as libro:
+            hoja = libro.read('xl/worksheets/sheet1.xml').decode()
+        self.assertEqual(hoja.count('<row '), 2)
+        self.assertIn('Perez Lopez Juan', hoja)
+
+    def test_exportar_excel_citas_view_invalid(self):
+        """
+        Valida que la exportación rechaza un rango inválido.
+        """
+        response = exportar_excel_citas(self.factory.get('/reports/excel/citas-rango/', {'start_date': '2024-01-01'}))
+        self.assertEqual(response.status_code, 400)
+
+    def _export_request(self, **extra):
+        params = {
+            'start_date': date.today().strftime("%Y-%m-%d"),
+            'end_date': date.today().strftime("%Y-%m-%d")
+        }
+        accept = extra.pop('accept', None)
+        headers = {'HTTP_ACCEPT': accept} if accept else {}
+        return self.factory.get('/reports/export/citas-rango/', dict(params, **extra), **headers)
+
+    def test_exportar_citas_csv(self):
+        """
+        Valida la exportación CSV enviada por partes con el parámetro format.
+        """
+        response = exportar_citas(self._export_request(format='csv'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('.csv', response['Content-Disposition'])
+        filas = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(filas[0][0], 'appointment_id')
+        self.assertEqual(filas[1][0], str(self.appointment.id))
+        self.assertEqual(filas[1][3], 'Perez Lopez Juan')
+
+    def test_exportar_citas_ndjson_accept(self):
+        """
+        Valida la exportación NDJSON comprimida con gzip elegida por el encabezado Accept.
+        """
+        response = exportar_citas(self._export_request(accept='application/x-ndjson'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        lineas = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(len(lineas), 1)
+        self.assertEqual(json.loads(lineas[0])['payment_type'], 'EFECTIVO')
+
+    def test_exportar_citas_parquet(self):
+        """
+        Valida la exportación Parquet con tipos de columna.
+        """
+        response = exportar_citas(self._export_request(format='parquet'))
+
+        self.assertEqual(response.status_code, 200)
+        tabla = export_service.pq.read_table(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(tabla.column('appointment_id').to_pylist(), [self.appointment.id])
+        self.assertEqual(tabla.column('appointment_date').to_pylist(), [date.today()])
+
+    def test_exportar_citas_parquet_sin_pyarrow(self):
+        """
+        Valida que sin pyarrow la exportación Parquet responde 503.
+        """
+        with patch.object(export_service, 'pq', None):
+            response = exportar_citas(self._export_request(format='parquet'))
+        self.assertEqual(response.status_code, 503)
+
+    def test_exportar_citas_formato_invalido(self):
+        """
+        Valida que un formato desconocido responde 400 y que sin formato se usa Excel.
+        """
+        self.assertEqual(exportar_citas(self._export_request(format='pdf')).status_code, 400)
+        self.assertIn('.xlsx', exportar_citas(self._export_request())['Content-Disposition'])
+
+
+class ExportJobTest(TestCase):
+    """
+    Pruebas para las exportaciones en segundo plano.
+    """
+
+    def setUp(self):
+        """
+        Crear una cita y un MEDIA_ROOT temporal para los archivos generados.
+        """
+        self.media = tempfile.TemporaryDirectory()
+        self.settings_media = override_settings(MEDIA_ROOT=self.media.name)
+        self.settings_media.enable()
+
+        therapist = Therapist.objects.create(name="Juan", paternal_lastname="Perez", maternal_lastname="Lopez")
+        patient = Patient.objects.create(name="Ana", paternal_lastname="Gomez", maternal_lastname="Diaz")
+        payment_type = PaymentType.objects.create(name="EFECTIVO")
+        Appointment.objects.create(
+            therapist=therapist,
+            patient=patient,
+            appointment_date=date.today(),
+            payment=100,
+            payment_type=payment_type,
+            appointment_hour="10:00"
+        )
+        self.today = date.today().strftime("%Y-%m-%d")
+
+    def tearDown(self):
+        self.settings_media.disable()
+        self.media.cleanup()
+
+    def _ejecutar_worker(self):
+        call_command('export_worker', processes=0, once=True, stdout=io.StringIO())
+
+    def test_job_citas_csv(self):
+        """
+        Valida el ciclo completo: registro (202), ejecución por el worker,
+        estado con progreso 100 y descarga del archivo.
+        """
+        response = self.client.post(
+            reverse('crear_export_job'),
+            {'tipo': 'citas_csv', 'start_date': self.today, 'end_date': self.today},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 202)
+        job = response.json()
+        self.assertEqual(job['estado'], ExportJob.PENDIENTE)
+
+        self._ejecutar_worker()
+
+        estado = self.client.get(job['status_url']).json()
+        self.assertEqual(estado['estado'], ExportJob.COMPLETADO)
+        self.assertEqual(estado['progreso'], 100)
+
+        descarga = self.client.get(estado['download_url'])
+        self.assertEqual(descarga.status_code, 200)
+        contenido = b''.join(descarga.streaming_content).decode()
+        self.assertIn('Perez Lopez Juan', contenido)
+        self.assertIn(f'citas_{self.today}_a_{self.today}.csv', descarga['Content-Disposition'])
+
+    def test_job_pdf(self):
+        """
+        Valida que el worker genera un reporte PDF en MEDIA_ROOT.
+        """
+        response = self.client.post(reverse('crear_export_job'), {'tipo': 'pdf_resumen_caja', 'date': self.today})
+        self.assertEqual(response.status_code, 202)
+
+        self._ejecutar_worker()
+
+        job = ExportJob.objects.get(id=response.json()['id'])
+        self.assertEqual(job.estado, ExportJob.COMPLETADO)
+        with open(f"{self.media.name}/{job.archivo}", 'rb') as archivo:
+            self.assertTrue(archivo.read().startswith(b'%PDF'))
+
+    def test_job_desde_exportacion_async(self):
+        """
+        Valida que async=true en la exportación registra un trabajo en lugar de generar el archivo.
+        """
+        response = self.client.get(reverse('exportar_citas'), {
+            'start_date': self.today, 'end_date': self.today, 'format': 'ndjson', 'async': 'true'
+        })
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(ExportJob.objects.get().tipo, 'citas_ndjson')
+
+    def test_job_invalido_y_pendiente(self):
+        """
+        Valida errores de registro y que un trabajo sin terminar no se puede descargar.
+        """
+        url = reverse('crear_export_job')
+        self.assertEqual(self.client.post(url, {'tipo': 'citas_doc'}).status_code, 400)
+        self.assertEqual(self.client.post(url, {'tipo': 'citas_xlsx', 'start_date': self.today}).status_code, 400)
+        self.assertEqual(self.client.post(url, {'tipo': 'pdf_resumen_caja', 'date': 'not-a-date'}).status_code, 400)
+        self.assertEqual(self.client.get(url).status_code, 405)
+
+        job_id = self.client.post(url, {'tipo': 'citas_xlsx', 'start_date': self.today, 'end_date': self.today}).json()['id']
+        self.assertEqual(self.client.get(reverse('descargar_export_job', args=[job_id])).status_code, 409)
+        self.assertEqual(self.client.get(reverse('estado_export_job', args=[job_id + 1])).status_code, 404)
+
+    def test_reclamar_pendientes(self):
+        """
+        Valida que un trabajo reclamado no se vuelve a entregar.
+        """
+        jobs = [ExportJob.objects.create(tipo='citas_csv') for _ in range(3)]
+
+        self.assertEqual(reclamar_pendientes(2), [jobs[0].id, jobs[1].id])
+        self.assertEqual(reclamar_pendientes(5), [jobs[2].id])
+        self.assertEqual(reclamar_pendientes(5), [])
+
+    def test_proceso_caido_marca_error(self):
+        """
+        Valida que si el futuro de un trabajo falla (ej. murió el proceso) el trabajo
+        queda con error en lugar de seguir en proceso.
+        """
+        job = ExportJob.objects.create(tipo='citas_csv')
+        reclamar_pendientes(1)
+        futuro = Future()
+        futuro.set_exception(BrokenProcessPool("proceso terminado"))
+
+        comando = ExportWorkerCommand(stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertIsInstance(comando._terminar(futuro, job.id), BrokenProcessPool)
+
+        job.refresh_from_db()
+        self.assertEqual(job.estado, ExportJob.ERROR)
+        self.assertIn('BrokenProcessPool', job.error)
+
+    def test_reencolar_vencidos(self):
+        """
+        Valida que un trabajo en proceso por más del tiempo límite vuelve a la cola.
+        """
+        vencido, reciente = ExportJob.objects.create(tipo='citas_csv'), ExportJob.objects.create(tipo='citas_csv')
+        reclamar_pendientes(2)
+        ExportJob.objects.filter(id=vencido.id).update(started_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(reencolar_vencidos(30 * 60), 1)
+        self.assertEqual(ExportJob.objects.get(id=vencido.id).estado, ExportJob.PENDIENTE)
+        self.assertEqual(ExportJob.objects.get(id=reciente.id).estado, ExportJob.EN_PROCESO)
+        self.assertEqual(reclamar_pendientes(5), [vencido.id])
+
+    def test_reencolar_vencidos_excluye_en_curso(self):
+        """
+        Valida que un trabajo largo que el worker sigue ejecutando no vuelve a la cola.
+        """
+        job = ExportJob.objects.create(tipo='citas_csv')
+        reclamar_pendientes(1)
+        ExportJob.objects.filter(id=job.id).update(started_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(reencolar_vencidos(30 * 60, excluir=[job.id]), 0)
+        self.assertEqual(ExportJob.objects.get(id=job.id).estado, ExportJob.EN_PROCESO)
+
+
+class PDFCacheTest(TestCase):
+    """
+    Pruebas para la caché en disco de los PDF de reportes.
+    """
+
+    def setUp(self):
+        """
+        Crear una cita y una carpeta temporal para la caché.
+        """
+        self.carpeta = tempfile.TemporaryDirectory()
+        self.settings_cache = override_settings(
+            REPORTS_PDF_CACHE_ENABLED=True,
+            REPORTS_PDF_CACHE_DIR=self.carpeta.name,
+            REPORTS_PDF_CACHE_MAX_BYTES=10 * 1024 * 1024
+        )
+        self.settings_cache.enable()
+
+        self.factory = RequestFactory()
+        self.payment_type = PaymentType.objects.create(name="EFECTIVO")
+        Appointment.objects.create(appointment_date=date(2024, 1, 15), payment=100, payment_type=self.payment_type)
+
+    def tearDown(self):
+        self.settings_cache.disable()
+        self.carpeta.cleanup()
+
+    def _pdf(self):
+        return pdf_resumen_caja(self.factory.get('/reports/pdf/resumen-caja/', {'date': '2024-01-15'}))
+
+    def test_segunda_descarga_sin_renderizar(self):
+        """
+        Valida que la segunda descarga del mismo día se sirve desde la caché.
+        """
+        with patch('reports.views.contexto_resumen_caja', wraps=contexto_resumen_caja) as contexto:
+            primera = self._pdf()
+            segunda = self._pdf()
+
+        self.assertEqual(contexto.call_count, 1)
+        self.assertEqual(primera.content, segunda.content)
+        self.assertTrue(segunda.content.startswith(b'%PDF'))
+        self.assertEqual(segunda['Content-Disposition'], primera['Content-Disposition'])
+
+    def test_cambio_de_datos_invalida(self):
+        """
+        Valida que una cita nueva o eliminada cambia la huella y fuerza un nuevo render.
+        """
+        huella = PDFCache.huella('2024-01-15')
+        with patch('reports.views.contexto_resumen_caja', wraps=contexto_resumen_caja) as contexto:
+            self._pdf()
+            cita = Appointment.objects.create(appointment_date=date(2024, 1, 15), payment=50, payment_type=self.payment_type)
+            self._pdf()
+            cita.soft_delete()
+            self._pdf()
+
+        self.assertEqual(contexto.call_count, 3)
+        self.assertNotEqual(PDFCache.huella('2024-01-15'), huella)
+        # Solo queda la versión vigente del reporte
+        self.assertEqual(len(os.listdir(self.carpeta.name)), 1)
+
+    def test_reasignar_tipo_de_pago_y_reemplazar_cierre_invalidan(self):
+        """
+        Valida que mover una cita a otro tipo de pago con el mismo monto y reemplazar
+        el cierre de caja del día fuerzan un nuevo render del resumen de caja.
+        """
+        cita = Appointment.objects.get(appointment_date=date(2024, 1, 15))
+        with patch('reports.views.contexto_resumen_caja', wraps=contexto_resumen_caja) as contexto:
+            self._pdf()
+            cita.payment_type = PaymentType.objects.create(name="Yape")
+            cita.save()
+            self._pdf()
+            cerrar_dia('2024-01-15')
+            self._pdf()
+            Appointment.objects.filter(pk=cita.pk).update(payment=1)
+            cerrar_dia('2024-01-15', reemplazar=True)
+            self._pdf()
+            self._pdf()
+
+        self.assertEqual(contexto.call_count, 4)
+        self.assertNotEqual(PDFCache.huella('2024-01-15', 'resumen_caja'), PDFCache.huella('2024-01-15'))
+
+    def test_desalojo_lru(self):
+        """
+        Valida que al superar el tamaño máximo se elimina el PDF usado hace más tiempo.
+        """
+        with override_settings(REPORTS_PDF_CACHE_MAX_BYTES=250):
+            PDFCache.guardar('resumen_caja', '2024-01-01', 'a', b'1' * 100)
+            PDFCache.guardar('resumen_caja', '2024-01-02', 'b', b'2' * 100)
+            antiguo = time.time() - 60
+            os.utime(os.path.join(self.carpeta.name, 'resumen_caja_2024-01-02_b.pdf'), (antiguo, antiguo))
+            os.utime(os.path.join(self.carpeta.name, 'resumen_caja_2024-01-01_a.pdf'), (antiguo - 60, antiguo - 60))
+
+            # Un acierto convierte al primero en el más reciente
+            self.assertIsNotNone(PDFCache.obtener('resumen_caja', '2024-01-01', 'a'))
+            PDFCache.guardar('resumen_caja', '2024-01-03', 'c', b'3' * 100)
+
+            self.assertIsNotNone(PDFCache.obtener('resumen_caja', '2024-01-01', 'a'))
+            self.assertIsNone(PDFCache.obtener('resumen_caja', '2024-01-02', 'b'))
+            self.assertIsNotNone(PDFCache.obtener('resumen_caja', '2024-01-03', 'c'))
+
+
+class PDFReportLabTest(TestCase):
+    """
+    Pruebas para el render directo con ReportLab.
+    """
+
+    def setUp(self):
+        """
+        Crear citas de dos terapeutas y una sin terapeuta para la fecha del reporte.
+        """
+        self.factory = RequestFactory()
+        juan = Therapist.objects.create(name="Juan", paternal_lastname="Perez", maternal_lastname="Lopez")
+        rosa = Therapist.objects.create(name="Rosa", paternal_lastname="Quispe", maternal_lastname="Mamani")
+        ana = Patient.objects.create(name="Ana", paternal_lastname="Gomez", maternal_lastname="Diaz")
+        luis = Patient.objects.create(name="Luis", paternal_lastname="Ñahui", maternal_lastname="Rojas")
+        efectivo = PaymentType.objects.create(name="EFECTIVO")
+        for therapist, patient in [(juan, ana), (juan, ana), (rosa, luis), (None, luis)]:
+            Appointment.objects.create(
+                therapist=therapist, patient=patient, appointment_date=date(2024, 1, 15),
+                payment=30, payment_type=efectivo, appointment_hour="10:00"
+            )
+
+    def _texto(self, response):
+        return "".join(pagina.extract_text() for pagina in PdfReader(io.BytesIO(response.content)).pages)
+
+    def test_mismo_contenido_que_xhtml2pdf(self):
+        """
+        Valida que ambos motores incluyen los mismos terapeutas, pacientes y conteos.
+        """
+        params = {'date': '2024-01-15'}
+        html = pdf_pacientes_terapeuta(self.factory.get('/reports/pdf/pacientes-terapeuta/', params))
+        directo = pdf_pacientes_terapeuta(self.factory.get('/reports/pdf/pacientes-terapeuta/', dict(params, engine='reportlab')))
+
+        self.assertEqual(directo.status_code, 200)
+        self.assertEqual(directo['Content-Disposition'], html['Content-Disposition'])
+        texto_html, texto_directo = self._texto(html), self._texto(directo)
+        for esperado in ("Pacientes por Terapeuta", "Perez Lopez Juan", "Quispe Mamani Rosa",
+                         "Sin terapeuta asignado", "Gomez Diaz Ana - 2 citas", "Ñahui Rojas Luis - 1 cita", "1 pacientes"):
+            self.assertIn(esperado, texto_html)
+            self.assertIn(esperado, texto_directo)
+
+    def test_resumen_caja_reportlab(self):
+        """
+        Valida el resumen de caja con ReportLab, incluido el total del día.
+        """
+        response = pdf_resumen_caja(self.factory.get('/reports/pdf/resumen-caja/', {'date': '2024-01-15', 'engine': 'reportlab'}))
+        texto = self._texto(response)
+        self.assertIn("EFECTIVO", texto)
+        self.assertIn("Total del día: S/. 120.00", texto)
+
+    def test_motor_por_configuracion(self):
+        """
+        Valida que REPORTS_PDF_ENGINES elige el motor por vista y que engine inválido responde 400.
+        """
+        request = self.factory.get('/reports/pdf/resumen-caja/', {'date': '2024-01-15'})
+        with override_settings(REPORTS_PDF_ENGINES={'resumen_caja': 'reportlab'}), \
+                patch.dict(pdf_reportlab.RENDERIZADORES, resumen_caja=MagicMock(side_effect=pdf_reportlab.resumen_caja)) as renderizadores:
+            pdf_resumen_caja(request)
+            self.assertEqual(renderizadores['resumen_caja'].call_count, 1)
+
+        invalido = pdf_resumen_caja(self.factory.get('/reports/pdf/resumen-caja/', {'engine': 'latex'}))
+        self.assertEqual(invalido.status_code, 400)
+
+    def test_benchmark_command(self):
+        """
+        Valida que el benchmark compara ambos motores.
+        """
+        out = io.StringIO()
+        call_command('benchmark_pdf', therapists=2, patients=3, repeat=1, stdout=out)
+        self.assertIn('xhtml2pdf', out.getvalue())
+        self.assertIn('reportlab', out.getvalue())
+
+
+@override_settings(REPORTS_PDF_BUNDLE_PROCESSES=0)
+class PDFPaqueteTest(TestCase):
+    """
+    Pruebas para los paquetes de reportes PDF por rango de fechas.
+    Se renderiza en el mismo proceso: la base de datos de pruebas no es visible desde el pool.
+    """
+
+    def setUp(self):
+        """
+        Crear citas en dos de los tres días del rango.
+        """
+        self.factory = RequestFactory()
+        efectivo = PaymentType.objects.create(name="EFECTIVO")
+        for dia in (15, 17):
+            Appointment.objects.create(appointment_date=date(2024, 1, dia), payment=50, payment_type=efectivo)
+
+    def _get(self, **params):
+        params = {'start_date': '2024-01-15', 'end_date': '2024-01-17', 'engine': 'reportlab', **params}
+        return pdf_paquete(self.factory.get('/reports/pdf/paquete/', params))
+
+    def test_zip_un_archivo_por_dia_y_reporte(self):
+        """
+        Valida que el ZIP contiene un PDF por día y reporte, en orden de fecha.
+        """
+        response = self._get(reports='resumen_caja,citas_terapeuta')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as paquete:
+            nombres = paquete.namelist()
+            self.assertEqual(nombres, [
+                '2024-01-15_resumen_caja.pdf', '2024-01-15_citas_terapeuta.pdf',
+                '2024-01-16_resumen_caja.pdf', '2024-01-16_citas_terapeuta.pdf',
+                '2024-01-17_resumen_caja.pdf', '2024-01-17_citas_terapeuta.pdf',
+            ])
+            texto = PdfReader(io.BytesIO(paquete.read('2024-01-17_resumen_caja.pdf'))).pages[0].extract_text()
+            self.assertIn("2024-01-17", texto)
+            self.assertIn("S/. 50.00", texto)
+
+    def test_pdf_unido(self):
+        """
+        Valida que output=pdf une todos los reportes del rango en un solo documento.
+        """
+        response = self._get(reports='resumen_caja', output='pdf')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        paginas = PdfReader(io.BytesIO(b"".join(response.streaming_content))).pages
+        self.assertEqual(len(paginas), 3)
+        self.assertIn("2024-01-16", paginas[1].extract_text())
+
+    def test_reutiliza_cache(self):
+        """
+        Valida que los PDF ya cacheados no se vuelven a renderizar.
+        """
+        with tempfile.TemporaryDirectory() as carpeta, \
+                override_settings(REPORTS_PDF_CACHE_ENABLED=True, REPORTS_PDF_CACHE_DIR=carpeta):
+            self._get(reports='resumen_caja')
+            with patch('reports.services.pdf_bundle.renderizar_dia', wraps=pdf_bundle.renderizar_dia) as renderizar:
+                response = self._get(reports='resumen_caja', end_date='2024-01-18')
+                b"".join(response.streaming_content)
+            # Solo el día nuevo se renderiza
+            renderizar.assert_called_once_with('resumen_caja', '2024-01-18', 'reportlab')
+
+    def test_pool_roto_se_descarta(self):
+        """
+        Valida que si el pool se rompe el paquete se renderiza en el proceso actual
+        y el pool se descarta para la siguiente petición.
+        """
+        pool = MagicMock()
+        pool.map.side_effect = BrokenProcessPool()
+        with override_settings(REPORTS_PDF_BUNDLE_PROCESSES=2), \
+                patch.object(pdf_bundle, '_pool', pool):
+            pdfs = pdf_bundle.renderizar_rango(['resumen_caja'], date(2024, 1, 15), date(2024, 1, 16), 'reportlab')
+            self.assertIsNone(pdf_bundle._pool)
+
+        self.assertEqual([(fecha, tipo) for fecha, tipo, _ in pdfs], [
+            ('2024-01-15', 'resumen_caja'), ('2024-01-16', 'resumen_caja'),
+        ])
+        self.assertTrue(all(contenido.startswith(b'%PDF') for _, _, contenido in pdfs))
+        pool.shutdown.assert_called_once_with(wait=False, cancel_futures=True)
+
+    def test_pool_renueva_conexiones(self):
+        """
+        Valida que los procesos del pool descartan las conexiones caídas antes y
+        después de cada render, aunque el render falle.
+        """
+        pool = MagicMock()
+        pool.map.return_value = [b'%PDF', b'%PDF']
+        with override_settings(REPORTS_PDF_BUNDLE_PROCESSES=2), patch.object(pdf_bundle, '_pool', pool):
+            pdf_bundle.renderizar_rango(['resumen_caja'], date(2024, 1, 15), date(2024, 1, 16), 'reportlab')
+        self.assertIs(pool.map.call_args[0][0], pdf_bundle._renderizar_dia_en_proceso)
+
+        with patch.object(pdf_bundle, 'close_old_connections') as cerrar, \
+                patch.object(pdf_bundle, 'renderizar_dia', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                pdf_bundle._renderizar_dia_en_proceso('resumen_caja', '2024-01-15', 'reportlab')
+        self.assertEqual(cerrar.call_count, 2)
+
+    def test_procesos_limitados(self):
+        """
+        Valida que el pool no supera MAX_PROCESOS_PAQUETE procesos.
+        """
+        with override_settings(REPORTS_PDF_BUNDLE_PROCESSES=None), patch('os.cpu_count', return_value=64):
+            self.assertEqual(pdf_bundle.procesos_paquete(), pdf_bundle.MAX_PROCESOS_PAQUETE)
+        with override_settings(REPORTS_PDF_BUNDLE_PROCESSES=64):
+            self.assertEqual(pdf_bundle.procesos_paquete(), pdf_bundle.MAX_PROCESOS_PAQUETE)
+
+    def test_parametros_invalidos(self):
+        """
+        Valida que reports, output, engine y rango inválidos responden 400.
+        """
+        invalidos = [
+            {'reports': ''},
+            {'reports': 'resumen_caja,otro'},
+            {'reports': 'resumen_caja', 'output': 'tar'},
+            {'reports': 'resumen_caja', 'engine': 'latex'},
+            {'reports': 'resumen_caja', 'start_date': '2024-01-20'},
+            {'reports': 'resumen_caja', 'start_date': '2024-01-01', 'end_date': '2024-03-31'},
+            {'reports': 'resumen_caja', 'end_date': '2024-13-01'},
+        ]
+        for params in invalidos:
+            self.assertEqual(self._get(**params).status_code, 400, params)
+
+
+class CierreCajaTest(TestCase):
+    """
+    Pruebas para el cierre de caja diario y el resumen de caja por rango.
+    """
+
+    def setUp(self):
+        """
+        Crear pagos en dos días: 2024-01-15 (a cerrar) y 2024-01-16 (abierto).
+        """
+        self.factory = RequestFactory()
+        efectivo = PaymentType.objects.create(name="EFECTIVO")
+        yape = PaymentType.objects.create(name="Yape")
+        self.cita = Appointment.objects.create(appointment_date=date(2024, 1, 15), payment=100, payment_type=yape, appointment_hour="10:00")
+        Appointment.objects.create(appointment_date=date(2024, 1, 15), payment="20.50", payment_type=efectivo)
+        Appointment.objects.create(appointment_date=date(2024, 1, 16), payment=40, payment_type=yape)
+
+    def _caja(self, fecha='2024-01-15'):
+        return get_daily_cash(self.factory.get('/reports/daily-cash/', {'date': fecha}))
+
+    def test_cierre_congela_totales(self):
+        """
+        Valida que el día cerrado se lee del cierre con una sola consulta.
+        """
+        cierre, error = cerrar_dia('2024-01-15')
+        self.assertIsNone(error)
+        self.assertEqual(cierre.total, Decimal("120.50"))
+
+        with self.assertNumQueries(1):
+            ReportService().get_daily_cash(self.factory.get('/reports/daily-cash/', {'date': '2024-01-15'}))
+        response = self._caja()
+        self.assertEqual(response['X-Cash-Closure'], 'closed')
+        self.assertEqual(json.loads(response.content), [
+            {'payment_type': 'EFECTIVO', 'total_payment': 20.5},
+            {'payment_type': 'Yape', 'total_payment': 100.0},
+        ])
+        self.assertNotIn('X-Cash-Closure', self._caja('2024-01-16'))
+
+        with self.assertRaises(ValueError):
+            cierre.save()
+
+    def test_edicion_marca_cierre_modificado(self):
+        """
+        Valida que editar el pago de un día cerrado marca el cierre, sin cambiar sus totales,
+        y que cambios que no afectan la caja no lo marcan.
+        """
+        cerrar_dia('2024-01-15')
+        self.cita.appointment_hour = "11:00"
+        self.cita.save()
+        self.assertFalse(DailyCashClosure.objects.get(day=date(2024, 1, 15)).modificado)
+
+        self.cita.payment = 80
+        self.cita.save()
+        cierre = DailyCashClosure.objects.get(day=date(2024, 1, 15))
+        self.assertTrue(cierre.modificado)
+        self.assertIsNotNone(cierre.modificado_at)
+
+        response = self._caja()
+        self.assertEqual(response['X-Cash-Closure'], 'modified')
+        self.assertEqual(json.loads(response.content)[1]['total_payment'], 100.0)
+
+    @override_settings(APPOINTMENT_ROLLUP_ENABLED=True)
+    def test_edicion_con_resumen_marca_cierre(self):
+        """
+        Valida que con el resumen diario activo una edición dentro de una transacción
+        marca el cierre, aunque el resumen se reconstruya recién en el commit.
+        """
+        RollupService.rebuild_range()
+        cerrar_dia('2024-01-15')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cita.payment = 80
+            self.cita.save()
+            self.assertTrue(DailyCashClosure.objects.get(day=date(2024, 1, 15)).modificado)
+
+    def test_vista_cerrar_caja(self):
+        """
+        Valida el endpoint de cierre: 201, 409 si ya está cerrada y 400 con fechas inválidas o futuras.
+        """
+        url = reverse('cerrar_caja')
+        response = self.client.post(url, {'date': '2024-01-15'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['total'], 120.5)
+
+        self.assertEqual(self.client.post(url, {'date': '2024-01-15'}).status_code, 409)
+        self.assertEqual(self.client.post(url, {'date': '2024-31-01'}).status_code, 400)
+        self.assertEqual(self.client.post(url, {'date': '2999-01-01'}).status_code, 400)
+
+    def test_resumen_por_rango(self):
+        """
+        Valida que el rango lee los días cerrados del cierre y agrega solo los abiertos.
+        """
+        cerrar_dia('2024-01-15')
+        # Cambio que no pasa por las señales: el rango sigue mostrando el cierre
+        Appointment.objects.filter(appointment_date=date(2024, 1, 15)).update(payment=1)
+
+        request = self.factory.get('/reports/daily-cash/range/', {'start_date': '2024-01-14', 'end_date': '2024-01-16'})
+        with self.assertNumQueries(2):
+            ReportService().get_daily_cash_between_dates(request)
+        data = json.loads(get_daily_cash_between_dates(request).content)
+
+        self.assertEqual([(d['date'], d['total'], d['closed']) for d in data['days']], [
+            ('2024-01-15', 120.5, True),
+            ('2024-01-16', 40.0, False),
+        ])
+        self.assertEqual(data['payment_types'], [
+            {'payment_type': 'EFECTIVO', 'total_payment': 20.5},
+            {'payment_type': 'Yape', 'total_payment': 140.0},
+        ])
+        self.assertEqual(data['total'], 160.5)
+
+        # Con el resumen diario activo los días abiertos se leen de AppointmentDailyRollup
+        with override_settings(APPOINTMENT_ROLLUP_ENABLED=True):
+            RollupService.rebuild_range()
+            data = json.loads(get_daily_cash_between_dates(request).content)
+        self.assertEqual(data['total'], 160.5)
+
+        invalido = get_daily_cash_between_dates(self.factory.get('/', {'start_date': '2024-01-16', 'end_date': '2024-01-14'}))
+        self.assertEqual(invalido.status_code, 400)
+
+    def test_comando_cerrar_y_verificar(self):
+        """
+        Valida el comando: cierra una fecha y --verify marca los cierres que no coinciden.
+        """
+        out = io.StringIO()
+        call_command('cerrar_caja', date='2024-01-16', stdout=out)
+        self.assertIn('S/. 40.00', out.getvalue())
+
+        Appointment.objects.filter(appointment_date=date(2024, 1, 16)).update(payment=1)
+        call_command('cerrar_caja', verify=True, stdout=out)
+        self.assertTrue(DailyCashClosure.objects.get(day=date(2024, 1, 16)).modificado)
+
+
+class SingleDateReportsTest(TestCase):
+    """
+    Pruebas para el endpoint que agrupa los reportes de una fecha.
+    """
+
+    def setUp(self):
+        """
+        Crear citas variadas para una fecha: eliminadas, sin terapeuta, sin paciente y sin pago.
+        """
+        self.factory = RequestFactory()
+        juan = Therapist.objects.create(name="Juan", paternal_lastname="Perez", maternal_lastname="Lopez")
+        rosa = Therapist.objects.create(name="Rosa", paternal_lastname="Quispe", maternal_lastname="Mamani")
+        ana = Patient.objects.create(name="Ana", paternal_lastname="Gomez", maternal_lastname="Diaz")
+        luis = Patient.objects.create(name="Luis", paternal_lastname="Rojas", maternal_lastname="Vega")
+        efectivo = PaymentType.objects.create(name="EFECTIVO")
+        cupon = PaymentType.objects.create(name="Cupón")
+        tarjeta = PaymentType.objects.create(name="Tarjeta")
+        citas = [
+            (rosa, luis, 50, efectivo, None),
+            (juan, ana, 30, cupon, None),
+            (juan, ana, None, None, None),
+            (juan, luis, 20, tarjeta, None),
+            (rosa, luis, 40, efectivo, timezone.now()),
+            (None, ana, 10, efectivo, None),
+            (rosa, None, 15, cupon, None),
+        ]
+        for therapist, patient, payment, payment_type, deleted_at in citas:
+            Appointment.objects.create(
+                appointment_date=date(2024, 1, 15), therapist=therapist, patient=patient,
+                payment=payment, payment_type=payment_type, deleted_at=deleted_at
+            )
+        Appointment.objects.create(appointment_date=date(2024, 1, 16), therapist=juan, patient=ana, payment=99, payment_type=efectivo)
+
+    def _combinado(self):
+        request = self.factory.get('/reports/single-date/', {'date': '2024-01-15'})
+        return json.loads(get_single_date_reports(request).content)
+
+    def _individuales(self):
+        params = {'date': '2024-01-15'}
+        return {
+            'appointments_per_therapist': json.loads(get_number_appointments_per_therapist(self.factory.get('/', params)).content),
+            'patients_by_therapist': json.loads(get_patients_by_therapist(self.factory.get('/', params)).content),
+            'daily_cash': json.loads(get_daily_cash(self.factory.get('/', params)).content),
+        }
+
+    def test_mismos_datos_que_los_endpoints_individuales(self):
+        """
+        Valida que cada sección coincide con su endpoint y que se usan dos consultas
+        (cierre de caja y citas del día).
+        """
+        with self.assertNumQueries(2):
+            ReportService().get_single_date_reports(self.factory.get('/reports/single-date/', {'date': '2024-01-15'}))
+        combinado = self._combinado()
+
+        individuales = self._individuales()
+        self.assertEqual(combinado['patients_by_therapist'], individuales['patients_by_therapist'])
+        self.assertEqual(combinado['daily_cash'], individuales['daily_cash'])
+        self.assertEqual(combinado['daily_cash'][0], {'payment_type': 'Cupón', 'total_payment': 45.0})
+        self.assertEqual(
+            combinado['appointments_per_therapist']['total_appointments_count'],
+            individuales['appointments_per_therapist']['total_appointments_count']
+        )
+        self.assertCountEqual(
+            combinado['appointments_per_therapist']['therapists_appointments'],
+            individuales['appointments_per_therapist']['therapists_appointments']
+        )
+        self.assertIsNone(combinado['cash_closure'])
+
+    def test_conteo_sin_citas_eliminadas(self):
+        """
+        Valida que el conteo por terapeuta no incluye la cita eliminada de Rosa.
+        """
+        conteos = {
+            t['name']: t['appointments_count']
+            for t in self._combinado()['appointments_per_therapist']['therapists_appointments']
+        }
+        self.assertEqual(conteos, {'Juan': 3, 'Rosa': 2})
+
+    def test_caja_desde_cierre(self):
+        """
+        Valida que con cierre de caja la sección de caja se lee del cierre.
+        """
+        cerrar_dia('2024-01-15')
+        Appointment.objects.filter(appointment_date=date(2024, 1, 15)).update(payment=1)
+
+        combinado = self._combinado()
+        self.assertEqual(combinado['cash_closure'], 'closed')
+        self.assertEqual(combinado['daily_cash'], self._individuales()['daily_cash'])
+        self.assertEqual(sum(item['total_payment'] for item in combinado['daily_cash']), 125.0)
+
+    def test_fecha_invalida(self):
+        """
+        Valida que una fecha inválida responde 400.
+        """
+        response = self.client.get(reverse('single_date_reports'), {'date': '15-01-2024'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ConditionalGetTest(TestCase):
+    """
+    Pruebas para el GET condicional (ETag / Last-Modified) de los endpoints JSON de reportes.
+    """
+
+    def setUp(self):
+        """
+        Crear una cita con pago para la fecha de los reportes.
+        """
+        efectivo = PaymentType.objects.create(name="EFECTIVO")
+        self.cita = Appointment.objects.create(appointment_date=date(2024, 1, 15), payment=30, payment_type=efectivo)
+        self.params = {'date': '2024-01-15'}
+
+    def test_304_sin_ejecutar_el_reporte(self):
+        """
+        Valida que con el ETag vigente se responde 304 solo con la consulta de validadores.
+        """
+        url = reverse('patients_by_therapist')
+        response = self.client.get(url, self.params)
+        self.assertEqual(response.status_code, 200)
+
+        with patch.object(ReportService, 'get_patients_by_therapist') as reporte, self.assertNumQueries(1):
+            no_modificado = self.client.get(url, self.params, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(no_modificado.status_code, 304)
+        self.assertEqual(no_modificado.content, b'')
+        reporte.assert_not_called()
+
+    def test_cambios_renuevan_etag(self):
+        """
+        Valida que editar una cita del día y cerrar la caja cambian el ETag de daily-cash.
+        """
+        url = reverse('daily_cash')
+        etag = self.client.get(url, self.params)['ETag']
+
+        self.cita.payment = 45
+        self.cita.save()
+        response = self.client.get(url, self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        cerrar_dia('2024-01-15')
+        self.assertEqual(self.client.get(url, self.params, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_reasignar_cita_renueva_etag(self):
+        """
+        Valida que mover la cita a otro terapeuta o a otro tipo de pago con el mismo
+        monto responde 200 aunque el cliente envíe el ETag anterior.
+        """
+        juan = Therapist.objects.create(name="Juan")
+        rosa = Therapist.objects.create(name="Rosa")
+        self.cita.therapist = juan
+        self.cita.patient = Patient.objects.create(name="Ana")
+        self.cita.save()
+
+        url = reverse('patients_by_therapist')
+        etag = self.client.get(url, self.params)['ETag']
+        self.cita.therapist = rosa
+        self.cita.save()
+        response = self.client.get(url, self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)[0]['therapist_id'], rosa.id)
+
+        url = reverse('daily_cash')
+        etag = self.client.get(url, self.params)['ETag']
+        self.cita.payment_type = PaymentType.objects.create(name="Yape")
+        self.cita.save()
+        self.assertEqual(self.client.get(url, self.params, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_last_modified(self):
+        """
+        Valida Last-Modified desde las fechas de las citas e If-Modified-Since en rangos.
+        """
+        Appointment.objects.filter(pk=self.cita.pk).update(updated_at=timezone.make_aware(datetime(2024, 1, 15, 12, 30)))
+        url = reverse('appointments_between_dates')
+        params = {'start_date': '2024-01-01', 'end_date': '2024-01-31'}
+
+        response = self.client.get(url, params)
+        self.assertIn('Last-Modified', response)
+        no_modificado = self.client.get(url, params, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(no_modificado.status_code, 304)
+
+    def test_parametros_invalidos_sin_validadores(self):
+        """
+        Valida que con parámetros inválidos se responde el error de la vista, sin ETag.
+        """
+        response = self.client.get(reverse('daily_cash'), {'date': '2024-99-01'})
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn('ETag', response)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Los planes se leen con EXPLAIN QUERY PLAN de SQLite')
+class IndicesConsultasTest(TestCase):
+    """
+    Pruebas de los planes de consulta de ReportService sobre los índices de Appointment.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Crear citas sintéticas para dos meses.
+        """
+        benchmark.generar_citas(500, dias=60)
+
+    def test_consultas_usan_indices(self):
+        """
+        Verifica que ninguna consulta de ReportService recorre la tabla de citas completa.
+        """
+        service = ReportService()
+        dia = request_con_parametros({'date': '2024-01-15'})
+        rango = request_con_parametros({'start_date': '2024-01-10', 'end_date': '2024-01-20'})
+        casos = {
+            'get_appointments_count_by_therapist': lambda: service.get_appointments_count_by_therapist(dia),
+            'get_appointments_matrix_by_therapist': lambda: service.get_appointments_matrix_by_therapist(rango),
+            'get_patients_by_therapist': lambda: service.get_patients_by_therapist(dia),
+            'get_single_date_reports': lambda: service.get_single_date_reports(dia),
+            'get_daily_cash': lambda: service.get_daily_cash(dia),
+            'get_daily_cash_between_dates': lambda: service.get_daily_cash_between_dates(rango),
+            'get_appointments_between_dates': lambda: service.get_appointments_between_dates(rango),
+            'get_appointments_page': lambda: service.get_appointments_page('2024-01-10', '2024-01-20', 50, None),
+            'contar_appointments_between_dates': lambda: service.contar_appointments_between_dates('2024-01-10', '2024-01-20'),
+            'validadores': lambda: validadores(date(2024, 1, 10), date(2024, 1, 20), caja=True),
+        }
+        tabla = Appointment._meta.db_table
+        for nombre, funcion in casos.items():
+            with self.subTest(nombre):
+                planes = benchmark.planes_consultas(funcion)
+                for sql, pasos in planes:
+                    if tabla not in sql:
+                        continue
+                    self.assertEqual(benchmark.recorridos_completos(pasos), [], f"{sql}\n{pasos}")
+                    self.assertTrue(any(paso.startswith(f"SEARCH {tabla} USING") for paso in pasos), pasos)
+
+    def test_listado_usa_indice_parcial(self):
+        """
+        Verifica que el listado por rango lee las citas activas desde el índice parcial
+        por fecha y hora, sin ordenar en una tabla temporal.
+        """
+        planes = benchmark.planes_consultas(
+            lambda: ReportService().get_appointments_page('2024-01-10', '2024-01-20', 50, None)
+        )
+        pasos = [paso for _, pasos_sql in planes for paso in pasos_sql]
+        self.assertTrue(any('USING INDEX appt_activa_fecha_hora_idx' in paso for paso in pasos), pasos)
+        self.assertFalse(any('TEMP B-TREE' in paso for paso in pasos), pasos)
@@ -12,6 +12,13 @@ urlpatterns = [
         name='appointments_per_therapist'
     ),
 
+    # Ruta para obtener la matriz terapeuta x fecha de citas en un rango de fechas
+    path(
+        'appointments-per-therapist/matrix/',
+        views.get_appointments_matrix_per_therapist,
+        name='appointments_per_therapist_matrix'
+    ),
+
     # Ruta para obtener el listado de pacientes agrupados por terapeuta en una fecha dada
     path(
         'patients-by-therapist/',
@@ -26,6 +33,14 @@ urlpatterns = [
         name='daily_cash'
     ),
 
+    # Reportes de una fecha (citas y pacientes por terapeuta, caja diaria) en una sola respuesta
+    path('single-date/', views.get_single_date_reports, name='single_date_reports'),
+
+    # Resumen de caja por rango de fechas (lee los cierres de caja de los días cerrados)
+    path('daily-cash/range/', views.get_daily_cash_between_dates, name='daily_cash_range'),
+    # Cierre de caja de una fecha: congela sus totales por tipo de pago
+    path('daily-cash/close/', views.cerrar_caja, name='cerrar_caja'),
+
     # Ruta para obtener citas entre dos fechas dadas (inclusive)
     path(
         'appointments-between-dates/', 
@@ -36,6 +51,14 @@ urlpatterns = [
     path('pdf/citas-terapeuta/', views.pdf_citas_terapeuta, name='pdf_citas_terapeuta'),
     path('pdf/pacientes-terapeuta/', views.pdf_pacientes_terapeuta, name='pdf_pacientes_terapeuta'),
     path('pdf/resumen-caja/', views.pdf_resumen_caja, name='pdf_resumen_caja'),
+    # Reportes PDF de varios días en un ZIP o en un único PDF
+    path('pdf/paquete/', views.pdf_paquete, name='pdf_paquete'),
     path('excel/citas-rango/', views.exportar_excel_citas, name='exportar_excel_citas'),
+    # Exportación del rango de citas en xlsx, csv, ndjson (gzip) o parquet
+    path('export/citas-rango/', views.exportar_citas, name='exportar_citas'),
+    # Exportaciones en segundo plano: registro, estado/progreso y descarga
+    path('jobs/', views.crear_export_job, name='crear_export_job'),
+    path('jobs/<int:job_id>/', views.estado_export_job, name='estado_export_job'),
+    path('jobs/<int:job_id>/download/', views.descargar_export_job, name='descargar_export_job'),
     path('statistics/', include('app_statistics.urls')),
 ]
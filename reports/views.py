@@ -1,13 +1,39 @@
-from django.http import JsonResponse, HttpResponse
-from .services.report_service import ReportService
-from django.shortcuts import render
-from django_xhtml2pdf.utils import pdf_decorator
-import xlsxwriter
 import io
+import os
 from datetime import datetime
+from functools import wraps
+from django.conf import settings
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse, FileResponse, Http404
+from django.urls import reverse
+from django.utils.timezone import localtime
+from django.views.decorators.http import require_POST
+from django.views.decorators.csrf import ensure_csrf_cookie
+from .models import ExportJob
+from .services.report_service import ReportService, MAX_PAGE_SIZE, decodificar_cursor
+from .services.export_service import (
+    FORMATOS_EXPORTACION, formato_solicitado, csv_citas, ndjson_gzip_citas,
+    excel_citas_temporal, parquet_citas_temporal,
+)
+from .services.export_jobs import crear_job, estado_job
+from .services.pdf_service import (
+    REPORTES_PDF, MOTORES_PDF, motor_pdf, renderizar_pdf,
+    contexto_citas_terapeuta, contexto_pacientes_terapeuta, contexto_resumen_caja,
+)
+from .services.pdf_cache import PDFCache
+from .services.pdf_bundle import FORMATOS_PAQUETE, MAX_DIAS_PAQUETE, generar_paquete
+from .services.cash_closure import CAJA_YA_CERRADA, cerrar_dia, cierre_json
+from .services.conditional import condicional, fecha_unica, fecha_obligatoria, rango_fechas
+from django.core.exceptions import ImproperlyConfigured
+from django.shortcuts import render, get_object_or_404
+from django_xhtml2pdf.utils import pdf_decorator
+import json
 
 report_service = ReportService()
 
+# Bytes enviados por parte al descargar un archivo exportado
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+@condicional(fecha_unica)
 def get_number_appointments_per_therapist(request):
     """
     Devuelve JSON con el número de citas por terapeuta para una fecha dada.
@@ -17,6 +43,28 @@ def get_number_appointments_per_therapist(request):
         return JsonResponse(data, status=400)
     return JsonResponse(data, safe=False)
 
+@condicional(rango_fechas('start_date', 'end_date'))
+def get_appointments_matrix_per_therapist(request):
+    """
+    Devuelve JSON con la matriz terapeuta x fecha de citas entre start_date y end_date.
+    """
+    data = report_service.get_appointments_matrix_by_therapist(request)
+    if isinstance(data, dict) and "error" in data:
+        return JsonResponse(data, status=400)
+    return JsonResponse(data, safe=False)
+
+@condicional(fecha_unica, caja=True)
+def get_single_date_reports(request):
+    """
+    Devuelve JSON con los reportes de una fecha (citas por terapeuta, pacientes por
+    terapeuta y resumen de caja) en una sola respuesta, para el dashboard.
+    """
+    data = report_service.get_single_date_reports(request)
+    if isinstance(data, dict) and "error" in data:
+        return JsonResponse(data, status=400)
+    return JsonResponse(data)
+
+@condicional(fecha_obligatoria)
 def get_patients_by_therapist(request):
     """
     Devuelve JSON con los pacientes agrupados por terapeuta para una fecha dada.
@@ -26,118 +74,320 @@ def get_patients_by_therapist(request):
         return JsonResponse(data, status=400)
     return JsonResponse(data, safe=False)
 
+@condicional(fecha_unica, caja=True)
 def get_daily_cash(request):
     """
     Devuelve JSON con el resumen diario de efectivo agrupado por tipo de pago.
+    Si el día tiene cierre de caja, la cabecera X-Cash-Closure indica si está
+    cerrado (closed) o si las citas cambiaron después del cierre (modified).
     """
-    data = report_service.get_daily_cash(request)
+    data, cierre = report_service.get_daily_cash_con_cierre(request)
     if isinstance(data, dict) and "error" in data:
         return JsonResponse(data, status=400)
-    return JsonResponse(data, safe=False)
+    response = JsonResponse(data, safe=False)
+    if cierre is not None:
+        response['X-Cash-Closure'] = 'modified' if cierre.modificado else 'closed'
+    return response
+
+@condicional(rango_fechas('start_date', 'end_date'), caja=True)
+def get_daily_cash_between_dates(request):
+    """
+    Devuelve JSON con el resumen de caja de cada día entre start_date y end_date
+    y los totales del rango por tipo de pago.
+    """
+    data = report_service.get_daily_cash_between_dates(request)
+    if isinstance(data, dict) and "error" in data:
+        return JsonResponse(data, status=400)
+    return JsonResponse(data)
+
+@require_POST
+def cerrar_caja(request):
+    """
+    Cierra la caja de una fecha (parámetro date, JSON o formulario; por defecto hoy):
+    congela sus totales por tipo de pago. Responde 201 con el cierre, o 409 si ya
+    estaba cerrada.
+    """
+    if request.content_type == "application/json":
+        try:
+            parametros = json.loads(request.body or b"{}")
+        except ValueError:
+            return JsonResponse({"error": "JSON inválido."}, status=400)
+        if not isinstance(parametros, dict):
+            return JsonResponse({"error": "JSON inválido."}, status=400)
+    else:
+        parametros = request.POST.dict()
+
+    cierre, error = cerrar_dia(parametros.get("date") or localtime().date())
+    if error:
+        return JsonResponse({"error": error}, status=409 if error == CAJA_YA_CERRADA else 400)
+    return JsonResponse(cierre_json(cierre), status=201)
 
+def json_array_stream(filas):
+    """Genera un arreglo JSON por partes, un elemento a la vez."""
+    yield "["
+    for i, fila in enumerate(filas):
+        yield ("," if i else "") + json.dumps(fila)
+    yield "]"
+
+@condicional(rango_fechas('start_date', 'end_date'))
 def get_appointments_between_dates(request):
     """
     Devuelve JSON con todas las citas entre dos fechas con info de paciente y terapeuta.
+    Con stream=true la respuesta se envía por partes mientras se leen las citas.
+    Con limit (y cursor) la respuesta se pagina: {"results": [...], "next": cursor}.
     """
+    if "limit" in request.GET or "cursor" in request.GET:
+        return get_appointments_page(request)
+
+    if request.GET.get("stream", "").lower() in ("true", "1"):
+        start_date, end_date, error = report_service.validar_rango_citas(request)
+        if error:
+            return JsonResponse({"error": error}, status=400)
+        filas = report_service.iter_appointments_between_dates(start_date, end_date)
+        return StreamingHttpResponse(json_array_stream(filas), content_type="application/json")
+
     data = report_service.get_appointments_between_dates(request)
     if isinstance(data, dict) and "error" in data:
         return JsonResponse(data, status=400)
     return JsonResponse(data, safe=False)
 
+def get_appointments_page(request):
+    """
+    Página de citas entre dos fechas. Parámetros: start_date, end_date,
+    limit (1 a MAX_PAGE_SIZE, por defecto 100) y cursor opcional devuelto
+    como 'next' por la página anterior.
+    """
+    start_date, end_date, error = report_service.validar_rango_citas(request)
+    if error:
+        return JsonResponse({"error": error}, status=400)
+
+    try:
+        limit = int(request.GET.get("limit", 100))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return JsonResponse({"error": f"limit debe ser un entero entre 1 y {MAX_PAGE_SIZE}."}, status=400)
+
+    cursor = request.GET.get("cursor")
+    try:
+        cursor = decodificar_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    return JsonResponse(report_service.get_appointments_page(start_date, end_date, limit, cursor))
+
+@ensure_csrf_cookie
 def reports_dashboard(request):
     return render(request, 'reports.html')
 
 
+def _respuesta_pdf(tipo, contenido):
+    response = HttpResponse(contenido, content_type='application/pdf')
+    response['Content-Disposition'] = 'attachment; filename=%s' % REPORTES_PDF[tipo]['pdfname']
+    return response
+
+def pdf_reporte(tipo):
+    """
+    Envuelve una vista PDF basada en plantilla (xhtml2pdf):
+    - Motor de render: parámetro engine (xhtml2pdf o reportlab) o REPORTS_PDF_ENGINES.
+      Con reportlab el PDF se construye directamente, sin la plantilla HTML.
+    - Caché: sirve el PDF desde PDFCache si las citas de la fecha no cambiaron
+      desde que se renderizó; si no, lo renderiza y lo guarda.
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def _vista(request, *args, **kwargs):
+            motor = motor_pdf(tipo, request.GET.get('engine'))
+            if motor is None:
+                return JsonResponse({"error": f"engine inválido. Opciones: {', '.join(MOTORES_PDF)}."}, status=400)
+
+            if motor == 'reportlab':
+                renderizar = lambda: _respuesta_pdf(tipo, renderizar_pdf(tipo, request, io.BytesIO(), motor).getvalue())
+            else:
+                renderizar = lambda: vista(request, *args, **kwargs)
+
+            fecha = request.GET.get('date') or datetime.today().strftime('%Y-%m-%d')
+            try:
+                datetime.strptime(fecha, '%Y-%m-%d')
+            except ValueError:
+                return renderizar()
+            if not PDFCache.habilitado():
+                return renderizar()
+
+            clave = PDFCache.clave(tipo, motor)
+            huella = PDFCache.huella(fecha, tipo)
+            contenido = PDFCache.obtener(clave, fecha, huella)
+            if contenido is not None:
+                return _respuesta_pdf(tipo, contenido)
+
+            response = renderizar()
+            if response.status_code == 200:
+                PDFCache.guardar(clave, fecha, huella, response.content)
+            return response
+        return _vista
+    return decorador
+
+@pdf_reporte('citas_terapeuta')
 @pdf_decorator(pdfname='citas_terapeuta.pdf')
 def pdf_citas_terapeuta(request):
-    date = request.GET.get('date', datetime.today().strftime('%Y-%m-%d'))
-    data = report_service.get_appointments_count_by_therapist(request)
-    
-    # Calcular porcentajes si no vienen en los datos
-    if 'therapists_appointments' in data:
-        total = data.get('total_appointments_count', 1)  # Evitar división por cero
-        for therapist in data['therapists_appointments']:
-            therapist['percentage'] = (therapist['appointments_count'] / total) * 100 if total > 0 else 0
-    
-    context = {
-        'date': date,
-        'data': data,
-        'title': 'Citas por Terapeuta'
-    }
+    context = contexto_citas_terapeuta(request)
     return render(request, 'pdf_templates/citas_terapeuta.html', context)
 
+@pdf_reporte('pacientes_terapeuta')
 @pdf_decorator(pdfname='pacientes_por_terapeuta.pdf')
 def pdf_pacientes_terapeuta(request):
-    date = request.GET.get('date', datetime.today().strftime('%Y-%m-%d'))
-    data = report_service.get_patients_by_therapist(request)
-    context = {
-        'date': date,
-        'data': data,
-        'title': 'Pacientes por Terapeuta'
-    }
+    context = contexto_pacientes_terapeuta(request)
     return render(request, 'pdf_templates/pacientes_terapeuta.html', context)
 
+@pdf_reporte('resumen_caja')
 @pdf_decorator(pdfname='resumen_caja.pdf')
 def pdf_resumen_caja(request):
-    date = request.GET.get('date', datetime.today().strftime('%Y-%m-%d'))
-    data = report_service.get_daily_cash(request)
-    
-    # Calcular el total aquí en la vista
-    total = sum(item['total_payment'] for item in data) if data else 0
-    
-    context = {
-        'date': date,
-        'data': data,
-        'total': total,  # Pasamos el total calculado
-        'title': 'Resumen de Caja Diaria'
-    }
+    context = contexto_resumen_caja(request)
     return render(request, 'pdf_templates/resumen_caja.html', context)
 
-def exportar_excel_citas(request):
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
-    data = report_service.get_appointments_between_dates(request)
-    
-    output = io.BytesIO()
-    workbook = xlsxwriter.Workbook(output)
-    worksheet = workbook.add_worksheet('Citas')
-    
-    # Formato para encabezados
-    header_format = workbook.add_format({
-        'bold': True,
-        'bg_color': '#2c3e50',
-        'font_color': 'white',
-        'border': 1
-    })
-    
-    # Escribir encabezados
-    headers = ['Fecha', 'Hora', 'Terapeuta', 'Paciente', 'Pago', 'Tipo de Pago']
-    for col, header in enumerate(headers):
-        worksheet.write(0, col, header, header_format)
-    
-    # Escribir datos
-    for row, appointment in enumerate(data, start=1):
-        worksheet.write(row, 0, appointment.get('appointment_date', ''))
-        worksheet.write(row, 1, appointment.get('appointment_hour', ''))
-        worksheet.write(row, 2, appointment.get('therapist', ''))
-        worksheet.write(row, 3, appointment.get('patient', ''))
-        worksheet.write(row, 4, float(appointment.get('payment', 0)))
-        worksheet.write(row, 5, appointment.get('payment_type', ''))
-    
-    # Ajustar anchos de columna
-    worksheet.set_column('A:A', 15)
-    worksheet.set_column('B:B', 10)
-    worksheet.set_column('C:D', 30)
-    worksheet.set_column('E:E', 12)
-    worksheet.set_column('F:F', 15)
-    
-    workbook.close()
-    output.seek(0)
-    
-    filename = f'citas_{start_date}_a_{end_date}.xlsx'
-    response = HttpResponse(
-        output,
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+def pdf_paquete(request):
+    """
+    Reportes PDF de cada día entre start_date y end_date en un solo archivo.
+    Parámetros: reports (lista separada por comas, ej. resumen_caja,pacientes_terapeuta),
+    output (zip por defecto, o pdf para unirlos en un documento) y engine opcional.
+    Los PDF de cada día se renderizan en paralelo en un pool de procesos.
+    """
+    start_date, end_date, error = report_service.validar_rango_citas(request)
+    if error:
+        return JsonResponse({"error": error}, status=400)
+    start = datetime.strptime(start_date, '%Y-%m-%d').date()
+    end = datetime.strptime(end_date, '%Y-%m-%d').date()
+    if start > end:
+        return JsonResponse({"error": "La fecha de inicio no puede ser mayor que la fecha de fin."}, status=400)
+    if (end - start).days + 1 > MAX_DIAS_PAQUETE:
+        return JsonResponse({"error": f"El rango no puede superar {MAX_DIAS_PAQUETE} días."}, status=400)
+
+    tipos = [t.strip() for t in request.GET.get('reports', '').split(',') if t.strip()]
+    if not tipos or any(t not in REPORTES_PDF for t in tipos):
+        return JsonResponse({"error": f"reports inválido. Opciones: {', '.join(REPORTES_PDF)}."}, status=400)
+
+    formato = request.GET.get('output', 'zip')
+    if formato not in FORMATOS_PAQUETE:
+        return JsonResponse({"error": f"output inválido. Opciones: {', '.join(FORMATOS_PAQUETE)}."}, status=400)
+
+    engine = request.GET.get('engine') or None
+    if engine and engine not in MOTORES_PDF:
+        return JsonResponse({"error": f"engine inválido. Opciones: {', '.join(MOTORES_PDF)}."}, status=400)
+
+    archivo = generar_paquete(tipos, start, end, formato, engine)
+    response = FileResponse(
+        archivo,
+        as_attachment=True,
+        filename=f'reportes_{start_date}_a_{end_date}.{formato}',
+        content_type='application/zip' if formato == 'zip' else 'application/pdf'
     )
-    response['Content-Disposition'] = f'attachment; filename={filename}'
+    response.block_size = EXPORT_CHUNK_SIZE
+    return response
+
+def exportar_excel_citas(request):
+    """
+    Exporta a Excel las citas entre start_date y end_date. Las filas se leen por
+    bloques, el libro se escribe en modo constant_memory sobre un archivo temporal
+    y la respuesta envía ese archivo por partes.
+    """
+    return _exportar_citas(request, "xlsx")
+
+def exportar_citas(request):
+    """
+    Exporta las citas entre start_date y end_date en el formato pedido por el
+    parámetro format (xlsx, csv, ndjson, parquet) o por el encabezado Accept.
+    Con async=true la exportación se ejecuta en segundo plano (ver crear_export_job).
+    CSV y NDJSON (gzip) se envían mientras se leen las citas; Excel y Parquet
+    se escriben en un archivo temporal que luego se envía por partes.
+    """
+    formato = formato_solicitado(request.GET.get("format"), request.headers.get("Accept"))
+    if formato is None:
+        return JsonResponse(
+            {"error": f"Formato no soportado. Opciones: {', '.join(FORMATOS_EXPORTACION)}."},
+            status=400
+        )
+    if request.GET.get("async", "").lower() in ("true", "1"):
+        # Se registra la exportación y se responde de inmediato con su estado
+        return _respuesta_job(*crear_job(f"citas_{formato}", request.GET.dict()))
+    return _exportar_citas(request, formato)
+
+def _exportar_citas(request, formato):
+    start_date, end_date, error = report_service.validar_rango_citas(request)
+    if error:
+        return JsonResponse({"error": error}, status=400)
+
+    content_type, extension = FORMATOS_EXPORTACION[formato]
+    filename = f'citas_{start_date}_a_{end_date}.{extension}'
+    filas = report_service.iter_appointments_between_dates(start_date, end_date)
+
+    if formato == "csv":
+        response = StreamingHttpResponse(csv_citas(filas), content_type=content_type)
+    elif formato == "ndjson":
+        response = StreamingHttpResponse(ndjson_gzip_citas(filas), content_type=content_type)
+    else:
+        try:
+            archivo = parquet_citas_temporal(filas) if formato == "parquet" else excel_citas_temporal(filas)
+        except ImproperlyConfigured as e:
+            return JsonResponse({"error": str(e)}, status=503)
+        response = FileResponse(archivo, content_type=content_type)
+        response.block_size = EXPORT_CHUNK_SIZE
+
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Vary'] = 'Accept'
+    return response
+
+def _respuesta_job(job, error):
+    if error:
+        return JsonResponse({"error": error}, status=400)
+    data = estado_job(job)
+    data["status_url"] = reverse('estado_export_job', args=[job.id])
+    return JsonResponse(data, status=202)
+
+@require_POST
+def crear_export_job(request):
+    """
+    Registra una exportación en segundo plano y responde 202 sin esperar el archivo.
+    Parámetros (JSON o formulario): tipo (citas_xlsx, citas_csv, citas_ndjson,
+    citas_parquet, pdf_citas_terapeuta, pdf_pacientes_terapeuta, pdf_resumen_caja)
+    y los del reporte (start_date y end_date, o date). El comando export_worker
+    ejecuta los trabajos pendientes.
+    """
+    if request.content_type == "application/json":
+        try:
+            parametros = json.loads(request.body or b"{}")
+        except ValueError:
+            return JsonResponse({"error": "JSON inválido."}, status=400)
+        if not isinstance(parametros, dict):
+            return JsonResponse({"error": "JSON inválido."}, status=400)
+    else:
+        parametros = request.POST.dict()
+
+    tipo = parametros.pop("tipo", None)
+    return _respuesta_job(*crear_job(tipo, parametros))
+
+def estado_export_job(request, job_id):
+    """
+    Devuelve el estado y el progreso (0 a 100) de una exportación.
+    Cuando está completada incluye download_url.
+    """
+    job = get_object_or_404(ExportJob, id=job_id)
+    data = estado_job(job)
+    if job.estado == ExportJob.COMPLETADO:
+        data["download_url"] = reverse('descargar_export_job', args=[job.id])
+    return JsonResponse(data)
+
+def descargar_export_job(request, job_id):
+    """
+    Descarga el archivo generado por una exportación completada.
+    """
+    job = get_object_or_404(ExportJob, id=job_id)
+    if job.estado != ExportJob.COMPLETADO:
+        return JsonResponse({"error": "La exportación no ha terminado.", "estado": job.estado}, status=409)
+
+    ruta = os.path.join(settings.MEDIA_ROOT, job.archivo)
+    if not os.path.exists(ruta):
+        raise Http404("El archivo de la exportación ya no existe.")
+
+    response = FileResponse(open(ruta, "rb"), as_attachment=True, filename=os.path.basename(ruta).split("_", 1)[1])
+    response.block_size = EXPORT_CHUNK_SIZE
     return response